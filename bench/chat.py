@@ -0,0 +1,111 @@
+"""
+/chat 端到端负载测试：在合成图、StubPredictor 和 FakeOpenAI 上导入完整的 Flask 应用（app.py），
+分别用 --clients 中的每个并发数发送请求，报告端到端延迟、吞吐量，以及 tracing 记录的各阶段 p50/p99。
+
+导入 app 之前把 KG.GraphDatabase、predict_glucose.get_predictor 和 openai.OpenAI 换成替身，
+应用的其余部分（推荐缓存、烹饪说明缓存、线程池等）按环境变量照常配置；
+默认关闭烹饪说明缓存（--llm-cache off），使每个食谱请求都经过一次 DeepSeek 往返。
+用法：python bench/chat.py [--recipes 10000] [--clients 1 8 32] [--requests 20] [--llm-ms 500]
+                          [--llm-cache off] [--questions 0.2]
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report
+from fakes import FakeDriver, FakeGraphDatabase, FakeOpenAI, StubPredictor, SyntheticGraph
+
+MEAL_MESSAGES = ["推荐一份早餐食谱", "推荐一份午餐食谱", "晚餐吃什么"]
+QUESTION_MESSAGES = ["糖尿病患者可以吃西瓜吗？", "餐后多久测血糖比较好？"]
+
+
+def load_app(args, llm):
+    """换上替身后导入 app.py，返回 app 模块"""
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    os.environ["LLM_CACHE"] = args.llm_cache
+
+    import KG
+    import openai
+    import predict_glucose
+
+    graph = SyntheticGraph(n_recipes=args.recipes, n_ingredients=max(500, args.recipes // 10))
+    KG.GraphDatabase = FakeGraphDatabase(FakeDriver(graph, latency=args.neo4j_ms / 1000))
+    predict_glucose.get_predictor = lambda: StubPredictor(latency=args.predict_ms / 1000)
+    openai.OpenAI = lambda **kwargs: llm
+
+    import app
+    return app
+
+
+def random_request(rng, question_share):
+    """一个确定的随机请求：食谱推荐或普通问题，用户餐前血糖随机"""
+    glucose = round(rng.uniform(4.5, 10.0), 1)
+    user_data = {
+        "height": 170, "weight": 70, "age": 45, "gender": "male",
+        "pre_meal_glucose": glucose, "pre_meal_insulin": 0, "activity_level": "moderately_active",
+        "nutrient_needs": {
+            "breakfast": {"carb": 68, "protein": 27, "fat": 18},
+            "lunch": {"carb": 90, "protein": 36, "fat": 24},
+            "dinner": {"carb": 68, "protein": 27, "fat": 18},
+        },
+    }
+    messages = QUESTION_MESSAGES if rng.random() < question_share else MEAL_MESSAGES
+    return {"message": rng.choice(messages), "user_data": user_data}
+
+
+def run_clients(app_module, clients, requests_per_client, question_share):
+    """clients 个线程各发送 requests_per_client 个请求，返回 (每个请求的耗时, 失败数, 总耗时)"""
+    def client(index):
+        rng = random.Random(index)
+        test_client = app_module.app.test_client()
+        samples, failures = [], 0
+        for _ in range(requests_per_client):
+            payload = random_request(rng, question_share)
+            start = time.perf_counter()
+            response = test_client.post("/chat", json=payload)
+            samples.append(time.perf_counter() - start)
+            failures += response.status_code != 200
+        return samples, failures
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    samples = [sample for client_samples, _ in results for sample in client_samples]
+    return samples, sum(failures for _, failures in results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=20, help="每个客户端的请求数")
+    parser.add_argument("--questions", type=float, default=0.2, help="普通问题所占比例")
+    parser.add_argument("--llm-ms", type=float, default=500.0)
+    parser.add_argument("--llm-token-ms", type=float, default=0.0)
+    parser.add_argument("--neo4j-ms", type=float, default=0.2)
+    parser.add_argument("--predict-ms", type=float, default=1.0)
+    parser.add_argument("--llm-cache", default="off", choices=["off", "memory"])
+    args = parser.parse_args()
+
+    llm = FakeOpenAI(latency=args.llm_ms / 1000, token_latency=args.llm_token_ms / 1000)
+    app_module = load_app(args, llm)
+    tracer = app_module.tracer
+
+    for clients in args.clients:
+        tracer.reset()
+        calls_before = llm.calls
+        samples, failures, elapsed = run_clients(app_module, clients, args.requests, args.questions)
+        report(f"/chat clients={clients}", samples)
+        print(f"{'':<40} throughput={len(samples) / elapsed:8.1f} req/s  failures={failures}  "
+              f"llm_calls={llm.calls - calls_before}")
+        for stage, stats in tracer.stage_summary().items():
+            print(f"    {stage:<20} n={stats['count']:<6} p50={stats['p50'] * 1e3:9.3f}ms  "
+                  f"p99={stats['p99'] * 1e3:9.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
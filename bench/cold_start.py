@@ -0,0 +1,62 @@
+"""
+血糖预测器冷启动基准：在全新子进程中分别测量 NumPy 推理与 Keras 推理从导入到首次预测的耗时和峰值 RSS。
+
+用法：python bench/cold_start.py [--runs 3]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from common import SRC_DIR
+
+# 子进程内执行的代码：导入、加载、预测一次，输出耗时和峰值 RSS
+_NUMPY_SNIPPET = """
+import time, resource
+start = time.perf_counter()
+from predict_glucose import GlucosePredictor
+GlucosePredictor.from_env().predict([50, 10, 5, 6.0])
+"""
+
+_KERAS_SNIPPET = """
+import time, resource, os
+start = time.perf_counter()
+import joblib
+from tensorflow.keras.models import load_model
+from predict_glucose import DEFAULT_MODEL_DIR
+model_dir = os.getenv("GLUCOSE_MODEL_DIR", DEFAULT_MODEL_DIR)
+model = load_model(os.path.join(model_dir, "glucose_model_P1.h5"))
+scaler_X = joblib.load(os.path.join(model_dir, "scaler_X.pkl"))
+scaler_y = joblib.load(os.path.join(model_dir, "scaler_y.pkl"))
+scaler_y.inverse_transform(model.predict(scaler_X.transform([[50, 10, 5, 6.0]]), verbose=0))
+"""
+
+_REPORT = """
+import json
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run(snippet):
+    output = subprocess.run(
+        [sys.executable, "-c", snippet + _REPORT],
+        cwd=SRC_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, snippet in [("numpy (serving)", _NUMPY_SNIPPET), ("keras (before)", _KERAS_SNIPPET)]:
+        results = [run(snippet) for _ in range(args.runs)]
+        seconds = min(r["seconds"] for r in results)
+        rss = max(r["max_rss_mb"] for r in results)
+        print(f"{label:<20} best cold start={seconds:7.3f}s  peak RSS={rss:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
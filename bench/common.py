@@ -0,0 +1,42 @@
+"""
+基准测试脚本的公共工具。
+
+从仓库根目录运行，例如 ``python bench/predict_latency.py``；导入本模块会把
+``src/`` 加入 sys.path，使脚本能像应用本身一样导入 KG、predict_glucose 等模块。
+"""
+import os
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def time_calls(fn, repeat, warmup=1):
+    """调用 fn 共 warmup + repeat 次，返回后 repeat 次每次调用的耗时（秒）"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, q):
+    """最近秩法计算百分位数，q 取 0-100"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(label, samples):
+    """打印一组耗时样本的摘要（毫秒）"""
+    mean = sum(samples) / len(samples)
+    print(
+        f"{label:<40} n={len(samples):<6} "
+        f"mean={mean * 1e3:9.3f}ms  p50={percentile(samples, 50) * 1e3:9.3f}ms  "
+        f"p99={percentile(samples, 99) * 1e3:9.3f}ms"
+    )
@@ -0,0 +1,286 @@
+"""
+基准测试用的内存替身：合成的食谱/食材图，以及实现 KnowledgeGraph 所用
+``driver.session().run(...).data()`` 接口的假 Neo4j driver，固定输出的血糖
+预测器，和实现 ``client.chat.completions.create(...)`` 的假 OpenAI 客户端。
+
+假 driver 按查询语句中的特征片段分派到对应的 Python 实现，每次 run 可以
+模拟固定的网络往返延迟，用来衡量往返次数而不是 Cypher 执行速度。
+"""
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+RECIPE_TYPES = ("Staple", "Dish")
+INGREDIENT_TYPES = ("Protein-rich", "Vegetable", "Grain", "Seasoning")
+
+
+class SyntheticGraph:
+    """
+    随机生成的食谱图。
+
+    recipes: {食谱名: {"name", "type", "preference_score"}}
+    ingredients: {食材名: {"name", "type", "carb", "protein", "fat", "fiber", "preference_score"}}
+    contains: {食谱名: [(食材名, 重量), ...]}
+    """
+
+    def __init__(self, n_recipes=1000, n_ingredients=500, ingredients_per_recipe=5, seed=0):
+        rng = random.Random(seed)
+        self.ingredients = {}
+        for i in range(n_ingredients):
+            name = f"食材{i}"
+            self.ingredients[name] = {
+                "name": name,
+                "type": rng.choice(INGREDIENT_TYPES),
+                "carb": round(rng.uniform(0, 80), 1),
+                "protein": round(rng.uniform(0, 30), 1),
+                "fat": round(rng.uniform(0, 20), 1),
+                "fiber": round(rng.uniform(0, 10), 1),
+                "preference_score": round(rng.uniform(0, 10), 2),
+            }
+
+        ingredient_names = list(self.ingredients)
+        self.recipes = {}
+        self.contains = {}
+        for i in range(n_recipes):
+            name = f"食谱{i}"
+            self.recipes[name] = {
+                "name": name,
+                "type": "Staple" if rng.random() < 0.3 else "Dish",
+                "preference_score": round(rng.uniform(0, 10), 2),
+            }
+            self.contains[name] = [
+                (ingredient, rng.randint(20, 200))
+                for ingredient in rng.sample(ingredient_names, ingredients_per_recipe)
+            ]
+
+
+class FakeResult:
+    """模拟 neo4j.Result：支持 data()、single() 和逐条迭代"""
+
+    def __init__(self, records):
+        self._records = records
+
+    def data(self):
+        return list(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def __iter__(self):
+        return iter(self._records)
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver._run(query, {**(parameters or {}), **kwargs})
+
+
+class FakeSession(FakeTransaction):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def execute_read(self, fn, *args, **kwargs):
+        return fn(FakeTransaction(self._driver), *args, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(FakeTransaction(self._driver), *args, **kwargs)
+
+
+class FakeDriver:
+    """
+    内存图上的假 driver。
+
+    latency: 每次 run 模拟的往返延迟（秒）
+    round_trips: 累计 run 次数
+    """
+
+    def __init__(self, graph: SyntheticGraph, latency=0.0):
+        self.graph = graph
+        self.latency = latency
+        self.round_trips = 0
+        # (查询特征片段, 处理函数)，按顺序匹配第一个命中的片段
+        self._handlers = [
+            ("collect(i.type) AS ingredient_types", self._recipes_with_ingredient_types),
+            ("RETURN r.name AS recipe, i.name AS name", self._all_recipe_ingredients),
+            ("RETURN i.type AS type", self._ingredient_types),
+            ("RETURN r.name AS name, r.type AS type", self._all_recipes),
+            ("UNWIND range(0, size($ratings) - 1)", self._update_prefs_batch),
+            ("SET i.preference_score = (i.preference_score + $rating) / 2", self._update_pref),
+            ("RETURN i.name AS name, i.carb AS carb", self._recipe_ingredients),
+        ]
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+    def _run(self, query, params):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        query = " ".join(query.split())
+        for fragment, handler in self._handlers:
+            if fragment in query:
+                return FakeResult(handler(params))
+        raise NotImplementedError(f"FakeDriver 不支持的查询: {query}")
+
+    # ---- 各查询的内存实现 ----
+
+    def _ingredient_row(self, ingredient_name, weight):
+        ingredient = self.graph.ingredients[ingredient_name]
+        return {
+            "name": ingredient["name"],
+            "preference_score": ingredient["preference_score"],
+            "carb": ingredient["carb"],
+            "protein": ingredient["protein"],
+            "fat": ingredient["fat"],
+            "fiber": ingredient["fiber"],
+            "weight": weight,
+            "type": ["Ingredient"],
+        }
+
+    def _all_recipes(self, params):
+        return [
+            {"name": r["name"], "type": r["type"], "preference_score": r["preference_score"]}
+            for r in self.graph.recipes.values()
+        ]
+
+    def _recipes_with_ingredient_types(self, params):
+        return [
+            dict(row, ingredient_types=[
+                self.graph.ingredients[name]["type"] for name, _ in self.graph.contains[row["name"]]
+            ])
+            for row in self._all_recipes(params)
+        ]
+
+    def _ingredient_types(self, params):
+        return [
+            {"type": self.graph.ingredients[name]["type"]}
+            for name, _ in self.graph.contains[params["recipe_name"]]
+        ]
+
+    def _all_recipe_ingredients(self, params):
+        return [
+            dict(self._ingredient_row(name, weight), recipe=recipe)
+            for recipe, contains in self.graph.contains.items()
+            for name, weight in contains
+        ]
+
+    def _recipe_ingredients(self, params):
+        return [
+            self._ingredient_row(name, weight)
+            for name, weight in self.graph.contains.get(params["recipe_name"], [])
+        ]
+
+    def _update_pref(self, params):
+        recipe = self.graph.recipes.get(params["name"])
+        if recipe is None:
+            return []
+        rating = params["rating"]
+        scores = []
+        for name, _ in self.graph.contains[recipe["name"]]:
+            ingredient = self.graph.ingredients[name]
+            ingredient["preference_score"] = (ingredient["preference_score"] + rating) / 2
+            scores.append(ingredient["preference_score"])
+        avg_score = sum(scores) / len(scores) if scores else None
+        recipe["preference_score"] = (recipe["preference_score"] + rating + (avg_score or 0.6)) / 3
+        return [{"score": recipe["preference_score"]}]
+
+    def _update_prefs_batch(self, params):
+        rows = []
+        for seq, rating in enumerate(params["ratings"]):
+            for row in self._update_pref({"name": rating["name"], "rating": rating["rating"]}):
+                rows.append({"seq": seq, "name": rating["name"], "score": row["score"]})
+        return rows
+
+
+class StubPredictor:
+    """固定输出的血糖预测器替身，可模拟每次批量预测的耗时（秒）"""
+
+    def __init__(self, glucose=(7.5, 7.0, 6.0), latency=0.0):
+        self.glucose = list(glucose)
+        self.latency = latency
+
+    def predict(self, input_data):
+        return self.predict_batch([input_data])[0]
+
+    def predict_batch(self, rows):
+        import numpy as np
+
+        if self.latency:
+            time.sleep(self.latency)
+        return np.tile(self.glucose, (len(rows), 1)).astype(float)
+
+
+class FakeGraphDatabase:
+    """代替 neo4j.GraphDatabase，driver() 返回同一个 FakeDriver（用于替换 KG.GraphDatabase）"""
+
+    def __init__(self, driver: FakeDriver):
+        self._driver = driver
+
+    def driver(self, uri, auth=None, **config):
+        return self._driver
+
+
+class FakeOpenAI:
+    """
+    假的 OpenAI / DeepSeek 客户端，只实现 chat.completions.create。
+
+    回答由提示词确定地生成：提示词中每个"食谱：名称"各生成一段以名称为标题的说明
+    （可以按食谱切分缓存），其他问题生成固定长度的回答。
+    每次请求耗时为 latency + 回答 token 数 × token_latency（秒），流式请求在各个 token 之间等待。
+
+    calls: 累计请求次数
+    """
+
+    def __init__(self, latency=0.5, token_latency=0.0, answer_tokens=200, **kwargs):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def answer(self, messages):
+        """按提示词生成回答，返回 token（字符串片段）列表"""
+        prompt = messages[-1]["content"]
+        recipes = re.findall(r"^食谱：(.+)$", prompt, re.M)
+        tokens = []
+        for name in recipes or ["回答"]:
+            tokens += [f"## {name}\n"] + [f"步骤{i}。" for i in range(self.answer_tokens // max(len(recipes), 1))]
+            tokens.append("\n\n")
+        return tokens
+
+    def create(self, model, messages, max_tokens=None, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        tokens = self.answer(messages)
+        if max_tokens is not None:
+            tokens = tokens[:max_tokens]
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in messages),
+                                completion_tokens=len(tokens))
+        if stream:
+            return self._stream(tokens)
+
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        message = SimpleNamespace(role="assistant", content="".join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+    def _stream(self, tokens):
+        time.sleep(self.latency)
+        for token in tokens:
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
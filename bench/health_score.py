@@ -0,0 +1,46 @@
+"""
+健康评分基准：逐个计算的 calculate_health_score 与向量化的 calculate_health_score_batch。
+
+逐个计算只跑 --scalar-rows 行再按比例换算到 --rows 行。
+用法：python bench/health_score.py [--rows 1000000] [--scalar-rows 20000]
+"""
+import argparse
+import time
+
+import common  # noqa: F401  (设置 sys.path)
+
+import numpy as np
+from utils.health_score import NUTRITION_FIELDS, calculate_health_score, calculate_health_score_batch
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--scalar-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    nutrition = rng.uniform(20, 150, (args.rows, len(NUTRITION_FIELDS)))
+    glucose = rng.uniform(4.5, 20, (args.rows, 3))
+
+    start = time.perf_counter()
+    for n, g in zip(nutrition[:args.scalar_rows], glucose[:args.scalar_rows]):
+        try:
+            calculate_health_score(dict(zip(NUTRITION_FIELDS, n)), g, NUTRIENT_NEEDS)
+        except (ValueError, ZeroDivisionError):
+            pass
+    scalar = (time.perf_counter() - start) / args.scalar_rows * args.rows
+
+    start = time.perf_counter()
+    calculate_health_score_batch(nutrition, glucose, NUTRIENT_NEEDS)
+    batch = time.perf_counter() - start
+
+    print(f"rows={args.rows}")
+    print(f"scalar loop (extrapolated): {scalar:8.3f}s")
+    print(f"batch:                      {batch:8.3f}s  ({scalar / batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
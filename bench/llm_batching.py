@@ -0,0 +1,72 @@
+"""
+本地 DietAssistant 动态批处理的吞吐和延迟基准：同样数量的并发请求，分别以
+max_batch_size=1（逐个生成，相当于旧实现）和更大的批次经 BatchScheduler 生成。
+
+用法：python bench/llm_batching.py [--model sshleifer/tiny-gpt2] [--requests 32] [--batch-size 8]
+只使用 CPU；默认的微型模型只用于衡量调度开销和批处理收益，回答内容没有意义。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report
+
+sys.path.insert(0, os.path.join(common.SRC_DIR, "server"))
+
+from batching import BatchScheduler
+from chatbox import DietAssistant
+
+USER_DATA = {
+    "height": 165, "weight": 60, "age": 45, "gender": "female",
+    "pre_meal_glucose": 110, "pre_meal_insulin": 0, "activity_level": "moderately_active",
+}
+QUESTIONS = ["我早餐可以吃什么", "晚餐后血糖偏高怎么办", "糖尿病患者能吃水果吗", "运动前需要加餐吗"]
+
+
+async def run(assistant, n_requests, max_batch_size, max_wait):
+    scheduler = BatchScheduler(assistant.generate_batch, max_batch_size=max_batch_size, max_wait=max_wait)
+    scheduler.start()
+
+    async def one(i):
+        start = time.perf_counter()
+        await scheduler.submit(QUESTIONS[i % len(QUESTIONS)], USER_DATA if i % 2 else None)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    metrics = scheduler.metrics()
+    await scheduler.stop()
+    return latencies, elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    assistant = DietAssistant(model_path=args.model, max_new_tokens=args.max_new_tokens)
+    assistant.generate_response(QUESTIONS[0])  # 预热
+
+    for batch_size in (1, args.batch_size):
+        latencies, elapsed, metrics = asyncio.run(
+            run(assistant, args.requests, batch_size, args.max_wait_ms / 1000)
+        )
+        report(f"max_batch_size={batch_size} latency", latencies)
+        print(
+            f"{'':<40} throughput={args.requests / elapsed:8.2f} req/s  "
+            f"mean batch={metrics['mean_batch_size']:.2f}  batches={metrics['batches_total']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
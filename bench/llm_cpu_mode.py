@@ -0,0 +1,78 @@
+"""
+本地 DietAssistant CPU 模式基准：在全新子进程中分别以默认方式和 CPU 优化方式
+（int8 动态量化、指定线程数、inference_mode，可选 torch.compile）加载模型，
+测量加载耗时、峰值 RSS 和生成速度（tokens/s）。
+
+用法：python bench/llm_cpu_mode.py [--model sshleifer/tiny-gpt2] [--threads 4] [--compile]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import SRC_DIR
+
+# 子进程内执行的代码：加载模型，预热一次后生成若干次，输出各项指标
+_SNIPPET = """
+import json, resource, sys, time
+start = time.perf_counter()
+from chatbox import DietAssistant
+assistant = DietAssistant.from_env()
+load_seconds = time.perf_counter() - start
+
+question = "我早餐可以吃什么"
+assistant.generate_response(question)
+tokens, seconds = 0, 0.0
+for _ in range(int(sys.argv[1])):
+    t = time.perf_counter()
+    answer = assistant.generate_response(question)
+    seconds += time.perf_counter() - t
+    tokens += len(assistant.tokenizer(answer, add_special_tokens=False)["input_ids"])
+print(json.dumps({"load_seconds": load_seconds, "tokens_per_second": tokens / seconds,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run(env, repeat):
+    output = subprocess.run(
+        [sys.executable, "-c", _SNIPPET, str(repeat)],
+        cwd=os.path.join(SRC_DIR, "server"), env={**os.environ, **env},
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compile", action="store_true")
+    args = parser.parse_args()
+
+    base = {
+        "CUDA_VISIBLE_DEVICES": "",
+        "DIET_MODEL_PATH": args.model,
+        "DIET_MAX_NEW_TOKENS": str(args.max_new_tokens),
+    }
+    tuned = {
+        **base,
+        "DIET_QUANTIZE": "1",
+        "DIET_INFERENCE_MODE": "1",
+        "DIET_NUM_THREADS": str(args.threads),
+        "DIET_INTEROP_THREADS": str(args.interop_threads),
+        "DIET_COMPILE": "1" if args.compile else "0",
+    }
+    for label, env in [("default", base), ("int8 + threads (cpu mode)", tuned)]:
+        result = run(env, args.repeat)
+        print(
+            f"{label:<28} load={result['load_seconds']:7.2f}s  peak RSS={result['max_rss_mb']:8.1f}MB  "
+            f"{result['tokens_per_second']:8.1f} tokens/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
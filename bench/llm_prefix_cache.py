@@ -0,0 +1,67 @@
+"""
+提示词前缀 KV 缓存的预填充基准：对不同长度的提示词，比较完整预填充与复用
+SYSTEM_PREAMBLE 的 KV 缓存后只预填充剩余部分的耗时（一次前向计算，不含解码）。
+
+用法：python bench/llm_prefix_cache.py [--model sshleifer/tiny-gpt2] [--lengths 32,128,512] [--repeat 20]
+只使用 CPU。--preamble-repeat 把前缀重复多次，模拟更长的系统提示词。
+"""
+import argparse
+import copy
+import os
+import sys
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import common  # noqa: F401  (设置 sys.path)
+from common import percentile, time_calls
+
+sys.path.insert(0, os.path.join(common.SRC_DIR, "server"))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from chatbox import SYSTEM_PREAMBLE
+
+FILLER = "餐前血糖偏高时应减少精制主食，增加蔬菜和优质蛋白的比例。"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--lengths", default="32,128,512", help="提示词前缀之后部分的 token 数")
+    parser.add_argument("--preamble-repeat", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+
+    preamble = SYSTEM_PREAMBLE * args.preamble_repeat
+    prefix_ids = tokenizer(preamble, return_tensors="pt")["input_ids"]
+    with torch.no_grad():
+        prefix_cache = model(prefix_ids, use_cache=True).past_key_values
+    filler_ids = tokenizer(FILLER, add_special_tokens=False)["input_ids"]
+    print(f"prefix tokens: {prefix_ids.shape[1]}")
+
+    for length in (int(n) for n in args.lengths.split(",")):
+        suffix_ids = torch.tensor([(filler_ids * (length // len(filler_ids) + 1))[:length]])
+        full_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+
+        @torch.no_grad()
+        def full_prefill():
+            model(full_ids, use_cache=True)
+
+        @torch.no_grad()
+        def cached_prefill():
+            model(suffix_ids, past_key_values=copy.deepcopy(prefix_cache), use_cache=True)
+
+        full = percentile(time_calls(full_prefill, args.repeat), 50)
+        cached = percentile(time_calls(cached_prefill, args.repeat), 50)
+        print(
+            f"total tokens={full_ids.shape[1]:<6} full p50={full * 1e3:9.3f}ms  "
+            f"cached prefix p50={cached * 1e3:9.3f}ms  saved={(1 - cached / full) * 100:6.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+本地 DietAssistant 流式生成的首 token 延迟基准：对比 generate_response（等完整回答）
+与 stream_response 返回第一段文本的耗时。
+
+用法：python bench/llm_streaming.py [--model sshleifer/tiny-gpt2] [--repeat 10]
+只使用 CPU。
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report, time_calls
+
+sys.path.insert(0, os.path.join(common.SRC_DIR, "server"))
+
+from chatbox import DietAssistant
+
+QUESTION = "我早餐可以吃什么"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    assistant = DietAssistant(model_path=args.model, max_new_tokens=args.max_new_tokens)
+
+    first_token, total = [], []
+
+    def stream_once():
+        start = time.perf_counter()
+        chunks = assistant.stream_response(QUESTION)
+        for i, _ in enumerate(chunks):
+            if i == 0:
+                first_token.append(time.perf_counter() - start)
+        total.append(time.perf_counter() - start)
+
+    report("generate_response (full answer)", time_calls(lambda: assistant.generate_response(QUESTION), args.repeat))
+    time_calls(stream_once, args.repeat, warmup=0)
+    report("stream_response first chunk", first_token)
+    report("stream_response full answer", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+并行穷举评分的扩展性基准：每类 --pool-size 个候选食谱（默认 100，共 1e6 个组合），
+对比当前进程内一次性评分与 ParallelScorer 在 1/2/4/8 个子进程下的耗时，并核对结果一致。
+
+血糖预测器使用与导出格式相同、随机初始化的 4-64-64-3 网络，计算量与真实模型相当。
+用法：python bench/parallel_scoring.py [--pool-size 100] [--workers 1,2,4,8] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+
+import common  # noqa: F401  (设置 sys.path)
+from common import percentile, time_calls
+
+import numpy as np
+from KG import score_macros
+from parallel_scoring import ParallelScorer
+from predict_glucose import GlucosePredictor
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+PRE_MEAL_GLUCOSE = 6.0
+SEED = 0
+
+
+def random_predictor(path, rng, hidden=64):
+    sizes = [4, hidden, hidden, 3]
+    weights = {"n_layers": len(sizes) - 1, "activations": np.array(["relu", "relu", "linear"])}
+    for i in range(len(sizes) - 1):
+        weights[f"W{i}"] = rng.normal(0, 0.3, (sizes[i], sizes[i + 1]))
+        weights[f"b{i}"] = rng.normal(0, 0.1, sizes[i + 1])
+    weights.update(x_mean=np.array([60.0, 15.0, 5.0, 7.0]), x_scale=np.array([30.0, 8.0, 3.0, 2.0]),
+                   y_mean=np.array([9.0, 8.0, 7.0]), y_scale=np.array([2.0, 2.0, 1.5]))
+    np.savez(path, **weights)
+    return GlucosePredictor(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--top-n", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        predictor = random_predictor(os.path.join(directory, "weights.npz"), rng)
+    pool_macros = [rng.uniform(0, [80, 30, 20, 10], (args.pool_size, 4)) for _ in range(3)]
+    sizes = tuple(len(macros) for macros in pool_macros)
+    print(f"combinations={int(np.prod(sizes))}  cpus={os.cpu_count()}")
+
+    def in_process():
+        grids = np.meshgrid(*(np.arange(n) for n in sizes), indexing="ij")
+        candidates = np.stack([grid.ravel() for grid in grids], axis=1)
+        macros = np.stack([pool_macros[c][candidates[:, c]] for c in range(3)], axis=1)
+        health_scores = score_macros(macros, predictor, PRE_MEAL_GLUCOSE, NUTRIENT_NEEDS)[3]
+        tiebreak = np.random.default_rng(SEED).random(len(candidates))
+        return candidates[np.lexsort((tiebreak, -health_scores))[:args.top_n]]
+
+    expected = in_process()
+    baseline = percentile(time_calls(in_process, args.repeat), 50)
+    print(f"{'in-process':<16} p50={baseline:8.3f}s")
+
+    for workers in (int(n) for n in args.workers.split(",")):
+        scorer = ParallelScorer(predictor, workers)
+        try:
+            def parallel():
+                return scorer.top_candidates(pool_macros, NUTRIENT_NEEDS, PRE_MEAL_GLUCOSE, args.top_n, seed=SEED)
+
+            scorer.start()  # 子进程启动时间不计入
+            assert np.array_equal(parallel(), expected), "并行评分结果与当前进程评分不一致"
+            seconds = percentile(time_calls(parallel, args.repeat), 50)
+        finally:
+            scorer.close()
+        print(f"{f'workers={workers}':<16} p50={seconds:8.3f}s  speedup={baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
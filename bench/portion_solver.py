@@ -0,0 +1,39 @@
+"""
+份量比例基准：原固定系数（heuristic）与有界最小二乘求解（lsq）的耗时，以及两者求出的
+营养评分（calculate_nutrient_score_batch，越高越好）对比。
+
+用法：python bench/portion_solver.py [--rows 1000000]
+"""
+import argparse
+import time
+
+import common  # noqa: F401  (设置 sys.path)
+
+import numpy as np
+from KG import KnowledgeGraph
+from utils.health_score import calculate_nutrient_score_batch
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    macros = rng.uniform(0, 60, (args.rows, 3, 4))
+
+    print(f"rows={args.rows}")
+    for mode in ("heuristic", "lsq"):
+        start = time.perf_counter()
+        _, nutrition = KnowledgeGraph.calculate_group_nutrition_batch(macros, NUTRIENT_NEEDS, mode)
+        elapsed = time.perf_counter() - start
+        scores = calculate_nutrient_score_batch(nutrition, NUTRIENT_NEEDS)
+        finite = scores[np.isfinite(scores)]
+        print(f"{mode:9s}: {elapsed:7.3f}s  nutrient score mean={finite.mean():.2f} "
+              f"p10={np.percentile(finite, 10):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+血糖预测单次调用延迟的微基准：对比每次调用都重新加载 Keras 模型（旧实现）与常驻内存的 GlucosePredictor。
+
+用法：python bench/predict_latency.py [--repeat 20]
+模型路径与应用相同，可通过 GLUCOSE_MODEL_DIR 等环境变量指定。
+"""
+import argparse
+import os
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report, time_calls
+
+import joblib
+from predict_glucose import DEFAULT_MODEL_DIR, GlucosePredictor
+
+INPUT = [50, 10, 5, 6.0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    predictor = GlucosePredictor.from_env()
+    model_dir = os.getenv("GLUCOSE_MODEL_DIR", DEFAULT_MODEL_DIR)
+
+    def reload_every_call():
+        from tensorflow.keras.models import load_model
+
+        model = load_model(os.path.join(model_dir, "glucose_model_P1.h5"))
+        scaler_X = joblib.load(os.path.join(model_dir, "scaler_X.pkl"))
+        scaler_y = joblib.load(os.path.join(model_dir, "scaler_y.pkl"))
+        scaled = scaler_X.transform([INPUT])
+        return scaler_y.inverse_transform(model.predict(scaled, verbose=0))[0]
+
+    report("reload model per call (before)", time_calls(reload_every_call, args.repeat))
+    report("resident GlucosePredictor (after)", time_calls(lambda: predictor.predict(INPUT), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+评分更新吞吐量基准：对比旧的线性查找 + heapify 与带索引的 RecipeRanking.update。
+
+用法：python bench/rating_throughput.py [--recipes 100000] [--ratings 2000]
+"""
+import argparse
+import heapq
+import random
+import time
+
+import common  # noqa: F401  (设置 sys.path)
+
+from ranking import CATEGORIES, PriorityRecipe, RecipeRanking
+
+
+def update_linear(queues, name, score):
+    """旧实现：在三个堆中按名称线性查找，然后对整个堆 heapify"""
+    for queue in queues:
+        for i, recipe in enumerate(queue):
+            if recipe.name == name:
+                queue[i].preference_score = score
+                heapq.heapify(queue)
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--ratings", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    recipes = [(f"食谱{i}", CATEGORIES[i % 3], rng.uniform(0, 10)) for i in range(args.recipes)]
+    ratings = [(rng.choice(recipes)[0], rng.uniform(0, 10)) for _ in range(args.ratings)]
+
+    queues = {category: [] for category in CATEGORIES}
+    for name, category, score in recipes:
+        heapq.heappush(queues[category], PriorityRecipe(name, score))
+    start = time.perf_counter()
+    for name, score in ratings:
+        update_linear(queues.values(), name, score)
+    before = time.perf_counter() - start
+
+    ranking = RecipeRanking()
+    for name, category, score in recipes:
+        ranking.add(category, name, score)
+    ranking.publish()
+    start = time.perf_counter()
+    for name, score in ratings:
+        ranking.update(name, score)
+    after = time.perf_counter() - start
+
+    print(f"recipes={args.recipes}  ratings={args.ratings}")
+    print(f"linear search + heapify (before): {args.ratings / before:12.0f} ratings/s")
+    print(f"indexed heap (after):             {args.ratings / after:12.0f} ratings/s")
+
+
+if __name__ == "__main__":
+    main()
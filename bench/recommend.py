@@ -0,0 +1,51 @@
+"""
+recommend_recipes 基准：在合成图上测量抽样搜索与穷举搜索的单次推荐延迟。
+
+血糖预测器为 StubPredictor，每次批量预测等待 --predict-ms 毫秒，评分部分只衡量
+缩放比例和健康评分的计算；候选池大小见 --pool-sizes（穷举时组合数为其立方）。
+用法：python bench/recommend.py [--recipes 10000] [--pool-sizes 10 30] [--predict-ms 1] [--repeat 50]
+"""
+import argparse
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report, time_calls
+from fakes import FakeDriver, StubPredictor, SyntheticGraph
+
+from KG import KnowledgeGraph
+
+USER_DATA = {
+    "pre_meal_glucose": 6.0,
+    "nutrient_needs": {
+        "breakfast": {"carb": 68, "protein": 27, "fat": 18},
+        "lunch": {"carb": 90, "protein": 36, "fat": 24},
+        "dinner": {"carb": 68, "protein": 27, "fat": 18},
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--predict-ms", type=float, default=1.0)
+    parser.add_argument("--ratio-modes", nargs="+", default=["heuristic", "lsq"])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    graph = SyntheticGraph(n_recipes=args.recipes, n_ingredients=max(500, args.recipes // 10))
+    predictor = StubPredictor(latency=args.predict_ms / 1000)
+    kg = KnowledgeGraph(None, None, None, predictor=predictor, driver=FakeDriver(graph))
+
+    for pool_size in args.pool_sizes:
+        kg.pool_size = pool_size
+        for ratio_mode in args.ratio_modes:
+            kg.ratio_mode = ratio_mode
+            for search in ("sampling", "exhaustive"):
+                samples = time_calls(
+                    lambda: kg.recommend_recipes(USER_DATA, "lunch", search=search), args.repeat
+                )
+                report(f"{search} pool={pool_size} {ratio_mode}", samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+KnowledgeGraph 启动基准：在合成图上完整构造 KnowledgeGraph（加载优先队列和食材营养索引），
+报告各图规模下的耗时和往返次数。血糖预测器使用 StubPredictor，不计入启动时间
+（预测器的冷启动见 cold_start.py）。
+
+用法：python bench/startup.py [--sizes 1000 10000 100000] [--latency-ms 0.2] [--repeat 3]
+"""
+import argparse
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report, time_calls
+from fakes import FakeDriver, StubPredictor, SyntheticGraph
+
+from KG import KnowledgeGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--latency-ms", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    predictor = StubPredictor()
+    for size in args.sizes:
+        graph = SyntheticGraph(n_recipes=size, n_ingredients=max(500, size // 10))
+        driver = FakeDriver(graph, latency=args.latency_ms / 1000)
+
+        samples = time_calls(
+            lambda: KnowledgeGraph(None, None, None, predictor=predictor, driver=driver),
+            args.repeat, warmup=0,
+        )
+        report(f"startup recipes={size} ({driver.round_trips // args.repeat} round-trips)", samples)
+
+
+if __name__ == "__main__":
+    main()
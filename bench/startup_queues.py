@@ -0,0 +1,72 @@
+"""
+KnowledgeGraph 启动（_initialize_queues）基准：对比旧的 N+1 查询与单次聚合查询。
+
+在合成图上运行，每次查询模拟固定的 Bolt 往返延迟。
+用法：python bench/startup_queues.py [--sizes 10000 100000] [--latency-ms 0.2]
+"""
+import argparse
+import heapq
+import time
+
+import common  # noqa: F401  (设置 sys.path)
+from fakes import FakeDriver, StubPredictor, SyntheticGraph
+
+from KG import KnowledgeGraph
+from ranking import PriorityRecipe
+
+
+def initialize_queues_n_plus_one(driver):
+    """旧实现：先查询全部食谱，再为每个非主食食谱单独查询食材类型"""
+    staple_queue, vegetable_queue, protein_queue = [], [], []
+    with driver.session() as session:
+        recipes = session.run(
+            "MATCH (r:Recipe) "
+            "RETURN r.name AS name, r.type AS type, r.preference_score AS preference_score"
+        ).data()
+        for record in recipes:
+            recipe = PriorityRecipe(record["name"], record["preference_score"])
+            if record["type"] == "Staple":
+                heapq.heappush(staple_queue, recipe)
+            else:
+                ingredients = session.run(
+                    "MATCH (r:Recipe {name: $recipe_name})-[rel:CONTAINS]->(i) "
+                    "RETURN i.type AS type",
+                    recipe_name=record["name"]
+                ).data()
+                if any(ing["type"] == "Protein-rich" for ing in ingredients):
+                    heapq.heappush(protein_queue, recipe)
+                elif any(ing["type"] == "Vegetable" for ing in ingredients):
+                    heapq.heappush(vegetable_queue, recipe)
+    return staple_queue, vegetable_queue, protein_queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--latency-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        graph = SyntheticGraph(n_recipes=size, n_ingredients=max(500, size // 10))
+
+        driver = FakeDriver(graph, latency=args.latency_ms / 1000)
+        start = time.perf_counter()
+        initialize_queues_n_plus_one(driver)
+        before = time.perf_counter() - start
+        before_trips = driver.round_trips
+
+        driver = FakeDriver(graph, latency=args.latency_ms / 1000)
+        kg = KnowledgeGraph(None, None, None, predictor=StubPredictor(), driver=driver)
+        driver.round_trips = 0
+        start = time.perf_counter()
+        kg._initialize_queues()
+        after = time.perf_counter() - start
+
+        print(
+            f"recipes={size:<7} N+1: {before:8.3f}s ({before_trips} round-trips)   "
+            f"aggregate: {after:8.3f}s ({driver.round_trips} round-trip)"
+        )
+
+
+if __name__ == "__main__":
+    main()
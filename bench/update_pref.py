@@ -0,0 +1,65 @@
+"""
+评分写入基准：同步的 KnowledgeGraph.update_pref（每条评分一次往返）与写后队列
+FeedbackQueue.update_pref（只更新内存排名，后台批量写回）在多线程并发提交下的延迟和吞吐量。
+
+用法：python bench/update_pref.py [--recipes 10000] [--ratings 2000] [--clients 8] [--latency-ms 1]
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (设置 sys.path)
+from common import report
+from fakes import FakeDriver, StubPredictor, SyntheticGraph
+
+from feedback import FeedbackQueue
+from KG import KnowledgeGraph
+
+
+def run_clients(update_pref, ratings, clients):
+    """clients 个线程并发提交全部评分，返回 (每条评分的耗时列表, 总耗时)"""
+    def submit(item):
+        recipe_name, rating = item
+        start = time.perf_counter()
+        update_pref(rating, recipe_name)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        samples = list(executor.map(submit, ratings))
+    return samples, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--ratings", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    graph = SyntheticGraph(n_recipes=args.recipes, n_ingredients=max(500, args.recipes // 10))
+    rng = random.Random(0)
+    names = list(graph.recipes)
+    ratings = [(rng.choice(names), rng.randint(0, 10)) for _ in range(args.ratings)]
+
+    driver = FakeDriver(graph, latency=args.latency_ms / 1000)
+    kg = KnowledgeGraph(None, None, None, predictor=StubPredictor(), driver=driver)
+
+    driver.round_trips = 0
+    samples, elapsed = run_clients(kg.update_pref, ratings, args.clients)
+    report(f"sync update_pref ({driver.round_trips} round-trips)", samples)
+    print(f"{'':<40} throughput={len(ratings) / elapsed:9.0f}/s")
+
+    driver.round_trips = 0
+    feedback = FeedbackQueue(kg, batch_size=args.batch_size, max_pending=len(ratings))
+    samples, elapsed = run_clients(feedback.update_pref, ratings, args.clients)
+    feedback.close()
+    report(f"write-behind update_pref ({driver.round_trips} round-trips)", samples)
+    print(f"{'':<40} throughput={len(ratings) / elapsed:9.0f}/s (submit)")
+
+
+if __name__ == "__main__":
+    main()
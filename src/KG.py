@@ -1,95 +1,232 @@
 from neo4j import GraphDatabase
-from predict_glucose import predict
-from utils.health_score import calculate_health_score
-import heapq
+from contextlib import contextmanager
+import logging
+import os
+import threading
+from predict_glucose import get_predictor
+from nutrition_index import MACRO_FIELDS, NutritionIndex
+from parallel_scoring import ParallelScorer
+from ranking import RecipeRanking
+from tracing import span
+from utils.health_score import NUTRITION_FIELDS, calculate_health_score_batch
+from utils.portion_solver import solve_portion_ratios
 import random
+import time
+import numpy as np
 from typing import List, Dict, Tuple
 # import csv
 # from datetime import datetime
 
-class PriorityRecipe:
-    """Wrapper class for recipes to enable priority queue functionality"""
-    def __init__(self, name: str, preference_score: float):
-        self.name = name
-        self.preference_score = preference_score
-    
-    def __lt__(self, other):
-        # We want higher preference scores to have higher priority
-        return self.preference_score > other.preference_score
+logger = logging.getLogger(__name__)
+
+def _is_acquisition_timeout(error: Exception) -> bool:
+    """
+    驱动在 connection_acquisition_timeout 内拿不到连接时抛出 ConnectionAcquisitionTimeoutError
+    （neo4j 5.x 起）。按类名匹配异常及其基类，不依赖具体驱动版本的导入路径和错误信息。
+    """
+    return any(cls.__name__ == "ConnectionAcquisitionTimeoutError" for cls in type(error).__mro__)
+
+
+class SessionMetrics:
+    """
+    Neo4j 会话使用情况统计。
+
+    驱动不公开连接池的占用情况，这里统计的是 KnowledgeGraph 打开的会话而不是池中的连接：
+    sessions_in_use 为当前打开的会话数。每个会话执行查询时最多占用一个连接，
+    所以它是连接占用数的上限，与 max_pool_size 相比可以看出连接池是否可能耗尽；
+    真正的获取连接超时记在 acquisition_timeouts_total。
+    """
+
+    def __init__(self, max_pool_size=None):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self.sessions_in_use = 0
+        self.peak_sessions_in_use = 0
+        self.sessions_total = 0
+        self.errors_total = 0
+        self.acquisition_timeouts_total = 0
+        self.session_seconds_total = 0.0
+
+    def acquired(self):
+        with self._lock:
+            self.sessions_in_use += 1
+            self.sessions_total += 1
+            self.peak_sessions_in_use = max(self.peak_sessions_in_use, self.sessions_in_use)
+
+    def released(self, seconds, error=None):
+        with self._lock:
+            self.sessions_in_use -= 1
+            self.session_seconds_total += seconds
+            if error is not None:
+                self.errors_total += 1
+                if _is_acquisition_timeout(error):
+                    self.acquisition_timeouts_total += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "max_pool_size": self.max_pool_size,
+                "sessions_in_use": self.sessions_in_use,
+                "peak_sessions_in_use": self.peak_sessions_in_use,
+                "sessions_per_pool_slot": self.sessions_in_use / self.max_pool_size if self.max_pool_size else None,
+                "sessions_total": self.sessions_total,
+                "errors_total": self.errors_total,
+                "acquisition_timeouts_total": self.acquisition_timeouts_total,
+                "session_seconds_total": self.session_seconds_total,
+            }
+
+
+def score_macros(macros: np.ndarray, predictor, pre_meal_glucose, nutrient_needs, ratio_mode: str = "heuristic"):
+    """
+    对 N 个组合批量计算缩放比例、营养、血糖预测和健康评分（也在评分子进程中使用）。
+
+    参数:
+    macros: 形状为 (N, 3, 4) 的数组，依次为主食、蔬菜、蛋白质食谱的 carb/protein/fat/fiber
+    ratio_mode: 缩放比例的计算方式，见 KnowledgeGraph.calculate_group_nutrition_batch
+
+    返回:
+    ratios (N, 3)、nutrition (N, 5)、predicted_glucose (N, 3)、health_scores (N,)
+    """
+    with span("portion_ratios", rows=len(macros), ratio_mode=ratio_mode):
+        ratios, nutrition = KnowledgeGraph.calculate_group_nutrition_batch(macros, nutrient_needs, ratio_mode)
+
+    # 所有候选组合的血糖预测合并为一次前向传播
+    fields = {field: col for col, field in enumerate(NUTRITION_FIELDS)}
+    with span("predict", rows=len(nutrition)):
+        predicted_glucose = predictor.predict_batch(np.column_stack([
+            nutrition[:, fields["carb"]],
+            nutrition[:, fields["fat"]],
+            nutrition[:, fields["fiber"]],
+            np.full(len(nutrition), float(pre_meal_glucose)),
+        ]))
+
+    with span("health_score", rows=len(nutrition)):
+        health_scores = calculate_health_score_batch(nutrition, predicted_glucose, nutrient_needs)
+    # 血糖落在评分区间之外或营养评分为 0 时无法评分，这样的组合排在最后
+    health_scores[~np.isfinite(health_scores)] = -np.inf
+
+    return ratios, nutrition, predicted_glucose, health_scores
+
 
 class KnowledgeGraph:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        self.staple_queue = []
-        self.vegetable_queue = []
-        self.protein_queue = []
+    def __init__(self, uri, user, password, predictor=None, driver=None, pool_size=10, scoring_workers=0,
+                 ratio_mode="heuristic", **driver_config):
+        """
+        pool_size: 推荐时每类取偏好分最高的前几个食谱作为候选
+        ratio_mode: 推荐评分时缩放比例的计算方式，"heuristic"（原固定系数，默认）或 "lsq"（有界最小二乘，
+                    健康评分更高，但评分耗时约为前者的 2～3 倍）
+        scoring_workers: 大于 0 时穷举评分分片到这么多个子进程中并行计算（见 parallel_scoring.py）
+        driver_config 原样传给 GraphDatabase.driver，例如 max_connection_pool_size、
+        connection_acquisition_timeout、max_transaction_retry_time。
+        """
+        # 可注入已创建的 driver（例如基准测试中的内存图），否则按地址和账号连接
+        self.driver = driver or GraphDatabase.driver(uri, auth=(user, password), **driver_config)
+        self.session_metrics = SessionMetrics(driver_config.get("max_connection_pool_size"))
+        # 血糖预测器在进程内只加载一次，可由调用方注入共享实例
+        self.predictor = predictor or get_predictor()
+        self.pool_size = pool_size
+        self.ratio_mode = ratio_mode
+        # 评分子进程由服务在启动其他线程之前调用 parallel_scorer.start() 创建（未调用时在第一次穷举评分时创建）
+        self.parallel_scorer = ParallelScorer(self.predictor, scoring_workers) if scoring_workers > 0 else None
         self._initialize_queues()
+        # 一次性加载所有食谱的食材营养数据，推荐和生成提示词时只读内存
+        with self._session("load_nutrition_index") as session:
+            self.nutrition_index = NutritionIndex.load(session)
+
+    @classmethod
+    def from_env(cls, predictor=None) -> "KnowledgeGraph":
+        """
+        根据环境变量创建知识图谱连接：
+        - NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD: 数据库地址和账号
+        - NEO4J_MAX_POOL_SIZE: 连接池大小（默认 50）
+        - NEO4J_ACQUISITION_TIMEOUT: 从连接池获取连接的超时秒数（默认 10）
+        - NEO4J_MAX_RETRY_TIME: 托管事务遇到瞬时错误时的最长重试秒数（默认 15）
+        - RECOMMEND_POOL_SIZE: 每类候选食谱数（默认 10）
+        - SCORING_WORKERS: 并行评分的子进程数（默认 0，即在当前进程中评分）
+        - RATIO_MODE: 缩放比例的计算方式（默认 heuristic，可选 lsq）
+        """
+        return cls(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            os.getenv("NEO4J_USER", "neo4j"),
+            os.getenv("NEO4J_PASSWORD", "2winadmin"),
+            predictor=predictor,
+            pool_size=int(os.getenv("RECOMMEND_POOL_SIZE", "10")),
+            scoring_workers=int(os.getenv("SCORING_WORKERS", "0")),
+            ratio_mode=os.getenv("RATIO_MODE", "heuristic"),
+            max_connection_pool_size=int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")),
+            connection_acquisition_timeout=float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10")),
+            max_transaction_retry_time=float(os.getenv("NEO4J_MAX_RETRY_TIME", "15")),
+        )
 
     def close(self):
+        if self.parallel_scorer is not None:
+            self.parallel_scorer.close()
         self.driver.close()
 
+    @contextmanager
+    def _session(self, operation: str = "query"):
+        """打开一个会话并记录到 session_metrics，会话的使用时间记为 neo4j span（operation 为属性）"""
+        self.session_metrics.acquired()
+        start = time.perf_counter()
+        error = None
+        try:
+            with span("neo4j", operation=operation), self.driver.session() as session:
+                yield session
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.session_metrics.released(time.perf_counter() - start, error)
+
     def _initialize_queues(self):
         """Initialize the three priority queues by loading recipes from Neo4j"""
-        with self.driver.session() as session:
-            # 获取所有食谱的基本信息
+        start = time.perf_counter()
+        with self._session("initialize_queues") as session:
+            # 一次查询获取所有食谱的基本信息及其食材类型
             recipes = session.run(
                 "MATCH (r:Recipe) "
-                "RETURN r.name AS name, r.type AS type, r.preference_score AS preference_score"
+                "OPTIONAL MATCH (r)-[:CONTAINS]->(i) "
+                "WITH r, collect(i.type) AS ingredient_types "
+                "RETURN r.name AS name, r.type AS type, r.preference_score AS preference_score, "
+                "ingredient_types"
             ).data()  # 使用.data()立即获取所有结果
-            
-            for record in recipes:
-                recipe_name = record["name"]
-                preference_score = record["preference_score"]
-                recipe = PriorityRecipe(recipe_name, preference_score)
-                
-                if record["type"] == "Staple":
-                    heapq.heappush(self.staple_queue, recipe)
-                else:
-                    # 在同一个会话中查询食材类型
-                    ingredients = session.run(
-                        "MATCH (r:Recipe {name: $recipe_name})-[rel:CONTAINS]->(i) "
-                        "RETURN i.type AS type",
-                        recipe_name=recipe_name
-                    ).data()  # 使用.data()立即获取所有结果
-                    
-                    # 检查食材类型
-                    has_protein = any(ing["type"] == "Protein-rich" for ing in ingredients)
-                    has_vegetable = any(ing["type"] == "Vegetable" for ing in ingredients)
-                    
-                    if has_protein:
-                        heapq.heappush(self.protein_queue, recipe)
-                    elif has_vegetable:
-                        heapq.heappush(self.vegetable_queue, recipe)
-
-    def get_top_recipes(self) -> Tuple[List[str], List[str], List[str]]:
+
+        ranking = RecipeRanking()
+        for record in recipes:
+            name, preference_score = record["name"], record["preference_score"]
+
+            if record["type"] == "Staple":
+                ranking.add("staple", name, preference_score)
+            elif "Protein-rich" in record["ingredient_types"]:
+                ranking.add("protein", name, preference_score)
+            elif "Vegetable" in record["ingredient_types"]:
+                ranking.add("vegetable", name, preference_score)
+        ranking.publish()
+        self.ranking = ranking
+
+        logger.info(
+            "食谱队列初始化完成",
+            extra={
+                "recipes": len(recipes),
+                "staple": ranking.size("staple"),
+                "vegetable": ranking.size("vegetable"),
+                "protein": ranking.size("protein"),
+                "seconds": round(time.perf_counter() - start, 3),
+            },
+        )
+
+    def get_top_recipes(self, k: int = 10) -> Tuple[List[str], List[str], List[str]]:
         """
         Get top recipes from all three queues.
+        Reads the published ranking snapshots only: no database access and no queue mutation.
         Returns:
-            tuple: (top 10 staple recipes, top 10 vegetable recipes, top 10 protein recipes)
+            tuple: (top k staple recipes, top k vegetable recipes, top k protein recipes)
         """
-        # Get top 10 from each queue
-        top_staple = [heapq.heappop(self.staple_queue).name for _ in range(min(10, len(self.staple_queue)))]
-        top_vegetable = [heapq.heappop(self.vegetable_queue).name for _ in range(min(10, len(self.vegetable_queue)))]
-        top_protein = [heapq.heappop(self.protein_queue).name for _ in range(min(10, len(self.protein_queue)))]
-        
-        # Push them back to maintain the queue
-        for name in top_staple:
-            heapq.heappush(self.staple_queue, PriorityRecipe(name, self._get_recipe_score(name)))
-        for name in top_vegetable:
-            heapq.heappush(self.vegetable_queue, PriorityRecipe(name, self._get_recipe_score(name)))
-        for name in top_protein:
-            heapq.heappush(self.protein_queue, PriorityRecipe(name, self._get_recipe_score(name)))
-            
-        return top_staple, top_vegetable, top_protein
-
-    def _get_recipe_score(self, recipe_name: str) -> float:
-        """Helper method to get a recipe's current preference score"""
-        with self.driver.session() as session:
-            result = session.run(
-                "MATCH (r:Recipe {name: $name}) RETURN r.preference_score AS score",
-                name=recipe_name
-            )
-            return result.single()["score"]
+        return (
+            self.ranking.top_k("staple", k),
+            self.ranking.top_k("vegetable", k),
+            self.ranking.top_k("protein", k),
+        )
 
     def get_recipe_ingredients(self, recipe_name: str, ratio: float = 1.0) -> List[Dict]:
         """
@@ -100,51 +237,39 @@ class KnowledgeGraph:
         Returns:
             List of dictionaries containing ingredient information with adjusted weights
         """
+        if recipe_name in self.nutrition_index:
+            return self.nutrition_index.ingredients(recipe_name, ratio)
+
+        # 启动后新增的食谱不在内存索引中，查询一次数据库并加入索引，之后（例如生成提示词时）只读内存
         try:
-            with self.driver.session() as session:
-                result = session.run(
+            with self._session("get_recipe_ingredients") as session:
+                records = session.run(
                     "MATCH (r:Recipe {name: $recipe_name})-[rel:CONTAINS]->(i) "
                     "RETURN i.name AS name, i.carb AS carb, i.protein AS protein, "
-                    "i.fat AS fat, i.fiber AS fiber, rel.weight AS weight, labels(i) AS type",
+                    "i.fat AS fat, i.fiber AS fiber, rel.weight AS weight, labels(i) AS type, "
+                    "i.preference_score AS preference_score",
                     recipe_name=recipe_name
-                )
-                ingredients = [dict(record) for record in result]
-                
-                # 确保所有数值都是原生 Python float 类型
-                for ingredient in ingredients:
-                    original_weight = ingredient['weight']
-                    adjusted_weight = int(original_weight * float(ratio))
-                    
-                    ingredient['weight'] = adjusted_weight
-                    ingredient['carb'] = float(ingredient.get('carb', 0))
-                    ingredient['protein'] = float(ingredient.get('protein', 0))
-                    ingredient['fat'] = float(ingredient.get('fat', 0))
-                    ingredient['fiber'] = float(ingredient.get('fiber', 0))
-                
-                return ingredients
+                ).data()
+
+            if not records:
+                return []
+            self.nutrition_index.add_recipe(recipe_name, records)
+            return self.nutrition_index.ingredients(recipe_name, ratio)
                 
-        except Exception as e:
-            print(f"获取食谱食材时出错: {str(e)}")
-            raise e
+        except Exception:
+            logger.exception("获取食谱食材时出错", extra={"recipe": recipe_name})
+            raise
 
     def calculate_recipe_nutrition(self, recipe_name: str) -> Dict[str, float]:
         """
         Calculate total nutrition for a single recipe.
         """
-        ingredients = self.get_recipe_ingredients(recipe_name, 1.0)
-        total_carb = sum(i["carb"] * i["weight"] / 100 for i in ingredients)
-        total_protein = sum(i["protein"] * i["weight"] / 100 for i in ingredients)
-        total_fat = sum(i["fat"] * i["weight"] / 100 for i in ingredients)
-        total_fiber = sum(i["fiber"] * i["weight"] / 100 for i in ingredients)
-
-        nutrition = {
-            "carb": total_carb,
-            "protein": total_protein,
-            "fat": total_fat,
-            "fiber": total_fiber
-        }
-        return nutrition
-
+        if recipe_name not in self.nutrition_index:
+            # 查询数据库并加入内存索引
+            self.get_recipe_ingredients(recipe_name)
+        if recipe_name not in self.nutrition_index:
+            return {field: 0.0 for field in MACRO_FIELDS}
+        return self.nutrition_index.recipe_nutrition(recipe_name)
 
     def calculate_group_nutrition(self, recipes, nutrient_needs):
         """
@@ -207,80 +332,219 @@ class KnowledgeGraph:
             
             return ratios, total_nutrition
             
-        except Exception as e:
-            print(f"计算群组营养时出错: {str(e)}")
-            raise e
+        except Exception:
+            logger.exception("计算群组营养时出错", extra={"recipes": list(recipes)})
+            raise
 
-    def recommend_recipes(self, user_data: Dict, meal_type: str = "lunch") -> Tuple[List[str], Dict]:
+    @staticmethod
+    def calculate_group_nutrition_batch(macros: np.ndarray, nutrient_needs,
+                                        ratio_mode: str = "heuristic") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        calculate_group_nutrition 的向量化版本，对 N 个候选组合一次性计算缩放比例和总营养。
+
+        参数:
+        macros: 形状为 (N, 3, 4) 的数组，依次为主食、蔬菜、蛋白质食谱的 carb/protein/fat/fiber
+        nutrient_needs: 每餐的营养需求
+        ratio_mode: "heuristic" 按固定系数计算比例（与 calculate_group_nutrition 逐位一致）；
+                    "lsq" 求解使碳水/蛋白质/脂肪最接近需求的有界最小二乘比例（见 utils/portion_solver.py）
+
+        返回:
+        ratios: 形状为 (N, 3) 的缩放比例
+        nutrition: 形状为 (N, 5) 的总营养，列顺序见 NUTRITION_FIELDS
+        """
+        carb, protein, fat, fiber = (macros[:, :, col] for col in range(len(MACRO_FIELDS)))
+        if ratio_mode == "lsq":
+            ratios = solve_portion_ratios(macros, nutrient_needs)
+        elif ratio_mode == "heuristic":
+            ratios = KnowledgeGraph._heuristic_ratios(carb, protein, fat, nutrient_needs)
+        else:
+            raise ValueError(f"未知的比例计算方式: {ratio_mode}")
+
+        # 按食谱顺序累加，与逐个计算的结果逐位一致
+        nutrition = np.zeros((len(macros), len(NUTRITION_FIELDS)))
+        for i in range(3):
+            ratio = ratios[:, i]
+            nutrition[:, 0] += carb[:, i] * 4 * ratio + protein[:, i] * 4 * ratio + fat[:, i] * 9 * ratio
+            nutrition[:, 1] += carb[:, i] * ratio
+            nutrition[:, 2] += protein[:, i] * ratio
+            nutrition[:, 3] += fat[:, i] * ratio
+            nutrition[:, 4] += fiber[:, i] * ratio
+
+        return ratios, nutrition
+
+    @staticmethod
+    def _heuristic_ratios(carb: np.ndarray, protein: np.ndarray, fat: np.ndarray, nutrient_needs) -> np.ndarray:
+        """原来按固定系数（0.6、0.5、0.8）和脂肪上限计算的缩放比例"""
+        ratios = np.zeros(carb.shape)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # 主食和蔬菜的碳水比例
+            total_carb = carb[:, 0] + carb[:, 1] + carb[:, 2]
+            carb_ratio = nutrient_needs["carb"] / total_carb
+            ratios[:, 0] = np.where(total_carb > 0, carb_ratio * 0.6, 1.0)
+            ratios[:, 1] = np.where(total_carb > 0, carb_ratio * 0.5, 1.0)
+
+            # 蛋白质食谱和蔬菜的蛋白质比例
+            total_protein = protein[:, 1] + protein[:, 2]
+            protein_ratio = nutrient_needs["protein"] / total_protein
+            has_protein = total_protein > 0
+            ratios[:, 1] = np.where(has_protein, ratios[:, 1] + protein_ratio * 0.5, ratios[:, 1])
+            ratios[:, 2] = np.where(has_protein, ratios[:, 2] + protein_ratio * 0.8, ratios[:, 2])
+
+            total_fat = fat[:, 1] + fat[:, 2]
+            fat_ratio = nutrient_needs["fat"] / total_fat
+            has_fat = total_fat > 0
+            ratios[:, 1] = np.where(has_fat, np.minimum(ratios[:, 1], fat_ratio), ratios[:, 1])
+            ratios[:, 2] = np.where(has_fat, np.minimum(ratios[:, 2], fat_ratio), 1.0)
+
+        return ratios
+
+    def _recipe_macros(self, recipe_names: List[str]) -> np.ndarray:
+        """返回多个食谱的营养向量，形状为 (len(recipe_names), 4)"""
+        return np.array([
+            [nutrition[field] for field in MACRO_FIELDS]
+            for nutrition in map(self.calculate_recipe_nutrition, recipe_names)
+        ]).reshape(-1, len(MACRO_FIELDS))
+
+    def _score_candidates(self, candidates: np.ndarray, pools, user_data: Dict, nutrient_needs):
+        """
+        对候选组合批量计算缩放比例、营养、血糖预测和健康评分。
+
+        参数:
+        candidates: 形状为 (N, 3) 的整数数组，每列是对应类别候选列表中的下标
+        pools: (主食列表, 蔬菜列表, 蛋白质列表)
+
+        返回:
+        ratios (N, 3)、nutrition (N, 5)、predicted_glucose (N, 3)、health_scores (N,)
+        """
+        pool_macros = [self._recipe_macros(pool) for pool in pools]
+        macros = np.stack([pool_macros[i][candidates[:, i]] for i in range(3)], axis=1)
+        return score_macros(macros, self.predictor, user_data["pre_meal_glucose"], nutrient_needs, self.ratio_mode)
+
+    @staticmethod
+    def _scores_dict(health_score, nutrition, predicted_glucose) -> Dict[str, float]:
+        """
+        返回给前端的评分信息。
+        所有候选组合都无法评分时，选中的组合评分为 -inf 或 NaN，JSON 中不能表示，记为 0（最低分）；
+        其他非有限值同样记为 0。
+        """
+        group_nutrition = dict(zip(NUTRITION_FIELDS, nutrition.tolist()))
+        scores = {
+            "health_score": float(health_score),
+            "energy": float(group_nutrition["energy"]),
+            "PBG": float(predicted_glucose[1]),
+            "carb": float(group_nutrition["carb"]),
+            "protein": float(group_nutrition["protein"]),
+            "fat": float(group_nutrition["fat"]),
+            "fiber": float(group_nutrition["fiber"])
+        }
+        invalid = [key for key, value in scores.items() if not np.isfinite(value)]
+        if invalid:
+            logger.warning("推荐组合的评分不是有限值，按 0 返回", extra={"fields": invalid})
+            scores.update({key: 0.0 for key in invalid})
+        return scores
+
+    def candidate_pools(self, k: int = None) -> Tuple[List[str], List[str], List[str]]:
+        """每类前 k（默认 pool_size）个食谱；蔬菜或蛋白质类为空时用主食代替"""
+        top_staple, top_vegetable, top_protein = self.get_top_recipes(k or self.pool_size)
+        return top_staple, top_vegetable or top_staple, top_protein or top_staple
+
+    def rank_combinations(self, user_data: Dict, meal_type: str = "lunch", top_n: int = 1,
+                          seed=None) -> List[Tuple[List[str], List[float], Dict]]:
+        """
+        穷举每类前 pool_size 个食谱的全部组合（默认最多 10×10×10 个），批量评分后返回健康评分最高的 top_n 个。
+        配置了 scoring_workers 时组合空间分片到子进程中评分，父进程合并各分片的前 top_n 个。
+
+        参数:
+        seed: 评分相同的组合之间随机排序所用的种子，相同种子结果可复现，且并行评分与当前进程评分的结果相同；
+              为 None 时每次调用重新随机，同分组合的顺序不固定（推荐缓存按分桶键传入固定种子）
+
+        返回:
+        [(食谱列表, 缩放比例, 评分信息), ...]，按健康评分从高到低排列
+        """
+        nutrient_needs = user_data["nutrient_needs"][meal_type]
+        pools = self.candidate_pools()
+
+        if self.parallel_scorer is not None:
+            # 子进程只返回排好序的前 top_n 个组合，这里再完整计算它们的比例和评分
+            with span("parallel_scoring", workers=self.parallel_scorer.workers,
+                      combinations=int(np.prod([len(pool) for pool in pools]))):
+                candidates = self.parallel_scorer.top_candidates(
+                    [self._recipe_macros(pool) for pool in pools], nutrient_needs, user_data["pre_meal_glucose"], top_n,
+                    self.ratio_mode, seed,
+                )
+            ratios, nutrition, predicted_glucose, health_scores = self._score_candidates(
+                candidates, pools, user_data, nutrient_needs
+            )
+            order = np.arange(len(candidates))
+        else:
+            grids = np.meshgrid(*(np.arange(len(pool)) for pool in pools), indexing="ij")
+            candidates = np.stack([grid.ravel() for grid in grids], axis=1)
+            ratios, nutrition, predicted_glucose, health_scores = self._score_candidates(
+                candidates, pools, user_data, nutrient_needs
+            )
+
+            tiebreak = np.random.default_rng(seed).random(len(candidates))
+            order = np.lexsort((tiebreak, -health_scores))[:top_n]
+
+        return [
+            (
+                [pools[i][candidates[row, i]] for i in range(3)],
+                ratios[row].tolist(),
+                self._scores_dict(health_scores[row], nutrition[row], predicted_glucose[row]),
+            )
+            for row in order
+        ]
+
+    def recommend_recipes(self, user_data: Dict, meal_type: str = "lunch", search: str = "sampling",
+                          seed=None) -> Tuple[List[str], List[float], Dict]:
         """
         Recommend recipes using three priority queues:
         - 1 staple recipe (from staple queue)
         - 1 vegetable recipe (from vegetable queue)
         - 1 protein recipe (from protein queue)
+
+        search:
+        - "sampling": 随机抽取组合，返回第一个健康分数>=0.7的组合（旧行为）
+        - "exhaustive": 穷举全部组合，返回健康分数最高的组合
+        seed: 随机数种子，相同种子结果可复现
         """
         nutrient_needs = user_data["nutrient_needs"][meal_type]
-        print(f"Nutrient needs: {nutrient_needs}")
+        logger.debug("Nutrient needs", extra={"meal_type": meal_type, "nutrient_needs": nutrient_needs})
 
-        # Get top recipes from all queues
-        top_staple, top_vegetable, top_protein = self.get_top_recipes()
-        
-        health_score = 0.6
-        
-        best_recommendations = None
-        best_ratios = None
-        best_scores = None
+        if search == "exhaustive":
+            return self.rank_combinations(user_data, meal_type, top_n=1, seed=seed)[0]
+        if search != "sampling":
+            raise ValueError(f"未知的搜索模式: {search}")
+
+        pools = self.candidate_pools()
         max_attempts = 100  # 防止无限循环
-        attempts = 0
-        
-        while health_score < 0.7 and attempts < max_attempts:
-            attempts += 1
-            # Randomly select 1 from each category's top 10
-            staple_recipe = random.choice(top_staple)
-            vegetable_recipe = random.choice(top_vegetable) if top_vegetable else random.choice(top_staple)
-            protein_recipe = random.choice(top_protein) if top_protein else random.choice(top_staple)
-            
-            recommendations = [staple_recipe, vegetable_recipe, protein_recipe]
-            
-            # Calculate nutrition and health scores
-            ratios, group_nutrition = self.calculate_group_nutrition(recommendations, nutrient_needs)
-            predicted_glucose = predict([
-                group_nutrition["carb"],
-                group_nutrition["fat"],
-                group_nutrition["fiber"],
-                user_data["pre_meal_glucose"],
+
+        with span("sampling", max_attempts=max_attempts) as sampling:
+            # 1. 预先随机抽取全部候选组合（每类候选食谱中各选1个）
+            rng = random.Random(seed)
+            candidates = np.array([
+                [rng.randrange(len(pool)) for pool in pools]
+                for _ in range(max_attempts)
             ])
-            
-            health_score = calculate_health_score(
-                group_nutrition, predicted_glucose, nutrient_needs
+
+            # 2. 批量计算所有候选组合的营养、血糖预测和健康评分
+            ratios, nutrition, predicted_glucose, health_scores = self._score_candidates(
+                candidates, pools, user_data, nutrient_needs
             )
-            
-            if health_score >= 0.7:
-                best_recommendations = recommendations
-                best_ratios = ratios
-                best_scores = {
-                    "health_score": float(health_score),
-                    "energy": float(group_nutrition["energy"]),
-                    "PBG": float(predicted_glucose[1]),
-                    "carb": float(group_nutrition["carb"]),
-                    "protein": float(group_nutrition["protein"]),
-                    "fat": float(group_nutrition["fat"]),
-                    "fiber": float(group_nutrition["fiber"])
-                }
-        
-        # 如果没有找到健康分数>=0.7的组合，使用最后一次计算的结果
-        if best_recommendations is None:
-            best_recommendations = recommendations
-            best_ratios = ratios
-            best_scores = {
-                "health_score": float(health_score),
-                "energy": float(group_nutrition["energy"]),
-                "PBG": float(predicted_glucose[1]),
-                "carb": float(group_nutrition["carb"]),
-                "protein": float(group_nutrition["protein"]),
-                "fat": float(group_nutrition["fat"]),
-                "fiber": float(group_nutrition["fiber"])
-            }
-            
+
+            # 3. 按抽取顺序选出第一个健康分数>=0.7的组合；
+            #    如果没有找到，使用最后一个候选组合的结果
+            accepted = np.flatnonzero(health_scores >= 0.7)
+            row = accepted[0] if len(accepted) else len(candidates) - 1
+            # 逐个抽样时实际需要的次数
+            sampling.set("attempts", int(row) + 1)
+            sampling.set("accepted", bool(len(accepted)))
+
+        best_recommendations = [pools[i][candidates[row, i]] for i in range(3)]
+        best_ratios = ratios[row].tolist()
+        best_scores = self._scores_dict(health_scores[row], nutrition[row], predicted_glucose[row])
+
         return best_recommendations, best_ratios, best_scores
 
     def update_pref(self, rating: float, recipe_name: str) -> str:
@@ -290,41 +554,15 @@ class KnowledgeGraph:
         try:
             rating = float(rating)
             if 0 <= rating <= 10:   
-                # Update ingredient preference scores
-                with self.driver.session() as session:
-                    session.execute_write(
-                        lambda tx: tx.run(
-                            "MATCH (r:Recipe {name: $name})-[:CONTAINS]->(i:Ingredient) "
-                            "SET i.preference_score = (i.preference_score + $rating) / 2",
-                            name=recipe_name, rating=rating
-                        )
-                    )
-
-                with self.driver.session() as session:
-                    # Get average ingredient score
-                    avg_ingredient_score = session.execute_read(
-                        lambda tx: tx.run(
-                            "MATCH (r:Recipe {name: $name})-[:CONTAINS]->(i:Ingredient) "
-                            "RETURN avg(i.preference_score) AS avg_score",
-                            name=recipe_name
-                        ).single()["avg_score"]
-                    )
-                    
-                    avg_ingredient_score = avg_ingredient_score or 0.6
-                    
-                    # Update recipe preference score
-                    session.execute_write(
-                        lambda tx: tx.run(
-                            "MATCH (r:Recipe {name: $name}) "
-                            "SET r.preference_score = (r.preference_score + $rating + $avg_ingredient_score) / 3",
-                            name=recipe_name, 
-                            rating=rating,
-                            avg_ingredient_score=avg_ingredient_score
-                        )
-                    )
-
-                # Update the priority queues
-                self._update_recipe_in_queues(recipe_name)
+                # 一条语句、一次往返完成食材评分、平均分和食谱评分的更新，并返回新评分
+                with self._session("update_pref") as session:
+                    new_score = session.execute_write(self._update_pref_tx, recipe_name, rating)
+
+                if new_score is None:
+                    return "未找到该食谱。"
+
+                # 直接用返回的新评分更新优先队列，无需再次查询
+                self.ranking.update(recipe_name, new_score)
                 
                 return "感谢您的评分！食谱和食材的偏好评分已更新。"
             else:
@@ -332,19 +570,104 @@ class KnowledgeGraph:
         except ValueError:
             return "请输入有效的数值。"
 
-    def _update_recipe_in_queues(self, recipe_name: str):
-        """Update a recipe's position in the priority queues after score change"""
-        new_score = self._get_recipe_score(recipe_name)
-        
-        # Check which queue the recipe is in and update it
-        for queue in [self.staple_queue, self.vegetable_queue, self.protein_queue]:
-            for i, recipe in enumerate(queue):
-                if recipe.name == recipe_name:
-                    queue[i].preference_score = new_score
-                    heapq.heapify(queue)  # Re-heapify to maintain order
-                    return
+    @staticmethod
+    def _update_pref_tx(tx, recipe_name: str, rating: float):
+        """
+        食材评分更新为 (原评分 + rating) / 2，食谱评分更新为
+        (原评分 + rating + 食材平均评分) / 3，食材平均评分为空或 0 时取 0.6。
+        返回食谱的新评分，食谱不存在时返回 None。
+        """
+        record = tx.run(
+            "MATCH (r:Recipe {name: $name}) "
+            "OPTIONAL MATCH (r)-[:CONTAINS]->(i:Ingredient) "
+            "SET i.preference_score = (i.preference_score + $rating) / 2 "
+            "WITH r, avg(i.preference_score) AS avg_score "
+            "SET r.preference_score = (r.preference_score + $rating + "
+            "CASE WHEN avg_score IS NULL OR avg_score = 0 THEN 0.6 ELSE avg_score END) / 3 "
+            "RETURN r.preference_score AS score",
+            name=recipe_name, rating=rating
+        ).single()
+        return record["score"] if record else None
 
-    def generate_prompt(self, recommendations: List[str], meal_type: str = "lunch", ratios: List[float] = [1.0, 1.0, 1.0]) -> str:
+    def update_prefs(self, ratings: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """
+        批量写入多条评分，与逐条调用 update_pref 的计算方式相同。
+
+        参数:
+        ratings: [(食谱名, 评分), ...]，按列表顺序依次生效，同一食谱的多条评分保持先后顺序
+
+        返回:
+        [(食谱名, 该条评分生效后的食谱评分), ...]，不存在的食谱不出现在结果中
+        """
+        with self._session("update_prefs") as session:
+            return session.execute_write(self._update_prefs_batch_tx, ratings)
+
+    @staticmethod
+    def _update_prefs_batch_tx(tx, ratings: List[Tuple[str, float]]):
+        # CALL 子查询对 UNWIND 的每一行依次执行，后一条评分能看到前一条写入的结果
+        result = tx.run(
+            "UNWIND range(0, size($ratings) - 1) AS seq "
+            "WITH seq, $ratings[seq] AS rating "
+            "CALL { "
+            "  WITH rating "
+            "  MATCH (r:Recipe {name: rating.name}) "
+            "  OPTIONAL MATCH (r)-[:CONTAINS]->(i:Ingredient) "
+            "  SET i.preference_score = (i.preference_score + rating.rating) / 2 "
+            "  WITH r, rating, avg(i.preference_score) AS avg_score "
+            "  SET r.preference_score = (r.preference_score + rating.rating + "
+            "  CASE WHEN avg_score IS NULL OR avg_score = 0 THEN 0.6 ELSE avg_score END) / 3 "
+            "  RETURN r.preference_score AS score "
+            "} "
+            "RETURN seq, rating.name AS name, score ORDER BY seq",
+            ratings=[{"name": name, "rating": rating} for name, rating in ratings]
+        )
+        return [(record["name"], record["score"]) for record in result]
+
+    def apply_rating_locally(self, recipe_name: str, rating: float, notify: bool = True):
+        """
+        只在内存中应用一条评分（与 update_pref 的公式相同）并更新优先队列，不访问数据库。
+        返回食谱的新评分，食谱不在优先队列中时返回 None。
+        notify 为 False 时不调用排名的更新回调，由调用方稍后调用 ranking.notify。
+        """
+        scores = self.nutrition_index.ingredient_scores
+        ingredient_scores = []
+        for name in set(self.nutrition_index.ingredient_names(recipe_name)):
+            if scores.get(name) is not None:
+                scores[name] = (scores[name] + rating) / 2
+                ingredient_scores.append(scores[name])
+
+        old_score = self.ranking.score(recipe_name)
+        if old_score is None:
+            return None
+
+        avg_score = sum(ingredient_scores) / len(ingredient_scores) if ingredient_scores else 0
+        new_score = (old_score + rating + (avg_score or 0.6)) / 3
+        self.ranking.update(recipe_name, new_score, notify=notify)
+        return new_score
+
+    def recipe_section(self, recipe_name: str, ratio: float = 1.0, weight_step: int = 1) -> str:
+        """
+        生成提示词中单个食谱的段落。
+        weight_step > 1 时食材重量按该步长四舍五入（小于步长的保持原值），
+        比例相近的请求得到相同的提示词，便于缓存大模型的回答。
+        """
+        ingredients = self.get_recipe_ingredients(recipe_name, ratio)
+        lines = []
+        for ing in ingredients:
+            weight = ing['weight']
+            if weight_step > 1 and weight >= weight_step:
+                weight = int(weight_step * round(weight / weight_step))
+            lines.append(f"- {ing['name']}: {weight}g")
+        ingredients_list = "\n".join(lines)
+
+        return f"""
+食谱：{recipe_name}
+食材（请严格按照以下重量准备）：
+{ingredients_list}
+"""
+
+    def generate_prompt(self, recommendations: List[str], meal_type: str = "lunch", ratios: List[float] = [1.0, 1.0, 1.0],
+                        weight_step: int = 1) -> str:
         """
         Generate a prompt for LLM to provide cooking instructions for recommended recipes.
         Includes:
@@ -355,23 +678,16 @@ class KnowledgeGraph:
         Args:
             recommendations: List of recommended recipe names
             meal_type: Type of meal (breakfast/lunch/dinner)
+            weight_step: 食材重量的取整步长（克），见 recipe_section
         
         Returns:
             str: Concise prompt for LLM focused on cooking instructions
         """
         # Prepare detailed recipes section
-        recipes_details = []
-        for i, recipe_name in enumerate(recommendations):
-            ingredients = self.get_recipe_ingredients(recipe_name, ratios[i])
-            ingredients_list = "\n".join(
-                f"- {ing['name']}: {ing['weight']}g" for ing in ingredients
-            )
-            
-            recipes_details.append(f"""
-食谱：{recipe_name}
-食材（请严格按照以下重量准备）：
-{ingredients_list}
-""")
+        recipes_details = [
+            self.recipe_section(recipe_name, ratios[i], weight_step)
+            for i, recipe_name in enumerate(recommendations)
+        ]
 
         recipes_section = "\n".join(recipes_details)
 
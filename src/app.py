@@ -1,27 +1,69 @@
 import requests
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 #from gevent import pywsgi
 import os
 import csv
+import atexit
+import logging
 from KG import KnowledgeGraph
+from feedback import FeedbackQueue, FeedbackQueueFull
+from llm_cache import InstructionCache, content_key, join_fragments
+from recommendation_cache import RecommendationCache
+from meal_plan_table import MealPlanStore
+from predict_glucose import get_predictor
+from tracing import configure_logging, span, tracer
 from openai import OpenAI
 from dotenv import load_dotenv
-import json
-from functools import lru_cache
+import time
+from contextlib import contextmanager
 
 # 加载环境变量
 load_dotenv()
-
-# 禁用 TensorFlow oneDNN 警告
-os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
+# 日志以 JSON 行输出（级别见 LOG_LEVEL），各阶段耗时记录到 tracing（导出文件见 TRACE_FILE）
+configure_logging()
+logger = logging.getLogger(__name__)
+atexit.register(tracer.close)
 
 app = Flask(__name__)
 CORS(app)
 
-# 初始化知识图谱
-kg = KnowledgeGraph("bolt://localhost:7687", "neo4j", "2winadmin")
+# 启动时加载血糖预测模型，并与知识图谱共享同一实例
+predictor = get_predictor()
+
+# 初始化知识图谱（连接地址、账号和连接池参数见 KnowledgeGraph.from_env）
+kg = KnowledgeGraph.from_env(predictor=predictor)
+atexit.register(kg.close)
+# 评分子进程以 fork 启动，必须在下面的评分写回线程和请求线程启动之前创建（asgi.py 导入本模块时同样执行）
+if kg.parallel_scorer is not None:
+    kg.parallel_scorer.start()
+
+# 评分先更新内存排名，再由后台线程批量写回 Neo4j；设置 FEEDBACK_WRITE_BEHIND=0 时同步写入
+if os.getenv("FEEDBACK_WRITE_BEHIND", "1") == "1":
+    feedback = FeedbackQueue(
+        kg,
+        batch_size=int(os.getenv("FEEDBACK_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "2.0")),
+        max_pending=int(os.getenv("FEEDBACK_MAX_PENDING", "10000")),
+    )
+    atexit.register(feedback.close)  # atexit 后注册先执行，先写完评分再关闭 driver
+else:
+    feedback = None
 meal_type_default = "lunch"  # 默认餐次
+# 组合搜索方式："exhaustive" 穷举全部组合取最优，"sampling" 为旧的随机抽样
+RECOMMEND_SEARCH = os.getenv("RECOMMEND_SEARCH", "exhaustive")
+# 按分桶后的用户画像缓存推荐结果（只用于结果确定的穷举搜索，REC_CACHE=0 关闭）；
+# 食谱偏好分更新时失效依赖该食谱的条目
+if RECOMMEND_SEARCH == "exhaustive" and os.getenv("REC_CACHE", "1") == "1":
+    recommendation_cache = RecommendationCache.from_env()
+    kg.ranking.subscribe(recommendation_cache.invalidate_recipe)
+else:
+    recommendation_cache = None
+# 离线预计算的推荐表（MEAL_PLAN_TABLE=1 开启，见 meal_plan_table.py）；网格内的输入直接查表，
+# 候选池变化时表在后台增量更新，更新完成前回退到实时计算
+meal_plan = MealPlanStore.from_env(kg.ratio_mode) if RECOMMEND_SEARCH == "exhaustive" else None
+if meal_plan is not None:
+    kg.ranking.subscribe(lambda recipe_name: meal_plan.schedule_update(kg))
 recipes = []
 
 # CSV 数据存储路径
@@ -30,20 +72,22 @@ USER_BLOOD_GLUC_DATA_PATH = "../data/user_blood_glucose_data.csv"
 # DeepSeek API配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 if not DEEPSEEK_API_KEY:
-    print("警告：未设置 DEEPSEEK_API_KEY 环境变量，请检查 .env 文件")
+    logger.warning("未设置 DEEPSEEK_API_KEY 环境变量，请检查 .env 文件")
     DEEPSEEK_API_KEY = "your_api_key_here"  # 临时使用默认值，请替换为您的实际 API key
 
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+DEEPSEEK_MODEL = "deepseek-chat"
+
+# 烹饪说明缓存（配置见 InstructionCache.from_env，LLM_CACHE=off 关闭）
+# 默认按精确的食材重量生成提示词，只有完全相同的提示词才共用缓存；设置 LLM_CACHE_WEIGHT_STEP（克，
+# 例如 5）时提示词中的重量按该步长取整，比例相近的请求可以共用缓存，但用户看到的重量也会随之取整
+instruction_cache = InstructionCache.from_env()
+PROMPT_WEIGHT_STEP = int(os.getenv("LLM_CACHE_WEIGHT_STEP", "1")) if instruction_cache else 1
 
 # 服务器API配置
 SERVER_API_URL = "http://e9790bb22df84f8cae565d9b24c0eabe.cloud.lanyun.net:10086"  # 替换为您的服务器地址
 
-# 缓存食谱推荐结果
-@lru_cache(maxsize=100)
-def get_cached_recommendations(meal_type, user_data_str):
-    user_data = json.loads(user_data_str)
-    return kg.recommend_recipes(user_data, meal_type)
-
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -52,6 +96,207 @@ def index():
 def data():
     return render_template("data.html")
 
+RECIPE_SYSTEM_PROMPT = "你是一个专业的糖尿病饮食营养师，请根据用户的需求和健康数据，提供详细的食谱建议。"
+QUESTION_SYSTEM_PROMPT = "你是一个糖尿病领域专家，请根据用户的情况和问题提供专业的建议。回答要详细、专业且易懂。"
+
+def is_recipe_request(message):
+    """如果消息中包含"推荐"和"食谱"等关键词，则认为是食谱推荐请求"""
+    return ("推荐" in message and "食谱" in message) or \
+           ("吃什么" in message) or \
+           ("推荐" in message and ("早餐" in message or "午餐" in message or "晚餐" in message))
+
+def parse_meal_type(message):
+    """解析餐次信息，若没有明确说明则默认使用午餐"""
+    if "早餐" in message or "早饭" in message:
+        return "breakfast"
+    elif "午餐" in message or "午饭" in message or "中午" in message:
+        return "lunch"
+    elif "晚餐" in message or "晚饭" in message or "晚上" in message:
+        return "dinner"
+    return meal_type_default
+
+class StageTimer:
+    """
+    记录一次请求中各处理阶段的耗时（秒）。
+    整个请求是 tracing 中的一个根 span，每个阶段是它的子 span；阶段显式挂到根 span 下
+    （流式接口中部分阶段在 asyncio.to_thread 的线程中执行），阶段内（例如 Neo4j 查询、
+    血糖预测）的 span 再自动挂到阶段下。
+    """
+
+    def __init__(self, name="chat"):
+        self.timings = {}
+        self.root = tracer.start(name)
+        self._start = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        start = time.perf_counter()
+        try:
+            with span(name, parent=self.root, **attributes) as stage_span:
+                yield stage_span
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def record(self, name, seconds, **attributes):
+        """记录在别处计时的阶段，例如流式响应的首个 token 延迟"""
+        self.timings[name] = seconds
+        tracer.record(name, seconds, parent=self.root, **attributes)
+
+    def fail(self, error):
+        """请求出错时结束根 span，并记下异常类型"""
+        self.root.set("error", type(error).__name__)
+        self.summary()
+
+    def summary(self):
+        total = time.perf_counter() - self._start
+        if not self._finished:
+            self._finished = True
+            tracer.finish(self.root, total)
+        return dict(self.timings, total=total)
+
+def recommend(message, user_data, timer):
+    """执行食谱推荐，返回 (餐次, 食谱列表, 缩放比例, 评分信息)"""
+    meal_type = parse_meal_type(message)
+    with timer.stage("recommend", meal_type=meal_type, search=RECOMMEND_SEARCH) as stage:
+        planned = meal_plan.lookup(kg, user_data, meal_type) if meal_plan is not None else None
+        if planned is not None:
+            recipes, ratio, information = planned
+            stage.set("source", "meal_plan")
+        elif recommendation_cache is None:
+            recipes, ratio, information = kg.recommend_recipes(user_data, meal_type, search=RECOMMEND_SEARCH)
+            stage.set("source", "search")
+        else:
+            recipes, ratio, information = recommendation_cache.recommend(kg, user_data, meal_type)
+            stage.set("source", "recommendation_cache")
+    logger.info(
+        "Recommended recipes",
+        extra={"meal_type": meal_type, "recipes": recipes, "health_score": information["health_score"]},
+    )
+    return meal_type, recipes, ratio, information
+
+def recipe_messages(recipes, meal_type, ratio, timer, stage_name="prompt"):
+    """
+    生成给 DeepSeek 的对话消息；食材数据来自推荐时已加载的内存索引，不再查询数据库。
+    耗时记录在 stage_name 阶段，同一请求中每个阶段名只记录一次。
+    """
+    with timer.stage(stage_name, recipes=len(recipes)) as stage:
+        prompt = kg.generate_prompt(recipes, meal_type, ratio, weight_step=PROMPT_WEIGHT_STEP)
+        stage.set("prompt_chars", len(prompt))
+    return [
+        {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def recipe_metadata(recipes, meal_type, information):
+    """返回给前端的推荐结果和营养数据"""
+    return {
+        "recipes": recipes,
+        "mealType": meal_type,
+        "health_score": information["health_score"],
+        "energy": information["energy"],
+        "PBG": information["PBG"],
+        "carb": information["carb"],
+        "protein": information["protein"],
+        "fat": information["fat"],
+        "fiber": information["fiber"]
+    }
+
+def create_completion(messages, max_tokens, timer):
+    """同步调用 DeepSeek 并返回回答文本，耗时记录在 llm 阶段"""
+    with timer.stage("llm", model=DEEPSEEK_MODEL, max_tokens=max_tokens) as stage:
+        response = client.chat.completions.create(
+            model=DEEPSEEK_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=False
+        )
+        if getattr(response, "usage", None) is not None:
+            stage.set("prompt_tokens", response.usage.prompt_tokens)
+            stage.set("completion_tokens", response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+def instruction_key(messages):
+    """整体缓存的键：模型和完整的对话消息"""
+    return content_key(DEEPSEEK_MODEL, messages)
+
+def fragment_keys(recipes, meal_type, ratio):
+    """片段缓存的键：每个食谱的餐次和提示词段落"""
+    return [
+        content_key(DEEPSEEK_MODEL, meal_type, kg.recipe_section(name, ratio[i], PROMPT_WEIGHT_STEP))
+        for i, name in enumerate(recipes)
+    ]
+
+def store_instructions(key, text, recipes, meal_type, ratio):
+    """缓存新生成的完整回答，开启片段复用时同时按食谱切分缓存"""
+    instruction_cache.put(key, text)
+    if instruction_cache.fragments:
+        instruction_cache.put_fragments(fragment_keys(recipes, meal_type, ratio), text, recipes)
+
+def recipe_instructions(recipes, meal_type, ratio, timer):
+    """
+    返回 (烹饪说明, 缓存状态)，缓存状态为 "hit"、"partial"、"miss" 或 "off"。
+    开启片段复用且部分食谱已有缓存片段时，只为其余食谱调用 DeepSeek。
+    """
+    messages = recipe_messages(recipes, meal_type, ratio, timer)
+    if instruction_cache is None:
+        return create_completion(messages, 2000, timer), "off"
+
+    key = instruction_key(messages)
+    text = instruction_cache.get(key)
+    if text is not None:
+        return text, "hit"
+
+    if instruction_cache.fragments:
+        keys = fragment_keys(recipes, meal_type, ratio)
+        fragments = instruction_cache.get_fragments(keys)
+        missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+        if len(missing) < len(recipes):
+            if missing:
+                missing_names = [recipes[i] for i in missing]
+                # 只为缺少片段的食谱重新生成提示词，耗时单独记录，不覆盖整体提示词的 prompt 阶段
+                sub_messages = recipe_messages(missing_names, meal_type, [ratio[i] for i in missing], timer,
+                                               stage_name="prompt_missing")
+                sub_text = create_completion(sub_messages, 2000, timer)
+                parts = instruction_cache.put_fragments([keys[i] for i in missing], sub_text, missing_names)
+                if parts is None:
+                    # 新生成的回答无法按食谱切分时，整体附在已缓存片段之后
+                    fragments = [fragment for fragment in fragments if fragment is not None] + [sub_text]
+                else:
+                    for i, part in zip(missing, parts):
+                        fragments[i] = part
+            text = join_fragments(fragments)
+            instruction_cache.put(key, text)
+            return text, "partial"
+
+    text = create_completion(messages, 2000, timer)
+    store_instructions(key, text, recipes, meal_type, ratio)
+    return text, "miss"
+
+def question_messages(message, user_data):
+    """构建普通问题的对话消息"""
+    # 构建用户信息字符串
+    user_info = ""
+    if user_data:
+        user_info = f"""
+用户信息：
+- 身高：{user_data.get('height')}cm
+- 体重：{user_data.get('weight')}kg
+- 年龄：{user_data.get('age')}岁
+- 性别：{user_data.get('gender')}
+- 餐前血糖：{user_data.get('pre_meal_glucose')}mmol/L
+- 餐前胰岛素：{user_data.get('pre_meal_insulin')}单位
+- 运动水平：{user_data.get('activity_level')}
+"""
+    return [
+        {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"{user_info}\n问题：{message}\n\n请提供专业的回答，包括：\n1. 针对问题的直接回答\n2. 相关的健康建议\n3. 需要注意的事项"
+        }
+    ]
+
 @app.route("/chat", methods=["POST"])
 def chat():
     """
@@ -65,128 +310,105 @@ def chat():
     判断逻辑：
     - 如果消息中包含"推荐"和"食谱"，则认为是食谱推荐请求，进一步解析餐次信息；
     - 否则认为是普通问题，调用 DeepSeek API 回答。
+    需要流式返回时使用 ASGI 服务（asgi.py）中的 /chat/stream。
     """
     try:
         data = request.get_json()
         message = data.get("message", "")
         user_data = data.get("user_data", {})
 
-        print(f"Received message: {message}")
-        print(f"User data: {user_data}")
+        # 只记录请求的概况，不输出用户的健康数据
+        recipe_request = is_recipe_request(message)
+        logger.info(
+            "Received chat request",
+            extra={"message_chars": len(message), "recipe_request": recipe_request, "has_user_data": bool(user_data)},
+        )
+        timer = StageTimer()
+        timer.root.set("recipe_request", recipe_request)
 
         # 判断是否为食谱推荐请求
-        if ("推荐" in message and "食谱" in message) or \
-           ("吃什么" in message) or \
-           ("推荐" in message and ("早餐" in message or "午餐" in message or "晚餐" in message)):
+        if recipe_request:
             try:
-                # 解析餐次信息，若没有明确说明则默认使用午餐
-                if "早餐" in message or "早饭" in message:
-                    meal_type = "breakfast"
-                elif "午餐" in message or "午饭" in message or "中午" in message:
-                    meal_type = "lunch"
-                elif "晚餐" in message or "晚饭" in message or "晚上" in message:
-                    meal_type = "dinner"
-                else:
-                    meal_type = meal_type_default
-                
-                print(f"Selected meal type: {meal_type}")
-                
-                recipes, ratio, information = kg.recommend_recipes(user_data, meal_type)
-                print(f"Recommended recipes: {recipes}")
-                print(f"Recipe information: {information}")
-                
-                prompt = kg.generate_prompt(recipes, meal_type, ratio)
-                print("Generated prompt for DeepSeek")
+                meal_type, recipes, ratio, information = recommend(message, user_data, timer)
+
+                with timer.stage("metadata"):
+                    metadata = recipe_metadata(recipes, meal_type, information)
                 
                 try:
-                    response = client.chat.completions.create(
-                        model="deepseek-chat",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的糖尿病饮食营养师，请根据用户的需求和健康数据，提供详细的食谱建议。"
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        temperature=0.7,
-                        max_tokens=2000,
-                        stream=False
+                    # 在请求线程中直接调用，并发数由 Web 服务器的线程数决定
+                    recipe_response, cache_status = recipe_instructions(recipes, meal_type, ratio, timer)
+                    timer.root.set("llm_cache", cache_status)
+
+                    timings = timer.summary()
+                    logger.info(
+                        "Recipe response ready",
+                        extra={"llm_cache": cache_status, "response_chars": len(recipe_response), "timings": timings},
                     )
-                    print("DeepSeek API response received")
                     
-                    recipe_response = response.choices[0].message.content
-                    print(f"DeepSeek response content: {recipe_response[:100]}...")  # 只打印前100个字符
-                    
-                    return jsonify({
-                        "message": recipe_response,
-                        "recipes": recipes,
-                        "mealType": meal_type,
-                        "health_score": information["health_score"],
-                        "energy": information["energy"],
-                        "PBG": information["PBG"],
-                        "carb": information["carb"],
-                        "protein": information["protein"],
-                        "fat": information["fat"],
-                        "fiber": information["fiber"]
-                    })
+                    return jsonify({"message": recipe_response, **metadata, "timings": timings, "llm_cache": cache_status})
                     
                 except Exception as e:
-                    print(f"DeepSeek API error: {str(e)}")
+                    logger.exception("DeepSeek API error")
+                    timer.fail(e)
                     return jsonify({"error": f"DeepSeek API请求失败: {str(e)}"}), 500
                     
             except Exception as e:
-                print(f"Recipe recommendation error: {str(e)}")
+                logger.exception("Recipe recommendation error")
+                timer.fail(e)
                 return jsonify({"error": f"食谱推荐失败: {str(e)}"}), 500
 
         else:
             try:
-                # 构建用户信息字符串
-                user_info = ""
-                if user_data:
-                    user_info = f"""
-用户信息：
-- 身高：{user_data.get('height')}cm
-- 体重：{user_data.get('weight')}kg
-- 年龄：{user_data.get('age')}岁
-- 性别：{user_data.get('gender')}
-- 餐前血糖：{user_data.get('pre_meal_glucose')}mmol/L
-- 餐前胰岛素：{user_data.get('pre_meal_insulin')}单位
-- 运动水平：{user_data.get('activity_level')}
-"""
-
                 # 调用 DeepSeek API 回答问题
-                response = client.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "你是一个糖尿病领域专家，请根据用户的情况和问题提供专业的建议。回答要详细、专业且易懂。"
-                        },
-                        {
-                            "role": "user",
-                            "content": f"{user_info}\n问题：{message}\n\n请提供专业的回答，包括：\n1. 针对问题的直接回答\n2. 相关的健康建议\n3. 需要注意的事项"
-                        }
-                    ],
-                    temperature=0.7,
-                    max_tokens=1000,
-                    stream=False
-                )
-                
-                answer = response.choices[0].message.content
+                answer = create_completion(question_messages(message, user_data), 1000, timer)
+                logger.info("Question answered", extra={"response_chars": len(answer), "timings": timer.summary()})
                 
                 return jsonify({"message": answer})
                 
             except Exception as e:
-                print(f"Question answering error: {str(e)}")
+                logger.exception("Question answering error")
+                timer.fail(e)
                 return jsonify({"error": f"回答问题失败: {str(e)}"}), 500
                 
     except Exception as e:
-        print(f"General error in chat endpoint: {str(e)}")
+        logger.exception("General error in chat endpoint")
         return jsonify({"error": f"处理请求时发生错误: {str(e)}"}), 500
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus 文本格式的各阶段耗时分位数（p50/p90/p99）、次数和错误数"""
+    return Response(tracer.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics/stages")
+def stage_metrics():
+    """各阶段耗时的 JSON 汇总，与 /metrics 相同"""
+    return jsonify(tracer.stage_summary())
+
+@app.route("/metrics/neo4j")
+def neo4j_metrics():
+    """Neo4j 会话/连接池使用情况，供运维排查连接池耗尽"""
+    return jsonify(kg.session_metrics.snapshot())
+
+@app.route("/metrics/feedback")
+def feedback_metrics():
+    """评分写后队列的深度和批量写入耗时"""
+    return jsonify(feedback.metrics() if feedback else {"write_behind": False})
+
+@app.route("/metrics/recommendation-cache")
+def recommendation_cache_metrics():
+    """推荐缓存的命中率、条目数、淘汰和失效次数"""
+    return jsonify(recommendation_cache.metrics() if recommendation_cache else {"enabled": False})
+
+@app.route("/metrics/meal-plan")
+def meal_plan_metrics():
+    """离线推荐表的命中、回退和增量更新情况"""
+    return jsonify(meal_plan.metrics() if meal_plan else {"enabled": False})
+
+@app.route("/metrics/llm-cache")
+def llm_cache_metrics():
+    """烹饪说明缓存的命中率、条目数和淘汰情况"""
+    return jsonify(instruction_cache.metrics() if instruction_cache else {"enabled": False})
+
 @app.route("/api/user-data", methods=["POST"])
 def handle_user_data():
     user_data = request.get_json()
@@ -195,16 +417,19 @@ def handle_user_data():
 @app.route("/update-pref", methods=["POST"])
 def update_pref():
     data = request.get_json()
-    print(f"Received update_pref data: {data}")
     recipe_name = data.get("recipe")
     rating = data.get("rating")
+    logger.info("Received rating", extra={"recipe": recipe_name, "rating": rating})
     
     if not recipe_name or rating is None:
         return jsonify({"error": "缺少必要参数"}), 400
     
     try:
-        result = kg.update_pref(rating, recipe_name)
+        with span("update_pref", write_behind=feedback is not None):
+            result = (feedback or kg).update_pref(rating, recipe_name)
         return jsonify({"message": result})
+    except FeedbackQueueFull:
+        return jsonify({"error": "评分提交过于频繁，请稍后重试"}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
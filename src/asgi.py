@@ -0,0 +1,129 @@
+"""
+ASGI 入口：在异步服务器上提供流式的 /chat/stream，其余路由仍由 Flask 应用处理。
+
+在 src 目录下运行：
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/chat/stream 以 Server-Sent Events 返回：
+- event: meta   食谱推荐请求的推荐结果和营养数据（本地计算，最先发送）
+- event: token  DeepSeek 返回的增量文本 {"content": "..."}
+- event: done   回答结束 {"timings": {...}}，各阶段耗时（秒）
+- event: error  出错信息 {"error": "..."}
+上游流在事件循环中异步读取，慢速的上游连接不会各自占用一个线程。
+提示词生成后立即发起 DeepSeek 请求，发送 meta 与等待首个 token 同时进行。
+烹饪说明整体命中缓存（llm_cache.py）时不请求 DeepSeek；流式接口不做片段拼接。
+"""
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import StreamingResponse
+from openai import AsyncOpenAI
+
+import app as flask_app
+
+logger = logging.getLogger(__name__)
+
+async_client = AsyncOpenAI(api_key=flask_app.DEEPSEEK_API_KEY, base_url=flask_app.DEEPSEEK_BASE_URL)
+
+app = FastAPI()
+
+
+def sse(event, data):
+    """编码一条 SSE 消息，数据统一用 JSON 以保留换行"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    data = await request.json()
+    message = data.get("message", "")
+    user_data = data.get("user_data", {})
+
+    async def events():
+        stream = None
+        stream_task = None
+        timer = flask_app.StageTimer("chat_stream")
+        try:
+            if flask_app.is_recipe_request(message):
+                # 推荐只读内存，耗时很短，放到线程池中执行以免阻塞事件循环
+                meal_type, recipes, ratio, information = await asyncio.to_thread(
+                    flask_app.recommend, message, user_data, timer
+                )
+                messages = flask_app.recipe_messages(recipes, meal_type, ratio, timer)
+                max_tokens = 2000
+                cache = flask_app.instruction_cache
+                cache_key = flask_app.instruction_key(messages) if cache else None
+                cached = cache.get(cache_key) if cache else None
+                if cached is not None:
+                    # 整体命中缓存时不请求 DeepSeek，一次发送完整回答
+                    yield sse("meta", flask_app.recipe_metadata(recipes, meal_type, information))
+                    yield sse("token", {"content": cached})
+                    timer.root.set("llm_cache", "hit")
+                    yield sse("done", {"timings": timer.summary(), "llm_cache": "hit"})
+                    return
+            else:
+                recipes = None
+                cache_key = None
+                messages = flask_app.question_messages(message, user_data)
+                max_tokens = 1000
+
+            # 先发起上游请求，再组装并发送 meta，二者重叠进行
+            llm_start = time.perf_counter()
+            stream_task = asyncio.create_task(async_client.chat.completions.create(
+                model=flask_app.DEEPSEEK_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True
+            ))
+            if recipes is not None:
+                with timer.stage("metadata"):
+                    metadata = flask_app.recipe_metadata(recipes, meal_type, information)
+                yield sse("meta", metadata)
+
+            stream = await stream_task
+            parts = []
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if "llm_first_token" not in timer.timings:
+                        timer.record("llm_first_token", time.perf_counter() - llm_start)
+                    parts.append(chunk.choices[0].delta.content)
+                    yield sse("token", {"content": chunk.choices[0].delta.content})
+            timer.record("llm", time.perf_counter() - llm_start, model=flask_app.DEEPSEEK_MODEL,
+                         max_tokens=max_tokens, chunks=len(parts))
+            done = {}
+            if cache_key is not None:
+                # 完整收到回答后才写入缓存，客户端中途断开的回答不会被缓存
+                await asyncio.to_thread(
+                    flask_app.store_instructions, cache_key, "".join(parts), recipes, meal_type, ratio
+                )
+                done["llm_cache"] = "miss"
+                timer.root.set("llm_cache", "miss")
+            timings = timer.summary()
+            logger.info("Stream finished", extra={"timings": timings})
+            yield sse("done", {"timings": timings, **done})
+
+        except Exception as e:
+            logger.exception("Streaming chat error")
+            timer.fail(e)
+            yield sse("error", {"error": f"处理请求时发生错误: {str(e)}"})
+        finally:
+            # 客户端断开时取消尚未建立的上游请求，或关闭已建立的上游连接
+            if stream is not None:
+                await stream.close()
+            elif stream_task is not None:
+                stream_task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# 其余页面和接口交给原有的 Flask 应用
+app.mount("/", WSGIMiddleware(flask_app.app))
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackQueueFull(Exception):
+    """待写入的评分超过上限，调用方应稍后重试"""
+
+
+class FeedbackQueue:
+    """
+    评分的写后（write-behind）队列。
+
+    评分提交后立即在内存中更新食谱排名（KnowledgeGraph.apply_rating_locally），
+    然后由后台线程在累计 batch_size 条或每隔 flush_interval 秒时，
+    用一条 UNWIND 语句批量写回 Neo4j（KnowledgeGraph.update_prefs）。
+
+    - 所有评分按提交顺序排队并按顺序写入，同一食谱的多次评分不会乱序；
+    - 待写入的评分达到 max_pending 时，submit 最多等待 submit_timeout 秒，
+      仍无空位则抛出 FeedbackQueueFull；
+    - 写入失败的批次放回队首，下次重试；
+    - close() 会写完所有剩余评分，应在进程退出前调用。
+    """
+
+    def __init__(self, kg, batch_size: int = 100, flush_interval: float = 2.0,
+                 max_pending: int = 10000, submit_timeout: float = 1.0):
+        self.kg = kg
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+
+        self._pending = deque()
+        # 每个食谱已在内存生效但尚未写入数据库的评分数
+        self._unflushed = Counter()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+
+        self.submitted_total = 0
+        self.rejected_total = 0
+        self.flushed_total = 0
+        self.flush_count = 0
+        self.flush_failures = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="feedback-flusher", daemon=True)
+        self._thread.start()
+
+    def update_pref(self, rating, recipe_name: str) -> str:
+        """与 KnowledgeGraph.update_pref 接口和提示信息相同，但只排队、不同步写数据库"""
+        try:
+            rating = float(rating)
+        except ValueError:
+            return "请输入有效的数值。"
+        if not 0 <= rating <= 10:
+            return "评分必须在 0 到 10 之间。"
+        if not self._known(recipe_name):
+            return "未找到该食谱。"
+
+        self.submit(recipe_name, rating)
+        return "感谢您的评分！食谱和食材的偏好评分已更新。"
+
+    def _known(self, recipe_name: str) -> bool:
+        """食谱在启动时从数据库加载过（在排名或食材营养索引中）；未知食谱的评分不排队"""
+        return self.kg.ranking.score(recipe_name) is not None or recipe_name in self.kg.nutrition_index
+
+    def submit(self, recipe_name: str, rating: float):
+        """
+        提交一条评分，立即更新内存中的排名。未知的食谱（见 _known）不排队，直接返回 None。
+
+        返回:
+        食谱在内存中的新评分（食谱不在排名中时为 None）
+        """
+        if not self._known(recipe_name):
+            return None
+        deadline = time.monotonic() + self.submit_timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("评分队列已关闭")
+            while len(self._pending) >= self.max_pending:
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if len(self._pending) >= self.max_pending:
+                        self.rejected_total += 1
+                        raise FeedbackQueueFull(f"待写入评分已达上限 {self.max_pending}")
+
+            # 在同一把锁内入队并更新内存，保证内存中的生效顺序与写库顺序一致
+            self._pending.append((recipe_name, rating))
+            self._unflushed[recipe_name] += 1
+            self.submitted_total += 1
+            new_score = self.kg.apply_rating_locally(recipe_name, rating, notify=False)
+
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        # 排名的更新回调（缓存失效、计划表更新）在锁外调用，不阻塞其他提交和写回
+        if new_score is not None:
+            self.kg.ranking.notify(recipe_name)
+        return new_score
+
+    def flush(self) -> int:
+        """立即写入一批待写评分，返回写入条数"""
+        with self._flush_lock:
+            with self._cond:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                results = self.kg.update_prefs(batch)
+            except Exception:
+                with self._cond:
+                    self._pending.extendleft(reversed(batch))
+                    self.flush_failures += 1
+                raise
+            elapsed = time.perf_counter() - start
+
+            corrected = []
+            with self._cond:
+                for recipe_name, _ in batch:
+                    self._unflushed[recipe_name] -= 1
+                    if self._unflushed[recipe_name] <= 0:
+                        del self._unflushed[recipe_name]
+                # 以数据库返回的评分为准校正内存排名，只校正与内存值不同的食谱；
+                # 若该食谱还有更新的评分在排队，则保留内存值
+                for recipe_name, score in results:
+                    if recipe_name not in self._unflushed and self.kg.ranking.score(recipe_name) != score:
+                        self.kg.ranking.update(recipe_name, score, notify=False)
+                        corrected.append(recipe_name)
+
+                self.flushed_total += len(batch)
+                self.flush_count += 1
+                self.flush_seconds_total += elapsed
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self._cond.notify_all()
+            for recipe_name in corrected:
+                self.kg.ranking.notify(recipe_name)
+            return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("评分批量写入失败，稍后重试", extra={"pending": len(self._pending)})
+                with self._cond:
+                    if not self._closed:
+                        self._cond.wait(self.flush_interval)
+
+    def close(self):
+        """停止后台线程并写入所有剩余评分"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        while self.flush():
+            pass
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {
+                "depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "submitted_total": self.submitted_total,
+                "rejected_total": self.rejected_total,
+                "flushed_total": self.flushed_total,
+                "flush_count": self.flush_count,
+                "flush_failures": self.flush_failures,
+                "flush_seconds_total": self.flush_seconds_total,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+            }
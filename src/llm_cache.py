@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 修改提示词格式或切分规则时加一，使旧缓存全部失效
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "llm_cache.sqlite3")
+
+
+def content_key(*parts) -> str:
+    """按内容计算缓存键：相同的模型、提示词和参数得到相同的键"""
+    payload = json.dumps([CACHE_VERSION, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """进程内的 LRU 存储，超过 max_entries 时淘汰最久未访问的条目"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, value: str, created_at: float) -> int:
+        """写入一条记录，返回因容量淘汰的条目数"""
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    SQLite 文件存储，重启后缓存仍然有效。
+    accessed_at 记录最近一次读取时间，超过 max_entries 时按它淘汰最久未访问的条目。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS instructions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS instructions_accessed ON instructions (accessed_at)")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM instructions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE instructions SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+            return row
+
+    def put(self, key: str, value: str, created_at: float) -> int:
+        """写入一条记录，返回因容量淘汰的条目数"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO instructions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, created_at, created_at),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM instructions").fetchone()
+            if count <= self.max_entries:
+                return 0
+            return self._conn.execute(
+                "DELETE FROM instructions WHERE key IN "
+                "(SELECT key FROM instructions ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM instructions WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM instructions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class InstructionCache:
+    """
+    大模型烹饪说明的缓存。
+
+    整体缓存以完整的对话消息（模型、系统提示词、用户提示词）为键，提示词中的食材重量
+    已按 KnowledgeGraph.recipe_section 的步长取整，比例相近的同一组食谱命中同一条记录。
+
+    fragments=True 时还按单个食谱（餐次 + 食谱段落）缓存说明片段：三个食谱中只有一个
+    变化时，只需让大模型生成变化的那一个，再与缓存的片段拼接。片段从回答中按食谱名
+    标题切分，切分不出来时不缓存片段，不影响整体缓存。
+
+    ttl 为条目的最长有效期（秒），过期的条目在读取时删除。
+    """
+
+    def __init__(self, backend, ttl: float = 7 * 24 * 3600, fragments: bool = False):
+        self.backend = backend
+        self.ttl = ttl
+        self.fragments = fragments
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["InstructionCache"]:
+        """
+        按环境变量创建缓存：
+        LLM_CACHE=memory（默认）/ sqlite / off，LLM_CACHE_PATH 为 SQLite 文件路径，
+        LLM_CACHE_MAX_ENTRIES、LLM_CACHE_TTL（秒）、LLM_CACHE_FRAGMENTS=1 开启片段复用。
+        """
+        mode = os.getenv("LLM_CACHE", "memory")
+        if mode == "off":
+            return None
+        max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        if mode == "sqlite":
+            backend = SQLiteBackend(os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH), max_entries)
+        elif mode == "memory":
+            backend = MemoryBackend(max_entries)
+        else:
+            raise ValueError(f"未知的 LLM_CACHE 模式: {mode}")
+        return cls(
+            backend,
+            ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            fragments=os.getenv("LLM_CACHE_FRAGMENTS", "0") == "1",
+        )
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.backend.delete(key)
+            with self._lock:
+                self.expirations += 1
+            return None
+        return value
+
+    def _put(self, key: str, value: str):
+        evicted = self.backend.put(key, value, time.time())
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        self._put(key, value)
+
+    def get_fragments(self, keys: List[str]) -> List[Optional[str]]:
+        values = [self._get(key) for key in keys]
+        with self._lock:
+            found = sum(value is not None for value in values)
+            self.fragment_hits += found
+            self.fragment_misses += len(values) - found
+        return values
+
+    def put_fragments(self, keys: List[str], text: str, recipe_names: List[str]) -> Optional[List[str]]:
+        """把包含 recipe_names 各食谱说明的回答切分后分别缓存，返回切分出的片段，切分失败时返回 None"""
+        parts = split_fragments(text, recipe_names)
+        if parts is not None:
+            for key, part in zip(keys, parts):
+                self._put(key, part)
+        return parts
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "entries": len(self.backend),
+                "ttl": self.ttl,
+                "fragments": self.fragments,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "fragment_hits": self.fragment_hits,
+                "fragment_misses": self.fragment_misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def split_fragments(text: str, recipe_names: List[str]) -> Optional[List[str]]:
+    """
+    按食谱名标题切分回答，返回与 recipe_names 一一对应的片段。
+    标题是以食谱名开头的行（允许前面有 Markdown 标记和序号），且必须按给定顺序出现；
+    只有一个食谱时整个回答就是它的片段。
+    """
+    if len(recipe_names) == 1:
+        return [text.strip()]
+
+    starts = []
+    pos = 0
+    for name in recipe_names:
+        match = re.compile(r"^[ \t#*>\d.、:：-]*(?:食谱[:：]\s*)?" + re.escape(name), re.M).search(text, pos)
+        if match is None:
+            return None
+        starts.append(match.start())
+        pos = match.end()
+    ends = starts[1:] + [len(text)]
+    return [text[start:end].strip() for start, end in zip(starts, ends)]
+
+
+def join_fragments(fragments: List[str]) -> str:
+    return "\n\n".join(fragments)
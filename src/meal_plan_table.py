@@ -0,0 +1,467 @@
+"""
+离线预计算的推荐表。
+
+推荐的输入维度很低：每餐的碳水/蛋白质/脂肪需求和餐前血糖（餐次只决定取哪一餐的需求）。
+build 在这四个维度的网格上逐格运行与 rank_combinations 相同的穷举评分，保存每格健康评分
+最高的 k 个组合及其缩放比例、营养和血糖预测。表以 .npy 文件保存在一个目录中，服务时以
+内存映射方式打开，按输入四舍五入到最近的网格点 O(1) 取出该格的 k 个组合，再在用户的
+精确输入下重新评分这 k 个组合（只是 k 行的 NumPy 计算，不访问 Neo4j），取最优者。
+
+表依赖建表时各类别的候选食谱（每类前 10 个）。偏好分变化使候选池改变后，update 只重算
+受影响的部分：含有被移出候选池的食谱的格子整格重算，其余格子只评分含新进入食谱的组合，
+再与已保存的 k 个组合合并。表还依赖缩放比例的计算方式（KnowledgeGraph.ratio_mode），
+计算方式改变后 update 整表重建。候选池只比较成员：同一池内的名次变化不影响表中的组合。
+服务中的更新合并进行：一段时间内的多次评分只触发一次更新（见 MealPlanStore）。
+
+每次保存写入表目录下新的版本子目录，再原子地替换 CURRENT 文件指向它；正在内存映射的
+旧版本不会被改名或删除，之后的更新确认其不再使用时才删除（见 prune_versions）。
+
+生成和增量更新（在 src 目录下运行）：
+    python meal_plan_table.py build [--output ../data/meal_plan] [--k 10]
+    python meal_plan_table.py update
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "meal_plan")
+
+# 网格维度及每维的 (起点, 步长, 格数)
+GRID_AXES = ("carb", "protein", "fat", "pre_meal_glucose")
+DEFAULT_GRID = {
+    "carb": (40.0, 10.0, 15),
+    "protein": (16.0, 4.0, 15),
+    "fat": (8.0, 4.0, 11),
+    "pre_meal_glucose": (3.0, 1.0, 13),
+}
+
+# 每格保存的数组，第二维是按健康评分从高到低排列的 k 个组合
+_ARRAYS = ("triples", "health_scores", "ratios", "nutrition", "predicted_glucose")
+
+
+def _members(pools) -> Tuple[frozenset, ...]:
+    """候选池的成员，表中的组合与池内顺序无关"""
+    return tuple(frozenset(pool) for pool in pools)
+
+
+class MealPlanTable:
+    """
+    triples: (格数, k, 3) 的组合，值为 recipe_names 中的下标，空位为 -1
+    health_scores: (格数, k)，空位为 -inf
+    ratios: (格数, k, 3)；nutrition: (格数, k, 5)；predicted_glucose: (格数, k, 3)
+    pools: 建表（或最近一次更新）时的候选池 (主食, 蔬菜, 蛋白质)
+    ratio_mode: 建表时缩放比例的计算方式
+    directory: 从磁盘加载时所在的版本目录，新建的表为 None
+    """
+
+    def __init__(self, grid: Dict, recipe_names: List[str], pools, arrays: Dict[str, np.ndarray],
+                 ratio_mode: str = "heuristic", directory: str = None):
+        self.grid = {axis: tuple(grid[axis]) for axis in GRID_AXES}
+        self.recipe_names = list(recipe_names)
+        self._ids = {name: i for i, name in enumerate(self.recipe_names)}
+        self.pools = tuple(tuple(pool) for pool in pools)
+        self.ratio_mode = ratio_mode
+        self.directory = directory
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.shape = tuple(int(self.grid[axis][2]) for axis in GRID_AXES)
+        self.k = self.triples.shape[1]
+
+    @classmethod
+    def _empty(cls, grid: Dict, recipe_names: List[str], pools, k: int, ratio_mode: str) -> "MealPlanTable":
+        n_cells = int(np.prod([grid[axis][2] for axis in GRID_AXES]))
+        return cls(grid, recipe_names, pools, {
+            "triples": np.full((n_cells, k, 3), -1, dtype=np.int32),
+            "health_scores": np.full((n_cells, k), -np.inf),
+            "ratios": np.zeros((n_cells, k, 3)),
+            "nutrition": np.zeros((n_cells, k, 5)),
+            "predicted_glucose": np.zeros((n_cells, k, 3)),
+        }, ratio_mode)
+
+    def _cells(self):
+        """按格子编号顺序给出每格的 (营养需求, 餐前血糖)"""
+        values = [
+            start + step * np.arange(count)
+            for start, step, count in (self.grid[axis] for axis in GRID_AXES)
+        ]
+        for carb, protein, fat, glucose in itertools.product(*values):
+            yield {"carb": float(carb), "protein": float(protein), "fat": float(fat)}, float(glucose)
+
+    def cell(self, nutrient_needs: Dict, pre_meal_glucose) -> Optional[int]:
+        """输入对应的最近网格点编号，超出网格范围时返回 None"""
+        values = (nutrient_needs["carb"], nutrient_needs["protein"], nutrient_needs["fat"], pre_meal_glucose)
+        index = []
+        for axis, value in zip(GRID_AXES, values):
+            start, step, count = self.grid[axis]
+            i = int(round((float(value) - start) / step))
+            if not 0 <= i < count:
+                return None
+            index.append(i)
+        return int(np.ravel_multi_index(index, self.shape))
+
+    # ---- 建表与增量更新 ----
+
+    def _add_names(self, pools):
+        for name in (name for pool in pools for name in pool):
+            if name not in self._ids:
+                self._ids[name] = len(self.recipe_names)
+                self.recipe_names.append(name)
+
+    def _score(self, kg, pools, candidates, nutrient_needs, glucose):
+        """对候选组合评分，返回与 _ARRAYS 对应的各行数组"""
+        ratios, nutrition, predicted_glucose, health_scores = kg._score_candidates(
+            candidates, pools, {"pre_meal_glucose": glucose}, nutrient_needs
+        )
+        pool_ids = [np.array([self._ids[name] for name in pool], dtype=np.int32) for pool in pools]
+        triples = np.stack([pool_ids[c][candidates[:, c]] for c in range(3)], axis=1)
+        return triples, health_scores, ratios, nutrition, predicted_glucose
+
+    def _store(self, cell: int, rows):
+        """保存一格中评分最高的 k 行（评分相同时保持原顺序）"""
+        order = np.argsort(-rows[1], kind="stable")[:self.k]
+        self.triples[cell] = -1
+        self.health_scores[cell] = -np.inf
+        for name, values in zip(_ARRAYS, rows):
+            getattr(self, name)[cell, :len(order)] = values[order]
+
+    def _stored_rows(self, cell: int):
+        valid = self.triples[cell, :, 0] >= 0
+        return tuple(getattr(self, name)[cell][valid] for name in _ARRAYS)
+
+    @staticmethod
+    def _all_candidates(pools) -> np.ndarray:
+        grids = np.meshgrid(*(np.arange(len(pool)) for pool in pools), indexing="ij")
+        return np.stack([grid.ravel() for grid in grids], axis=1)
+
+    @classmethod
+    def build(cls, kg, grid: Dict = None, k: int = 10) -> "MealPlanTable":
+        """按 kg 当前的候选池和内存索引逐格穷举评分，生成新表"""
+        pools = tuple(tuple(pool) for pool in kg.candidate_pools())
+        table = cls._empty(grid or DEFAULT_GRID, [], pools, k, kg.ratio_mode)
+        table._add_names(pools)
+        candidates = cls._all_candidates(pools)
+        for cell, (nutrient_needs, glucose) in enumerate(table._cells()):
+            table._store(cell, table._score(kg, pools, candidates, nutrient_needs, glucose))
+        return table
+
+    def update(self, kg) -> "MealPlanTable":
+        """
+        按 kg 当前的候选池增量更新，返回新表（self 不变）；候选池未变化时返回 self。
+        kg 的缩放比例计算方式与建表时不同时，已保存的评分都不再适用，按相同网格整表重建。
+        """
+        if kg.ratio_mode != self.ratio_mode:
+            return MealPlanTable.build(kg, self.grid, self.k)
+        pools = tuple(tuple(pool) for pool in kg.candidate_pools())
+        if _members(pools) == _members(self.pools):
+            return self
+
+        table = MealPlanTable(self.grid, self.recipe_names, pools,
+                              {name: np.array(getattr(self, name)) for name in _ARRAYS}, self.ratio_mode)
+        table._add_names(pools)
+        old_ids = [{self._ids[name] for name in pool} for pool in self.pools]
+        new_ids = [{table._ids[name] for name in pool} for pool in pools]
+
+        # 含有被移出候选池的食谱的格子需要整格重算
+        stale = np.zeros(len(table.triples), dtype=bool)
+        for c in range(3):
+            removed = list(old_ids[c] - new_ids[c])
+            if removed:
+                stale |= np.isin(table.triples[:, :, c], removed).any(axis=1)
+
+        # 其余格子只需评分至少含一个新进入候选池的食谱的组合
+        candidates = self._all_candidates(pools)
+        added = np.zeros(len(candidates), dtype=bool)
+        for c in range(3):
+            is_new = np.array([table._ids[name] not in old_ids[c] for name in pools[c]], dtype=bool)
+            if len(is_new):
+                added |= is_new[candidates[:, c]]
+        added_candidates = candidates[added]
+
+        for cell, (nutrient_needs, glucose) in enumerate(table._cells()):
+            if stale[cell]:
+                table._store(cell, table._score(kg, pools, candidates, nutrient_needs, glucose))
+            elif len(added_candidates):
+                new_rows = table._score(kg, pools, added_candidates, nutrient_needs, glucose)
+                rows = tuple(
+                    np.concatenate([stored, new]) for stored, new in zip(table._stored_rows(cell), new_rows)
+                )
+                table._store(cell, rows)
+        return table
+
+    # ---- 查表 ----
+
+    def lookup(self, kg, user_data: Dict, meal_type: str, rescore: bool = True):
+        """
+        返回与 recommend_recipes 相同格式的 (食谱列表, 缩放比例, 评分信息)；
+        输入超出网格或该格没有组合时返回 None。调用方负责确认 pools 与当前候选池一致。
+        rescore=False 时直接返回网格点上评分最高的组合（比例和评分按网格点的输入计算）。
+        """
+        nutrient_needs = user_data["nutrient_needs"][meal_type]
+        cell = self.cell(nutrient_needs, user_data["pre_meal_glucose"])
+        if cell is None:
+            return None
+        triples = np.asarray(self.triples[cell])
+        triples = triples[triples[:, 0] >= 0]
+        if not len(triples):
+            return None
+
+        if not rescore:
+            names = [self.recipe_names[i] for i in triples[0]]
+            return names, self.ratios[cell, 0].tolist(), kg._scores_dict(
+                self.health_scores[cell, 0], self.nutrition[cell, 0], self.predicted_glucose[cell, 0]
+            )
+
+        # 以保存的 k 个组合作为候选，在精确输入下重新评分
+        pools = tuple([self.recipe_names[i] for i in triples[:, c]] for c in range(3))
+        candidates = np.repeat(np.arange(len(triples))[:, None], 3, axis=1)
+        ratios, nutrition, predicted_glucose, health_scores = kg._score_candidates(
+            candidates, pools, user_data, nutrient_needs
+        )
+        row = int(np.argmax(health_scores))
+        return (
+            [pools[c][row] for c in range(3)],
+            ratios[row].tolist(),
+            kg._scores_dict(health_scores[row], nutrition[row], predicted_glucose[row]),
+        )
+
+    # ---- 读写 ----
+
+    def save(self, path: str = DEFAULT_TABLE_DIR) -> str:
+        """
+        写入 path 下新的版本目录，再原子地替换 CURRENT 指向它，返回版本目录。
+        读者要么打开旧版本，要么打开完整的新版本；旧版本目录不在这里删除。
+        """
+        os.makedirs(path, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        directory = os.path.join(path, version)
+        os.makedirs(directory)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "grid": self.grid,
+                "recipe_names": self.recipe_names,
+                "pools": self.pools,
+                "ratio_mode": self.ratio_mode,
+                "built_at": time.time(),
+            }, f, ensure_ascii=False)
+
+        tmp = os.path.join(path, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(path, "CURRENT"))
+        return directory
+
+    @staticmethod
+    def current_directory(path: str = DEFAULT_TABLE_DIR) -> Optional[str]:
+        """CURRENT 指向的版本目录；旧格式（表直接在 path 下）返回 path，没有保存过表时返回 None"""
+        try:
+            with open(os.path.join(path, "CURRENT"), encoding="utf-8") as f:
+                return os.path.join(path, f.read().strip())
+        except FileNotFoundError:
+            return path if os.path.exists(os.path.join(path, "meta.json")) else None
+
+    @staticmethod
+    def prune_versions(path: str, keep: List[str]):
+        """
+        删除 path 下 keep 以外的版本目录。仍被内存映射的文件（Windows 上）删除失败时
+        保留该目录，下次再删。
+        """
+        keep = {os.path.normcase(os.path.abspath(directory)) for directory in keep if directory}
+        for name in os.listdir(path):
+            directory = os.path.join(path, name)
+            if (not name.startswith("v") or not os.path.isdir(directory)
+                    or os.path.normcase(os.path.abspath(directory)) in keep):
+                continue
+            try:
+                shutil.rmtree(directory)
+            except OSError:
+                logger.warning("旧版本推荐表仍在使用，稍后再删除", extra={"directory": directory})
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TABLE_DIR, ratio_mode: str = None) -> "MealPlanTable":
+        """
+        以内存映射方式打开 CURRENT 指向的表。
+        给定 ratio_mode 且与建表时的计算方式不同时抛出 ValueError。
+        """
+        directory = cls.current_directory(path)
+        if directory is None:
+            raise FileNotFoundError(f"未找到推荐表 {path}，请先运行 python meal_plan_table.py build")
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        table_ratio_mode = meta.get("ratio_mode", "heuristic")
+        if ratio_mode is not None and ratio_mode != table_ratio_mode:
+            raise ValueError(f"推荐表按 {table_ratio_mode} 计算比例，与当前的 {ratio_mode} 不一致，请重新生成")
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in _ARRAYS}
+        return cls(meta["grid"], meta["recipe_names"], meta["pools"], arrays, table_ratio_mode, directory)
+
+
+class MealPlanStore:
+    """
+    服务端持有的推荐表。查表前确认表的候选池和比例计算方式与当前一致；不一致时本次不用表，
+    并在后台线程中增量更新、保存并替换表（同一时刻只有一个更新）。
+
+    更新合并进行：两次更新的开始至少间隔 update_interval 秒，间隔内到达的更新请求
+    只安排一次更新，届时按最新的候选池一次算出所有变化。
+
+    替换后旧表不再被引用，其内存映射随之关闭；旧版本目录在下一次更新时删除。
+    """
+
+    def __init__(self, table: MealPlanTable, path: str = DEFAULT_TABLE_DIR, rescore: bool = True,
+                 update_interval: float = 30.0):
+        self.table = table
+        self.path = path
+        self.rescore = rescore
+        self.update_interval = update_interval
+        self._updating = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._last_update_started = float("-inf")
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.update_requests = 0
+        self.updates = 0
+        self.update_failures = 0
+        self.last_update_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, ratio_mode: str = None) -> Optional["MealPlanStore"]:
+        """
+        MEAL_PLAN_TABLE=1 时加载 MEAL_PLAN_PATH 下的表，MEAL_PLAN_RESCORE=0 时不在精确输入下重新评分，
+        MEAL_PLAN_UPDATE_INTERVAL 为两次更新的最小间隔（秒，默认 30）。
+        ratio_mode 为服务使用的比例计算方式，表按其他方式生成时不加载。
+        """
+        if os.getenv("MEAL_PLAN_TABLE", "0") != "1":
+            return None
+        path = os.getenv("MEAL_PLAN_PATH", DEFAULT_TABLE_DIR)
+        if MealPlanTable.current_directory(path) is None:
+            logger.warning("未找到推荐表，请先运行 python meal_plan_table.py build", extra={"path": path})
+            return None
+        try:
+            table = MealPlanTable.load(path, ratio_mode)
+        except ValueError as e:
+            logger.warning(str(e), extra={"path": path})
+            return None
+        return cls(
+            table, path,
+            rescore=os.getenv("MEAL_PLAN_RESCORE", "1") == "1",
+            update_interval=float(os.getenv("MEAL_PLAN_UPDATE_INTERVAL", "30")),
+        )
+
+    def _is_current(self, table: MealPlanTable, kg) -> bool:
+        return (table.ratio_mode == kg.ratio_mode
+                and _members(table.pools) == _members(kg.candidate_pools()))
+
+    def lookup(self, kg, user_data: Dict, meal_type: str):
+        table = self.table
+        if not self._is_current(table, kg):
+            with self._stats_lock:
+                self.stale += 1
+            self.schedule_update(kg)
+            return None
+        result = table.lookup(kg, user_data, meal_type, rescore=self.rescore)
+        with self._stats_lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def schedule_update(self, kg):
+        """
+        候选池或比例计算方式变化时安排一次后台更新：距上次更新开始不足 update_interval 秒时
+        延后到间隔结束；已安排的更新尚未开始时直接返回，由它一并处理。
+        """
+        if self._is_current(self.table, kg):
+            return
+        with self._schedule_lock:
+            with self._stats_lock:
+                self.update_requests += 1
+            if self._timer is not None:
+                return
+            delay = max(0.0, self._last_update_started + self.update_interval - time.monotonic())
+            self._timer = threading.Timer(delay, self._update, args=(kg,))
+            self._timer.name = "meal-plan-update"
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _update(self, kg):
+        with self._updating:
+            with self._schedule_lock:
+                # 从这里开始的候选池变化由下一次安排的更新处理
+                self._timer = None
+                self._last_update_started = time.monotonic()
+            if self._is_current(self.table, kg):
+                return
+            try:
+                start = time.perf_counter()
+                table = self.table.update(kg)
+                table.save(self.path)
+                self.table = MealPlanTable.load(self.path)
+                # 替换前的表已不再被引用，删除除当前表以外的版本目录
+                MealPlanTable.prune_versions(self.path, keep=[self.table.directory])
+                with self._stats_lock:
+                    self.updates += 1
+                    self.last_update_seconds = time.perf_counter() - start
+                logger.info("推荐表已增量更新", extra={"seconds": round(self.last_update_seconds, 2)})
+            except Exception:
+                with self._stats_lock:
+                    self.update_failures += 1
+                logger.exception("推荐表更新失败")
+
+    def metrics(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "cells": len(self.table.triples),
+                "k": self.table.k,
+                "rescore": self.rescore,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "update_interval": self.update_interval,
+                "update_requests": self.update_requests,
+                "updates": self.updates,
+                "update_failures": self.update_failures,
+                "last_update_seconds": self.last_update_seconds,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成或增量更新离线推荐表")
+    parser.add_argument("command", choices=["build", "update"])
+    parser.add_argument("--output", default=os.getenv("MEAL_PLAN_PATH", DEFAULT_TABLE_DIR))
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    from KG import KnowledgeGraph
+    from predict_glucose import get_predictor
+
+    kg = KnowledgeGraph.from_env(predictor=get_predictor())
+    try:
+        start = time.perf_counter()
+        if args.command == "build":
+            table = MealPlanTable.build(kg, k=args.k)
+        else:
+            table = MealPlanTable.load(args.output).update(kg)
+        directory = table.save(args.output)
+        MealPlanTable.prune_versions(args.output, keep=[directory])
+        print(f"推荐表共 {len(table.triples)} 格，每格 {table.k} 个组合，耗时 {time.perf_counter() - start:.2f} 秒")
+    finally:
+        kg.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# 营养向量各列的含义，均为按食谱原始重量（ratio=1.0）计算的克数
+MACRO_FIELDS = ("carb", "protein", "fat", "fiber")
+
+
+class NutritionIndex:
+    """
+    食谱-食材营养数据的内存索引。
+
+    启动时用一次批量查询读取所有 (Recipe)-[:CONTAINS]->(Ingredient) 关系，
+    之后计算营养值和生成提示词都只读内存，不再访问 Neo4j。
+    macros 是形状为 (食谱数, 4) 的数组，行号由 recipe_ids 给出。
+    ingredient_scores 是食材的偏好评分，评分写回数据库之前先在内存中更新。
+    启动后新增的食谱第一次被查询时通过 add_recipe 加入索引，之后同样只读内存。
+    """
+
+    def __init__(self, recipe_ingredients: Dict[str, List[Dict]], ingredient_scores: Dict[str, float] = None):
+        self.recipe_ids = {name: i for i, name in enumerate(recipe_ingredients)}
+        self._ingredients = recipe_ingredients
+        self.ingredient_scores = ingredient_scores or {}
+        self.macros = np.array(
+            [self._macro_row(ingredients) for ingredients in recipe_ingredients.values()]
+        ).reshape(-1, len(MACRO_FIELDS))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _macro_row(ingredients: List[Dict]) -> List[float]:
+        row = [0.0] * len(MACRO_FIELDS)
+        for ingredient in ingredients:
+            # 与 get_recipe_ingredients(recipe, 1.0) 一致，重量先取整
+            weight = int(ingredient["weight"])
+            for col, field in enumerate(MACRO_FIELDS):
+                row[col] += ingredient[field] * weight / 100
+        return row
+
+    @staticmethod
+    def _ingredient_from_record(record) -> Dict:
+        # 确保所有数值都是原生 Python float 类型
+        return {
+            "name": record["name"],
+            "carb": float(record["carb"] or 0),
+            "protein": float(record["protein"] or 0),
+            "fat": float(record["fat"] or 0),
+            "fiber": float(record["fiber"] or 0),
+            "weight": record["weight"],
+            "type": record["type"],
+        }
+
+    @classmethod
+    def load(cls, session) -> "NutritionIndex":
+        """在给定的 Neo4j 会话中批量加载全部食谱的食材数据"""
+        records = session.run(
+            "MATCH (r:Recipe)-[rel:CONTAINS]->(i) "
+            "RETURN r.name AS recipe, i.name AS name, i.carb AS carb, i.protein AS protein, "
+            "i.fat AS fat, i.fiber AS fiber, rel.weight AS weight, labels(i) AS type, "
+            "i.preference_score AS preference_score"
+        ).data()
+
+        recipe_ingredients: Dict[str, List[Dict]] = {}
+        ingredient_scores: Dict[str, float] = {}
+        for record in records:
+            ingredient_scores[record["name"]] = record["preference_score"]
+            recipe_ingredients.setdefault(record["recipe"], []).append(cls._ingredient_from_record(record))
+        return cls(recipe_ingredients, ingredient_scores)
+
+    def add_recipe(self, recipe_name: str, records: List[Dict]):
+        """
+        把一个食谱的食材记录（字段与 load 的查询结果相同，不含 recipe）加入索引。
+        先发布新的 macros 再发布新的 recipe_ids，无锁读者看到的行号总是有效的。
+        """
+        with self._lock:
+            if recipe_name in self.recipe_ids:
+                return
+            ingredients = [self._ingredient_from_record(record) for record in records]
+            for record in records:
+                self.ingredient_scores.setdefault(record["name"], record.get("preference_score"))
+            self._ingredients[recipe_name] = ingredients
+            self.macros = np.vstack([self.macros, [self._macro_row(ingredients)]])
+            self.recipe_ids = {**self.recipe_ids, recipe_name: len(self.recipe_ids)}
+
+    def __contains__(self, recipe_name: str) -> bool:
+        return recipe_name in self.recipe_ids
+
+    def __len__(self) -> int:
+        return len(self.recipe_ids)
+
+    def ingredients(self, recipe_name: str, ratio: float = 1.0) -> List[Dict]:
+        """返回食谱的食材列表，重量按 ratio 缩放并取整，与 get_recipe_ingredients 的格式相同"""
+        return [
+            dict(ingredient, weight=int(ingredient["weight"] * float(ratio)))
+            for ingredient in self._ingredients[recipe_name]
+        ]
+
+    def ingredient_names(self, recipe_name: str, label: str = "Ingredient") -> List[str]:
+        """返回食谱中带有指定标签的食材名"""
+        return [
+            ingredient["name"]
+            for ingredient in self._ingredients.get(recipe_name, [])
+            if label in (ingredient["type"] or [])
+        ]
+
+    def recipe_nutrition(self, recipe_name: str) -> Dict[str, float]:
+        """返回单个食谱（ratio=1.0）的总营养值"""
+        row = self.macros[self.recipe_ids[recipe_name]]
+        return {field: float(row[col]) for col, field in enumerate(MACRO_FIELDS)}
+
+    def macros_for(self, recipe_names: Iterable[str]) -> np.ndarray:
+        """按给定顺序返回多个食谱的营养向量，形状为 (len(recipe_names), 4)"""
+        return self.macros[[self.recipe_ids[name] for name in recipe_names]]
@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 子进程中的血糖预测器，由 _init_worker 在进程启动时设置一次
+_predictor = None
+
+
+def _init_worker(predictor):
+    global _predictor
+    _predictor = predictor
+    # 子进程不记录耗时：fork 复制来的追踪器锁和 TRACE_FILE 句柄属于父进程
+    from tracing import tracer
+    tracer.disable()
+
+
+def _score_slice(pool_macros: List[np.ndarray], nutrient_needs: Dict, pre_meal_glucose: float,
+                 start: int, stop: int, top_n: int, ratio_mode: str, seed):
+    """
+    为组合编号 [start, stop) 评分，返回其中排在最前的 top_n 个 (健康评分, 随机次序, 组合编号)。
+    组合编号是 (主食下标, 蔬菜下标, 蛋白质下标) 按行优先展开后的序号。
+    评分相同的组合按随机次序排列：default_rng(seed) 生成的随机数序列中第 编号 个，
+    与 rank_combinations 在当前进程中评分时的 tiebreak 相同。
+    """
+    from KG import score_macros
+
+    sizes = tuple(len(macros) for macros in pool_macros)
+    flat = np.arange(start, stop)
+    index = np.unravel_index(flat, sizes)
+    macros = np.stack([pool_macros[c][index[c]] for c in range(3)], axis=1)
+    health_scores = score_macros(macros, _predictor, pre_meal_glucose, nutrient_needs, ratio_mode)[3]
+
+    rng = np.random.default_rng(seed)
+    rng.bit_generator.advance(start)  # 每个双精度随机数消耗一个 64 位输出
+    tiebreak = rng.random(len(flat))
+
+    if len(flat) > top_n:
+        # 保留评分不低于第 top_n 名的全部组合，使与第 top_n 名同分的组合也参与按随机次序排序
+        threshold = np.partition(-health_scores, top_n - 1)[top_n - 1]
+        keep = -health_scores <= threshold
+        flat, health_scores, tiebreak = flat[keep], health_scores[keep], tiebreak[keep]
+    order = np.lexsort((tiebreak, -health_scores))[:top_n]
+    return list(zip(health_scores[order].tolist(), tiebreak[order].tolist(), flat[order].tolist()))
+
+
+def _mp_context():
+    """
+    支持 fork 时（Linux、macOS）用 fork 启动子进程：子进程不重新导入启动脚本，
+    预测器权重随内存映像以写时复制方式共享。fork 只复制调用线程，其他线程持有的锁在子进程中
+    永远不会释放，因此服务中要在启动任何线程之前调用 ParallelScorer.start（见 app.py）。
+    只支持 spawn 时（Windows）使用 spawn。
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+class ParallelScorer:
+    """
+    在进程池中穷举评分。
+
+    组合空间按编号切成互不重叠的分片，每个子进程对分片做与 score_macros 相同的批量评分，
+    只把分片内的前 top_n 个 (评分, 随机次序, 编号) 返回给父进程，父进程用堆合并出全局前 top_n 个。
+    每次请求只传三类候选食谱的营养向量（每类最多几百行），不传输组合本身。
+
+    构造 KnowledgeGraph 时不启动子进程。服务在启动其他线程之前显式调用 start（app.py 在创建
+    知识图谱后立即调用，asgi.py 导入 app 时同样执行）；未调用时在第一次评分时创建，只适合
+    基准测试等单线程场景。spawn 方式下子进程重新导入启动脚本时 start 不创建进程池。
+    子进程的启动方式见 _mp_context：
+    fork 方式下预测器权重与父进程共享；spawn 方式下权重（几十 KB）在每个子进程启动时 pickle 传入一次，
+    不随请求传输，但每个子进程会重新导入启动脚本（例如 app.py 会各自连接 Neo4j）。
+    """
+
+    def __init__(self, predictor, workers: int = None, chunk_size: int = 100000):
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self._predictor = predictor
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[ProcessPoolExecutor]:
+        """
+        创建进程池并启动全部子进程；已创建时直接返回。
+        在评分子进程中（spawn 方式下重新导入启动脚本时）不创建，返回 None。
+        """
+        if multiprocessing.parent_process() is not None:
+            return None
+        with self._lock:
+            if self._executor is None:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=_mp_context(),
+                    initializer=_init_worker, initargs=(self._predictor,),
+                )
+                # 一次启动全部子进程，之后的请求不再等待进程启动
+                list(executor.map(int, range(self.workers)))
+                self._executor = executor
+            return self._executor
+
+    def top_candidates(self, pool_macros: List[np.ndarray], nutrient_needs: Dict, pre_meal_glucose,
+                       top_n: int = 1, ratio_mode: str = "heuristic", seed=None) -> np.ndarray:
+        """
+        返回健康评分最高的 top_n 个组合，形状为 (top_n, 3)，每列是对应类别候选列表中的下标；
+        按评分从高到低排列，评分相同时按 seed 决定的随机次序排列，相同 seed 的结果与
+        在当前进程中评分（rank_combinations）相同。seed 为空时每次取新的随机种子。
+        """
+        executor = self.start()
+        if seed is None:
+            # 所有分片共用同一个随机数序列
+            seed = np.random.SeedSequence().entropy
+        pool_macros = [np.asarray(macros, dtype=float) for macros in pool_macros]
+        sizes = tuple(len(macros) for macros in pool_macros)
+        total = int(np.prod(sizes))
+        # 分片不超过 chunk_size，且至少切成 workers 份，使每个子进程都有任务
+        chunk = max(1, min(self.chunk_size, -(-total // self.workers)))
+        futures = [
+            executor.submit(
+                _score_slice, pool_macros, dict(nutrient_needs), float(pre_meal_glucose),
+                start, min(start + chunk, total), top_n, ratio_mode, seed,
+            )
+            for start in range(0, total, chunk)
+        ]
+        best = heapq.nsmallest(
+            top_n,
+            itertools.chain.from_iterable(future.result() for future in futures),
+            key=lambda item: (-item[0], item[1]),
+        )
+        flat = np.array([index for _, _, index in best], dtype=np.int64)
+        return np.stack(np.unravel_index(flat, sizes), axis=1).reshape(-1, 3)
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
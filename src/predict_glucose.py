@@ -1,49 +1,117 @@
-from sklearn.preprocessing import StandardScaler
-from tensorflow.keras.models import load_model
-import joblib
+import os
+import threading
+
+import numpy as np
+
+# 模型文件默认位于仓库根目录下的 models/ 目录，可通过环境变量覆盖
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "models")
+
+_ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0.0),
+    "linear": lambda x: x,
+}
+
+
+class GlucosePredictor:
+    """
+    常驻内存的餐后血糖预测器。
+
+    权重由 utils/export_glucose_model.py 从 glucose_model_P1.h5 和两个 StandardScaler
+    导出为 .npz 文件，推理是纯 NumPy 的前向传播，服务进程不需要导入 TensorFlow。
+    权重在构造后只读，因此同一实例可以被多个 Flask 线程无锁共享。
+    """
+
+    def __init__(self, weights_path: str):
+        self.weights_path = weights_path
+        with np.load(weights_path, allow_pickle=False) as weights:
+            n_layers = int(weights["n_layers"])
+            self.kernels = [weights[f"W{i}"].astype(np.float64) for i in range(n_layers)]
+            self.biases = [weights[f"b{i}"].astype(np.float64) for i in range(n_layers)]
+            self.activations = [str(name) for name in weights["activations"]]
+            self.x_mean = weights["x_mean"].astype(np.float64)
+            self.x_scale = weights["x_scale"].astype(np.float64)
+            self.y_mean = weights["y_mean"].astype(np.float64)
+            self.y_scale = weights["y_scale"].astype(np.float64)
+
+    @classmethod
+    def from_env(cls) -> "GlucosePredictor":
+        """
+        根据环境变量创建预测器：
+        - GLUCOSE_MODEL_DIR: 模型目录（默认 ../models）
+        - GLUCOSE_WEIGHTS_PATH: 单独覆盖导出的 .npz 权重文件路径
+        """
+        model_dir = os.getenv("GLUCOSE_MODEL_DIR", DEFAULT_MODEL_DIR)
+        return cls(os.getenv("GLUCOSE_WEIGHTS_PATH", os.path.join(model_dir, "glucose_model_P1.npz")))
+
+    def predict(self, input_data):
+        """
+        参数:
+        input_data: 包含4个输入特征的列表或数组（碳水、脂肪、膳食纤维、餐前血糖）
+
+        返回:
+        预测的餐后60分钟、120分钟、180分钟血糖（实际值）
+        """
+        return self.predict_batch([input_data])[0]  # 返回的是一个包含3个值的数组
+
+    def predict_batch(self, rows):
+        """
+        一次前向传播对多组输入进行预测。
+
+        参数:
+        rows: 形状为 (N, 4) 的数组，每行为一组输入特征
+
+        返回:
+        形状为 (N, 3) 的数组，每行为对应的餐后60、120、180分钟血糖
+        """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+
+        # 与 StandardScaler.transform 相同的标准化
+        hidden = (rows - self.x_mean) / self.x_scale
+
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            hidden = _ACTIVATIONS[activation](hidden @ kernel + bias)
+
+        # 与 StandardScaler.inverse_transform 相同的逆标准化
+        return hidden * self.y_scale + self.y_mean
+
+
+_default_predictor = None
+_default_predictor_lock = threading.Lock()
+
+
+def get_predictor() -> GlucosePredictor:
+    """返回进程内共享的预测器，首次调用时加载权重"""
+    global _default_predictor
+    if _default_predictor is None:
+        with _default_predictor_lock:
+            if _default_predictor is None:
+                _default_predictor = GlucosePredictor.from_env()
+    return _default_predictor
+
 
 def predict(input_data):
     """
     使用训练好的模型进行预测
 
     参数:
-    model: 已训练的Keras模型
-    scaler_X: 已拟合好的输入数据标准化器
-    scaler_y: 已拟合好的输出数据标准化器
     input_data: 包含4个输入特征的列表或数组
 
     返回:
     预测的餐后60分钟、120分钟、180分钟血糖（实际值）
     """
-    model = load_model('D:\SCU\diabetes_diet_recommendation\models\glucose_model_P1.h5')
-    scaler_X = joblib.load('D:\\SCU\\diabetes_diet_recommendation\\models\\scaler_X.pkl')
-    scaler_y = joblib.load('D:\\SCU\\diabetes_diet_recommendation\\models\\scaler_y.pkl')
+    return get_predictor().predict(input_data)
 
-    # 使用已经拟合好的 scaler 对输入数据进行标准化
-    input_scaled = scaler_X.transform([input_data])  # 输入数据需要是一个二维数组
 
-    # 使用模型进行预测
-    predicted_scaled = model.predict(input_scaled)
+def predict_batch(rows):
+    """对形状为 (N, 4) 的输入矩阵批量预测，返回 (N, 3) 的餐后血糖"""
+    return get_predictor().predict_batch(rows)
 
-    # 对预测值进行逆标准化
-    predicted_original = scaler_y.inverse_transform(predicted_scaled)
-
-    # 返回实际值（逆标准化后的输出）
-    return predicted_original[0]  # 返回的是一个包含3个值的数组
 
 if __name__ == "__main__":
     # 示例：使用predict函数
     input_data = [50, 10, 5, 6.0]  # 例如：碳水50g，脂肪10g，膳食纤维5g，餐前血糖6.0 mmol/L
 
-    # 加载训练好的模型
-    model = load_model('../models/glucose_model_P1.h5')
-
-    # 加载拟合好的 scaler 对象
-    scaler_X = joblib.load('D:\\SCU\\diabetes_diet_recommendation\\models\\scaler_X.pkl')
-    scaler_y = joblib.load('D:\\SCU\\diabetes_diet_recommendation\\models\\scaler_y.pkl')
-
-    # 调用预测函数
-    predicted_values = predict(model, scaler_X, scaler_y, input_data)
+    predicted_values = predict(input_data)
 
     # 输出预测值
     print(f"预测的餐后血糖（60分钟、120分钟、180分钟）：{predicted_values}")
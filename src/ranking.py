@@ -0,0 +1,182 @@
+import heapq
+import threading
+from typing import Callable, Dict, List, Tuple
+
+# 推荐使用的三类食谱
+CATEGORIES = ("staple", "vegetable", "protein")
+
+
+class PriorityRecipe:
+    """Wrapper class for recipes to enable priority queue functionality"""
+    def __init__(self, name: str, preference_score: float):
+        self.name = name
+        self.preference_score = preference_score
+
+    def __lt__(self, other):
+        # We want higher preference scores to have higher priority
+        return self.preference_score > other.preference_score
+
+
+class IndexedRecipeHeap:
+    """
+    带位置索引的 PriorityRecipe 二叉堆。
+
+    _positions 记录每个食谱名在堆数组中的下标，修改偏好分后只需沿堆上浮或下沉，
+    复杂度为 O(log n)；排序语义与 heapq 使用 PriorityRecipe.__lt__ 时完全相同。
+    """
+
+    def __init__(self):
+        self._heap: List[PriorityRecipe] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._positions
+
+    def push(self, recipe: PriorityRecipe):
+        self._heap.append(recipe)
+        self._positions[recipe.name] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def score(self, name: str) -> float:
+        return self._heap[self._positions[name]].preference_score
+
+    def update(self, name: str, preference_score: float):
+        """修改已有食谱的偏好分并恢复堆序"""
+        pos = self._positions[name]
+        self._heap[pos].preference_score = preference_score
+        self._sift_up(pos)
+        self._sift_down(self._positions[name])
+
+    def top_k(self, k: int) -> List[PriorityRecipe]:
+        """不修改堆，按优先级返回前 k 个食谱，复杂度 O(k log k)"""
+        heap = self._heap
+        result = []
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(result) < k:
+            recipe, pos = heapq.heappop(frontier)
+            result.append(recipe)
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i].name] = i
+        self._positions[heap[j].name] = j
+
+    def _sift_up(self, pos: int):
+        heap = self._heap
+        while pos > 0:
+            parent = (pos - 1) // 2
+            if not heap[pos] < heap[parent]:
+                break
+            self._swap(pos, parent)
+            pos = parent
+
+    def _sift_down(self, pos: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = pos
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < size and heap[child] < heap[smallest]:
+                    smallest = child
+            if smallest == pos:
+                return
+            self._swap(pos, smallest)
+            pos = smallest
+
+
+class RecipeRanking:
+    """
+    按类别排序的食谱偏好排名。
+
+    每个类别内部是一个 IndexedRecipeHeap，写操作（update）在锁内以 O(log n)
+    调整堆，然后发布该类别前 snapshot_size 个食谱的不可变快照。读操作 top_k
+    只读取当前快照，不加锁、不修改堆，也不访问数据库。
+    """
+
+    def __init__(self, snapshot_size: int = 10):
+        self.snapshot_size = snapshot_size
+        self._queues: Dict[str, IndexedRecipeHeap] = {category: IndexedRecipeHeap() for category in CATEGORIES}
+        self._category_of: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # {类别: ((食谱名, 偏好分), ...)}，整体替换发布，读者拿到的总是一致的版本
+        self._snapshots: Dict[str, Tuple[Tuple[str, float], ...]] = {category: () for category in CATEGORIES}
+        self.version = 0
+        # 偏好分更新后的回调，参数为食谱名，在锁外调用
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add(self, category: str, name: str, preference_score: float):
+        """加入一个食谱（初始化时使用），调用 publish() 后对读者可见"""
+        with self._lock:
+            self._queues[category].push(PriorityRecipe(name, preference_score))
+            self._category_of[name] = category
+
+    def publish(self):
+        """重新生成所有类别的快照"""
+        with self._lock:
+            self._publish(CATEGORIES)
+
+    def _publish(self, categories):
+        snapshots = dict(self._snapshots)
+        for category in categories:
+            top = self._queues[category].top_k(self.snapshot_size)
+            snapshots[category] = tuple((recipe.name, recipe.preference_score) for recipe in top)
+        self._snapshots = snapshots
+        self.version += 1
+
+    def subscribe(self, listener: Callable[[str], None]):
+        """注册偏好分更新回调，例如使依赖该食谱的推荐缓存失效"""
+        self._listeners.append(listener)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def size(self, category: str) -> int:
+        return len(self._queues[category])
+
+    def score(self, name: str):
+        """返回食谱当前的偏好分，不在任何类别中时返回 None"""
+        with self._lock:
+            category = self._category_of.get(name)
+            return None if category is None else self._queues[category].score(name)
+
+    def top_k(self, category: str, k: int = 10) -> List[str]:
+        """返回某类别偏好分最高的 k 个食谱名，按优先级从高到低排列"""
+        snapshot = self._snapshots[category]
+        if k <= len(snapshot) or len(snapshot) == len(self._queues[category]):
+            return [name for name, _ in snapshot[:k]]
+
+        # 超出快照大小时在锁内从堆中读取，不修改堆
+        with self._lock:
+            return [recipe.name for recipe in self._queues[category].top_k(k)]
+
+    def update(self, name: str, preference_score: float, notify: bool = True) -> bool:
+        """
+        更新食谱的偏好分并发布新快照，食谱不在任何类别中时返回 False。
+        偏好分没有变化时不发布快照也不调用回调。notify 为 False 时不调用回调，
+        由调用方在释放自己持有的锁之后调用 notify(name)。
+        """
+        with self._lock:
+            category = self._category_of.get(name)
+            if category is None:
+                return False
+            queue = self._queues[category]
+            if queue.score(name) == preference_score:
+                return True
+            queue.update(name, preference_score)
+            self._publish([category])
+        if notify:
+            self.notify(name)
+        return True
+
+    def notify(self, name: str):
+        """调用偏好分更新回调（缓存失效、计划表更新等），调用方不应持有任何锁"""
+        for listener in self._listeners:
+            listener(name)
@@ -0,0 +1,170 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class RecommendationCache:
+    """
+    按量化后的用户画像缓存食谱推荐结果（穷举搜索，结果只取决于输入和候选池）。
+
+    - 键为 (餐次, 营养需求分桶, 餐前血糖分桶)：营养需求按 needs_step 克、血糖按
+      glucose_step mmol/L 四舍五入。组合按分桶后的代表值选出，同一分桶内的用户
+      得到相同的食谱组合，与是否命中缓存无关；返回前再按用户的精确输入重新计算
+      该组合的缩放比例、营养、餐后血糖和健康评分；
+    - 同分组合之间的随机排序使用由键导出的种子（见 seed_for），条目过期或失效后
+      重新计算，只要候选池不变，得到的组合也不变；
+    - 新鲜度：条目最多保留 ttl 秒；每个条目记录计算时各类别的候选食谱，读取时
+      候选池已经变化则视为失效；某个食谱的偏好分更新时（RecipeRanking.subscribe），
+      立即删除候选池中包含该食谱的条目；
+    - 内存有界：最多 max_entries 个条目，超出时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0,
+                 needs_step: float = 5.0, glucose_step: float = 0.5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.needs_step = needs_step
+        self.glucose_step = glucose_step
+
+        # {键: (候选池, 推荐结果, 写入时间)}
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple, Tuple, float]]" = OrderedDict()
+        # {食谱名: 候选池包含该食谱的键集合}，用于按食谱失效
+        self._keys_by_recipe: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "RecommendationCache":
+        """REC_CACHE_MAX_ENTRIES、REC_CACHE_TTL（秒）、REC_CACHE_NEEDS_STEP（克）、REC_CACHE_GLUCOSE_STEP（mmol/L）"""
+        return cls(
+            max_entries=int(os.getenv("REC_CACHE_MAX_ENTRIES", "1000")),
+            ttl=float(os.getenv("REC_CACHE_TTL", "300")),
+            needs_step=float(os.getenv("REC_CACHE_NEEDS_STEP", "5")),
+            glucose_step=float(os.getenv("REC_CACHE_GLUCOSE_STEP", "0.5")),
+        )
+
+    @staticmethod
+    def _bucket(value, step: float) -> float:
+        return round(round(float(value) / step) * step, 6)
+
+    def quantize(self, user_data: Dict, meal_type: str) -> Tuple[Tuple, Dict]:
+        """返回 (缓存键, 分桶后的 user_data)，后者只包含推荐用到的字段"""
+        needs = {
+            field: self._bucket(value, self.needs_step)
+            for field, value in user_data["nutrient_needs"][meal_type].items()
+        }
+        glucose = self._bucket(user_data["pre_meal_glucose"], self.glucose_step)
+        key = (meal_type, tuple(sorted(needs.items())), glucose)
+        return key, {"nutrient_needs": {meal_type: needs}, "pre_meal_glucose": glucose}
+
+    @staticmethod
+    def seed_for(key: Tuple) -> int:
+        """由缓存键导出的随机数种子，与进程和 PYTHONHASHSEED 无关"""
+        payload = json.dumps(key, ensure_ascii=False)
+        return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "big")
+
+    def get(self, key: Tuple, pools: Tuple) -> Optional[Tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_pools, result, created_at = entry
+            if time.monotonic() - created_at > self.ttl:
+                self.expirations += 1
+                self._remove(key)
+                self.misses += 1
+                return None
+            if entry_pools != pools:
+                self.stale += 1
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(result)
+
+    def put(self, key: Tuple, pools: Tuple, result: Tuple):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (pools, copy.deepcopy(result), time.monotonic())
+            for name in {name for pool in pools for name in pool}:
+                self._keys_by_recipe.setdefault(name, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple):
+        pools, _, _ = self._entries.pop(key)
+        for name in {name for pool in pools for name in pool}:
+            keys = self._keys_by_recipe.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_recipe[name]
+
+    def invalidate_recipe(self, recipe_name: str):
+        """删除候选池中包含该食谱的所有条目"""
+        with self._lock:
+            for key in list(self._keys_by_recipe.get(recipe_name, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_recipe.clear()
+
+    def recommend(self, kg, user_data: Dict, meal_type: str) -> Tuple[List[str], List[float], Dict]:
+        """
+        与 kg.recommend_recipes(..., search="exhaustive") 的返回值相同。
+        食谱组合按分桶后的输入计算并缓存，比例和评分按精确输入重新计算（见 rescore）。
+        """
+        key, quantized = self.quantize(user_data, meal_type)
+        pools = tuple(tuple(pool) for pool in kg.candidate_pools())
+        result = self.get(key, pools)
+        if result is None:
+            result = kg.recommend_recipes(quantized, meal_type, search="exhaustive", seed=self.seed_for(key))
+            self.put(key, pools, result)
+        return self.rescore(kg, result[0], user_data, meal_type)
+
+    @staticmethod
+    def rescore(kg, recipes: List[str], user_data: Dict, meal_type: str) -> Tuple[List[str], List[float], Dict]:
+        """按用户的精确营养需求和餐前血糖计算一个组合的缩放比例、营养和评分"""
+        pools = tuple([name] for name in recipes)
+        ratios, nutrition, predicted_glucose, health_scores = kg._score_candidates(
+            np.zeros((1, 3), dtype=int), pools, user_data, user_data["nutrient_needs"][meal_type]
+        )
+        return list(recipes), ratios[0].tolist(), kg._scores_dict(health_scores[0], nutrition[0], predicted_glucose[0])
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "needs_step": self.needs_step,
+                "glucose_step": self.glucose_step,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale": self.stale,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class BatchScheduler:
+    """
+    动态批处理调度器。
+
+    请求先进入队列，后台任务取出第一个请求后最多再等待 max_wait 秒收集更多请求，
+    凑满 max_batch_size 个或等待超时就把这一批交给 generate_batch 一次生成。
+    generate_batch 在单独的工作线程中运行，不阻塞事件循环；同一时刻只运行一批，
+    生成期间到达的请求会攒成下一批。
+    """
+
+    def __init__(self, generate_batch: Callable[[List[Tuple[str, Optional[dict]]]], List[str]],
+                 max_batch_size: int = 8, max_wait: float = 0.02):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 模型同一时刻只运行一个 generate（流式生成也提交到这里），只用一个工作线程
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
+
+        self.requests_total = 0
+        self.batches_total = 0
+        self.max_batch_seen = 0
+        self.generate_seconds_total = 0.0
+
+    def start(self):
+        """在事件循环中启动后台任务（FastAPI 的 startup 事件中调用）"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, question: str, user_data: dict = None) -> str:
+        """提交一个问题，等待它所在的批次生成完毕后返回回答"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((question, user_data), future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 等待期间已断开的请求不再生成
+            batch = [(request, future) for request, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                responses = await loop.run_in_executor(
+                    self.executor, self.generate_batch, [request for request, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            self.requests_total += len(batch)
+            self.batches_total += 1
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.generate_seconds_total += elapsed
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+    def metrics(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "mean_batch_size": self.requests_total / self.batches_total if self.batches_total else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "generate_seconds_total": self.generate_seconds_total,
+        }
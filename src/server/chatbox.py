@@ -1,56 +1,219 @@
+import contextlib
+import copy
+import os
+import threading
+from typing import Iterator, List, Optional, Tuple
+
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import (AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList,
+                          TextIteratorStreamer)
+
+
+# 所有提示词共用的开头，启动时预先计算它的 KV 缓存
+SYSTEM_PREAMBLE = "你是一个专业的糖尿病饮食营养师。"
+
+
+class _StopOnEvent(StoppingCriteria):
+    """事件被设置（例如客户端断开）后停止生成"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
 
 class DietAssistant:
-    def __init__(self, model_path="/root/ddr/models/diabetica"):
+    def __init__(self, model_path="/root/ddr/models/diabetica", max_new_tokens=512, prefix_cache=True,
+                 quantize=False, num_threads=None, interop_threads=None, inference_mode=False, compile=False):
         """
         初始化饮食助手，使用 Hugging Face 提供的模型进行文本生成。
         参数：
         - model_path：Hugging Face 上的模型标识符或本地模型路径。
+        - max_new_tokens：每个回答最多生成的 token 数。
+        - prefix_cache：是否预先计算 SYSTEM_PREAMBLE 的 KV 缓存，单条生成时只需预填充其后的部分。
+        以下为 CPU 节点的可选设置，默认与原来的加载方式相同：
+        - quantize：在 CPU 上以 float32 加载后，把所有 Linear 层动态量化为 int8。
+        - num_threads / interop_threads：PyTorch 算子内 / 算子间的线程数。
+        - inference_mode：生成时使用 torch.inference_mode()。
+        - compile：用 torch.compile 编译模型的前向计算。
         """
-        # 设置设备
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # 线程数必须在任何并行计算之前设置
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if interop_threads:
+            torch.set_num_interop_threads(interop_threads)
+
+        # 设置设备（量化只支持 CPU）
+        self.device = "cpu" if quantize or not torch.cuda.is_available() else "cuda"
         self.model_path = model_path
+        self.max_new_tokens = max_new_tokens
+        self.inference_mode = inference_mode
 
         print(f"正在从 {model_path} 加载模型到 {self.device} ...")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            torch_dtype="auto",
-            device_map="auto"
-        )
+        if quantize:
+            model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32)
+            self.model = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+            print("已将 Linear 层动态量化为 int8")
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                torch_dtype="auto",
+                device_map="auto"
+            )
+        if compile:
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
         print("模型加载完成！")
 
         print("正在加载分词器...")
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        # 批量生成时在左侧补齐，使每行新生成的 token 都紧接在提示词之后
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         print("分词器加载完成！")
 
+        self._prefix_ids = None
+        self._prefix_cache = None
+        if prefix_cache:
+            self._build_prefix_cache()
+
+    @classmethod
+    def from_env(cls) -> "DietAssistant":
+        """
+        按环境变量创建：DIET_MODEL_PATH、DIET_MAX_NEW_TOKENS、DIET_PREFIX_CACHE（默认 1），
+        CPU 设置 DIET_QUANTIZE、DIET_INFERENCE_MODE、DIET_COMPILE（取 1 开启）、
+        DIET_NUM_THREADS、DIET_INTEROP_THREADS。
+        """
+        def flag(name, default="0"):
+            return os.getenv(name, default) == "1"
+
+        def threads(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            model_path=os.getenv("DIET_MODEL_PATH", "/root/ddr/models/diabetica"),
+            max_new_tokens=int(os.getenv("DIET_MAX_NEW_TOKENS", "512")),
+            prefix_cache=flag("DIET_PREFIX_CACHE", "1"),
+            quantize=flag("DIET_QUANTIZE"),
+            num_threads=threads("DIET_NUM_THREADS"),
+            interop_threads=threads("DIET_INTEROP_THREADS"),
+            inference_mode=flag("DIET_INFERENCE_MODE"),
+            compile=flag("DIET_COMPILE"),
+        )
+
+    def _inference_context(self):
+        return torch.inference_mode() if self.inference_mode else contextlib.nullcontext()
+
+    @torch.no_grad()
+    def _build_prefix_cache(self):
+        """对 SYSTEM_PREAMBLE 做一次前向计算，保存其 past_key_values"""
+        prefix_ids = self.tokenizer(SYSTEM_PREAMBLE, return_tensors="pt")["input_ids"].to(self.device)
+        with self._inference_context():
+            self._prefix_cache = self.model(prefix_ids, use_cache=True).past_key_values
+        self._prefix_ids = prefix_ids[0]
+        print(f"提示词前缀 KV 缓存已生成（{len(self._prefix_ids)} 个 token）")
+
+    def _single_inputs(self, prompt: str) -> dict:
+        """
+        单条提示词的 generate 参数。提示词分词后以前缀的 token 开头时附上前缀 KV 缓存的副本，
+        generate 只预填充剩余部分；分词边界与前缀不一致时按完整提示词预填充。
+        """
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        kwargs = dict(inputs)
+        if self._prefix_cache is not None:
+            n = len(self._prefix_ids)
+            input_ids = inputs["input_ids"][0]
+            if len(input_ids) > n and torch.equal(input_ids[:n], self._prefix_ids):
+                # generate 会原地扩展缓存，每次使用副本
+                kwargs["past_key_values"] = copy.deepcopy(self._prefix_cache)
+        return kwargs
+
     def generate_response(self, question: str, user_data: dict = None) -> str:
         """
         生成回答，支持带用户数据的糖尿病相关问题和不带用户数据的一般问题
         """
+        return self.generate_batch([(question, user_data)])[0]
+
+    def generate_batch(self, requests: List[Tuple[str, Optional[dict]]]) -> List[str]:
+        """
+        一次 generate 调用为多个 (问题, 用户数据) 生成回答，返回与输入顺序一致的回答列表。
+        提示词在左侧补齐到相同长度，只解码每行新生成的部分，不需要再按"回答："切分。
+        补齐的 token 位于前缀之前，前缀 KV 缓存只用于单条生成。
+        """
         try:
             # 构建提示词
-            prompt = self._build_prompt(question, user_data) if user_data else self._build_general_prompt(question)
+            prompts = [
+                self._build_prompt(question, user_data) if user_data else self._build_general_prompt(question)
+                for question, user_data in requests
+            ]
             
             # 生成回答
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=512,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
+            if len(prompts) == 1:
+                inputs = self._single_inputs(prompts[0])
+            else:
+                inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+            with self._inference_context():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=self.max_new_tokens,
+                    temperature=0.7,
+                    top_p=0.9,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.pad_token_id
+                )
             
             # 解码回答
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            print(response)
-            return response.split("回答：")[-1].strip()
+            prompt_length = inputs["input_ids"].shape[1]
+            responses = self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+            return [response.strip() for response in responses]
             
         except Exception as e:
             print(f"生成回答时出错: {str(e)}")
-            return "抱歉，处理您的问题时出现了错误，请稍后重试。"
+            return ["抱歉，处理您的问题时出现了错误，请稍后重试。"] * len(requests)
+
+    def stream_response(self, question: str, user_data: dict = None, executor=None) -> Iterator[str]:
+        """
+        流式生成回答，逐段返回新生成的文本。
+        提示词由 TextIteratorStreamer 按 token 跳过（skip_prompt），第一段文本生成后立即返回，
+        不需要等整段回答解码完再切分。
+        executor：运行 generate 的线程池（与批量生成共用以免同时占用 CPU），为空时新建线程。
+        迭代器被提前关闭时停止生成。
+        """
+        prompt = self._build_prompt(question, user_data) if user_data else self._build_general_prompt(question)
+        inputs = self._single_inputs(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+
+        def generate():
+            try:
+                with self._inference_context():
+                    self.model.generate(
+                        **inputs,
+                        max_new_tokens=self.max_new_tokens,
+                        temperature=0.7,
+                        top_p=0.9,
+                        do_sample=True,
+                        pad_token_id=self.tokenizer.pad_token_id,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop)]),
+                    )
+            except Exception as e:
+                print(f"生成回答时出错: {str(e)}")
+                streamer.end()
+
+        if executor is None:
+            threading.Thread(target=generate, daemon=True).start()
+        else:
+            executor.submit(generate)
+
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            stop.set()
 
     def _build_prompt(self, question: str, user_data: dict) -> str:
         """
@@ -67,7 +230,7 @@ class DietAssistant:
 - 运动水平：{user_data['activity_level']}
 """
         
-        prompt = f"""你是一个专业的糖尿病饮食营养师。请根据以下用户信息和问题，提供专业的建议。
+        prompt = f"""{SYSTEM_PREAMBLE}请根据以下用户信息和问题，提供专业的建议。
 
 {user_info}
 
@@ -85,7 +248,7 @@ class DietAssistant:
         """
         构建一般性问题的提示词
         """
-        return f"""你是一个专业的糖尿病饮食营养师。请回答以下问题：
+        return f"""{SYSTEM_PREAMBLE}请回答以下问题：
 
 问题：{question}
 
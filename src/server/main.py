@@ -1,13 +1,32 @@
+import os
+
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from batching import BatchScheduler
 from chatbox import DietAssistant
 
-# ʼ DietAssistant
-diet_assistant = DietAssistant()
+# ʼ DietAssistantģ· CPU ߳ü DietAssistant.from_env
+diet_assistant = DietAssistant.from_env()
+
+# ܳһɣÿ LLM_MAX_BATCH_SIZE ȴ LLM_MAX_WAIT_MS 
+scheduler = BatchScheduler(
+    diet_assistant.generate_batch,
+    max_batch_size=int(os.getenv("LLM_MAX_BATCH_SIZE", "8")),
+    max_wait=float(os.getenv("LLM_MAX_WAIT_MS", "20")) / 1000,
+)
 
 # FastAPI Ӧʵ
 app = FastAPI()
 
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
 # ûݵģ
 class UserData(BaseModel):
     height: float
@@ -30,13 +49,29 @@ async def index():
 @app.post("/answer-diabetes-question")
 async def answer_diabetes_question(request: DiabetesQuestionRequest):
     print(request)
-    response = diet_assistant.generate_response(
-        request.question, 
-        request.user_data
-    )
+    # ڵĹ߳У¼ѭ
+    response = await scheduler.submit(request.question, request.user_data.dict())
     print(response)
     return {"response": response}
 
+# ʽشһηһΣCPU ׸ token ĵȴʱԶش
+@app.post("/answer-diabetes-question/stream")
+async def answer_diabetes_question_stream(request: DiabetesQuestionRequest):
+    print(request)
+    # ɹõḶ́߳ͬ StreamingResponse ŵ̳߳жȡ
+    chunks = diet_assistant.stream_response(
+        request.question, request.user_data.dict(), executor=scheduler.executor
+    )
+    return StreamingResponse(
+        chunks,
+        media_type="text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics/batching")
+async def batching_metrics():
+    return scheduler.metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=10086)
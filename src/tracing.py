@@ -0,0 +1,231 @@
+"""
+请求追踪和结构化日志。
+
+span(name, **attributes) 记录一个处理阶段的耗时和属性，嵌套的 span 通过 contextvars
+自动挂到当前 span 之下，同一请求中的 span 共用一个 trace_id。每个 span 结束时：
+- 按名称计入最近 window 次耗时的滑动窗口，用于计算 p50/p99（prometheus() / stage_summary()）；
+- 设置了 TRACE_FILE 时以 JSON 行追加写入该文件。
+
+线程池中执行的代码不会继承 contextvars，需要挂到某个请求下时显式传入 parent。
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# 滑动窗口上报的分位数
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _quantile(values: List[float], q: float) -> float:
+    """已排序数据的分位数，相邻两点之间线性插值（与 numpy.quantile 的默认方式相同）"""
+    position = q * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_time", "duration", "_start")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+
+    def set(self, key: str, value):
+        """设置一个属性，例如抽样次数、候选组合数、缓存状态"""
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    def __init__(self, window: int = 4096, export_path: str = None):
+        """
+        window: 每个阶段保留最近多少次耗时用于计算分位数
+        export_path: 结束的 span 以 JSON 行追加写入的文件，为空时不导出
+        """
+        self.window = window
+        self.export_path = export_path
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._durations: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._sums: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._file = open(export_path, "a", encoding="utf-8") if export_path else None
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """按环境变量创建：TRACE_FILE（导出文件，默认不导出）、TRACE_WINDOW（默认 4096）"""
+        return cls(
+            window=int(os.getenv("TRACE_WINDOW", "4096")),
+            export_path=os.getenv("TRACE_FILE") or None,
+        )
+
+    def start(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """开始一个需要手动结束的 span（例如跨线程的请求根 span），用 finish 结束"""
+        return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+    def finish(self, span: Span, duration: float = None):
+        """结束 span 并记录；duration 为空时按开始到现在的时间计算"""
+        span.duration = time.perf_counter() - span._start if duration is None else duration
+        if not self.enabled:
+            return
+        with self._lock:
+            if span.name not in self._durations:
+                self._durations[span.name] = deque(maxlen=self.window)
+                self._counts[span.name] = 0
+                self._sums[span.name] = 0.0
+                self._errors[span.name] = 0
+            self._durations[span.name].append(span.duration)
+            self._counts[span.name] += 1
+            self._sums[span.name] += span.duration
+            if "error" in span.attributes:
+                self._errors[span.name] += 1
+            if self._file is not None:
+                self._file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                self._file.flush()
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes):
+        """记录 with 块的耗时；块内抛出的异常记为 error 属性后继续抛出"""
+        if not self.enabled:
+            yield Span(name, None, attributes)
+            return
+        span = self.start(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set("error", type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    def record(self, name: str, duration: float, parent: Optional[Span] = None, **attributes) -> Span:
+        """记录一个在别处计时的阶段（例如流式响应的首个 token 延迟）"""
+        span = self.start(name, parent, **attributes)
+        self.finish(span, duration)
+        return span
+
+    def stage_summary(self) -> Dict[str, Dict]:
+        """每个阶段的调用次数、错误次数、平均耗时和最近 window 次的分位数（秒）"""
+        with self._lock:
+            snapshot = {
+                name: (sorted(durations), self._counts[name], self._sums[name], self._errors[name])
+                for name, durations in self._durations.items()
+            }
+        summary = {}
+        for name, (durations, count, total, errors) in sorted(snapshot.items()):
+            summary[name] = {
+                "count": count,
+                "errors": errors,
+                "mean": total / count,
+                **{f"p{round(q * 100)}": _quantile(durations, q) for q in QUANTILES},
+            }
+        return summary
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式的阶段耗时（summary 类型）"""
+        lines = [
+            "# HELP diet_stage_duration_seconds Duration of request processing stages.",
+            "# TYPE diet_stage_duration_seconds summary",
+        ]
+        errors = []
+        for name, stats in self.stage_summary().items():
+            for q in QUANTILES:
+                value = stats[f"p{round(q * 100)}"]
+                lines.append(f'diet_stage_duration_seconds{{stage="{name}",quantile="{q}"}} {value}')
+            lines.append(f'diet_stage_duration_seconds_sum{{stage="{name}"}} {stats["mean"] * stats["count"]}')
+            lines.append(f'diet_stage_duration_seconds_count{{stage="{name}"}} {stats["count"]}')
+            errors.append(f'diet_stage_errors_total{{stage="{name}"}} {stats["errors"]}')
+        lines += [
+            "# HELP diet_stage_errors_total Stages that raised an exception.",
+            "# TYPE diet_stage_errors_total counter",
+            *errors,
+        ]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """清空已记录的耗时统计（例如基准测试的各轮之间）"""
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._sums.clear()
+            self._errors.clear()
+
+    def disable(self):
+        """
+        不再记录 span（span 仍可使用，只是不计时、不导出）。用于 fork 出的评分子进程：
+        不取父进程复制来的锁，也不向继承来的 TRACE_FILE 句柄写入。
+        """
+        self.enabled = False
+        self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# 进程内共用的追踪器
+tracer = Tracer.from_env()
+span = tracer.span
+
+
+# logging.LogRecord 自带的属性，其余属性（通过 extra 传入）作为结构化字段输出
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON：时间、级别、模块、消息、当前 trace_id 和 extra 传入的字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        current = _current_span.get()
+        if current is not None:
+            entry["trace_id"] = current.trace_id
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = None):
+    """根日志输出到标准错误，格式为 JSON 行；级别取 level 或 LOG_LEVEL（默认 INFO）"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
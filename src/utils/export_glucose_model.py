@@ -0,0 +1,105 @@
+"""
+将训练好的 Keras 血糖模型和两个 StandardScaler 导出为纯 NumPy 推理使用的 .npz 权重文件。
+
+在 src 目录下运行：
+    python -m utils.export_glucose_model [--model-dir ../models]
+
+导出后会用随机输入对比 Keras 与 NumPy 两种实现的输出，超出容差时报错。
+只有导出时需要 TensorFlow，服务进程只读取 .npz 文件。
+"""
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+from predict_glucose import DEFAULT_MODEL_DIR, GlucosePredictor
+
+# 与 Keras (float32) 推理结果比较时允许的绝对误差（mmol/L）
+PARITY_ATOL = 1e-3
+
+
+def _scaler_arrays(scaler):
+    """取出 StandardScaler 的均值和缩放系数，with_mean/with_std 关闭时用 0/1 代替"""
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+    return np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+def export_weights(model, scaler_X, scaler_y, output_path):
+    """
+    将 Dense 网络的权重和 scaler 参数写入 output_path。
+
+    参数:
+    model: 已训练的 Keras Sequential 模型（仅包含 Dense 层）
+    scaler_X / scaler_y: 已拟合好的输入/输出标准化器
+    output_path: 输出的 .npz 文件路径
+    """
+    arrays = {}
+    activations = []
+    dense_layers = [layer for layer in model.layers if layer.get_weights()]
+    for i, layer in enumerate(dense_layers):
+        kernel, bias = layer.get_weights()
+        activation = layer.get_config()["activation"]
+        if activation not in ("relu", "linear"):
+            raise ValueError(f"不支持的激活函数: {layer.name} 使用了 {activation}")
+        arrays[f"W{i}"] = kernel
+        arrays[f"b{i}"] = bias
+        activations.append(activation)
+
+    arrays["x_mean"], arrays["x_scale"] = _scaler_arrays(scaler_X)
+    arrays["y_mean"], arrays["y_scale"] = _scaler_arrays(scaler_y)
+
+    np.savez_compressed(
+        output_path,
+        n_layers=np.array(len(dense_layers)),
+        activations=np.array(activations),
+        **arrays,
+    )
+
+
+def check_parity(model, scaler_X, scaler_y, predictor, n_samples=1000, seed=0):
+    """
+    在典型输入范围内随机采样，比较 Keras 与 NumPy 实现的预测结果。
+
+    返回:
+    两者之间的最大绝对误差
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.column_stack([
+        rng.uniform(0, 200, n_samples),   # 碳水 (g)
+        rng.uniform(0, 80, n_samples),    # 脂肪 (g)
+        rng.uniform(0, 30, n_samples),    # 膳食纤维 (g)
+        rng.uniform(3, 15, n_samples),    # 餐前血糖 (mmol/L)
+    ])
+
+    expected = scaler_y.inverse_transform(model.predict(scaler_X.transform(rows), verbose=0))
+    actual = predictor.predict_batch(rows)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出血糖模型为 NumPy 权重文件")
+    parser.add_argument("--model-dir", default=os.getenv("GLUCOSE_MODEL_DIR", DEFAULT_MODEL_DIR))
+    parser.add_argument("--output", default=None, help="默认为 <model-dir>/glucose_model_P1.npz")
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(os.path.join(args.model_dir, "glucose_model_P1.h5"))
+    scaler_X = joblib.load(os.path.join(args.model_dir, "scaler_X.pkl"))
+    scaler_y = joblib.load(os.path.join(args.model_dir, "scaler_y.pkl"))
+
+    output_path = args.output or os.path.join(args.model_dir, "glucose_model_P1.npz")
+    export_weights(model, scaler_X, scaler_y, output_path)
+    print(f"权重已导出到: {output_path}")
+
+    max_error = check_parity(model, scaler_X, scaler_y, GlucosePredictor(output_path))
+    print(f"Keras 与 NumPy 预测的最大绝对误差: {max_error:.2e} mmol/L")
+    if max_error > PARITY_ATOL:
+        raise SystemExit(f"误差超过容差 {PARITY_ATOL}")
+
+
+if __name__ == "__main__":
+    main()
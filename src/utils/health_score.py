@@ -1,4 +1,29 @@
 from math import log10
+
+import numpy as np
+
+# 一组食谱总营养数组的列顺序，与 calculate_group_nutrition 返回的字典键顺序相同
+NUTRITION_FIELDS = ("energy", "carb", "protein", "fat", "fiber")
+
+# 预测血糖对应的时间点（分钟）
+GLUCOSE_TIMEPOINTS = ("60", "120", "180")
+
+# II 型糖尿病餐后血糖范围
+GLUCOSE_RANGES = {
+    "60": {"normal": (6.7, 8.3), "good": (8.3, 9.9), "fair": (10.0, 12.7), "poor": (12.7, 16.1), "very_poor": (16.6, float("inf"))},
+    "120": {"normal": (5.0, 7.2), "good": (7.2, 8.8), "fair": (8.9, 11.0), "poor": (11.1, 15.3), "very_poor": (15.5, float("inf"))},
+    "180": {"normal": (4.4, 6.7), "good": (6.7, 8.2), "fair": (8.3, 9.9), "poor": (8.3, 14.4), "very_poor": (14.4, float("inf"))},
+}
+
+# 评分规则
+SCORE_RULES = {
+    "normal": 10,
+    "good": 8,
+    "fair": 6,
+    "poor": 4,
+    "very_poor": 0,
+}
+
 def calculate_health_score(recipe_nutrition, predicted_glucose, nutrient_needs):
     """
     计算食谱的健康评分。
@@ -31,35 +56,27 @@ def calculate_glucose_score(predicted_glucose):
     返回：
     - glucose_score: 血糖评分，范围 0-10。
     """
-    # II 型糖尿病餐后血糖范围
-    glucose_ranges = {
-        "60": {"normal": (6.7, 8.3), "good": (8.3, 9.9), "fair": (10.0, 12.7), "poor": (12.7, 16.1), "very_poor": (16.6, float("inf"))},
-        "120": {"normal": (5.0, 7.2), "good": (7.2, 8.8), "fair": (8.9, 11.0), "poor": (11.1, 15.3), "very_poor": (15.5, float("inf"))},
-        "180": {"normal": (4.4, 6.7), "good": (6.7, 8.2), "fair": (8.3, 9.9), "poor": (8.3, 14.4), "very_poor": (14.4, float("inf"))},
-    }
-    
-    # 评分规则
-    score_rules = {
-        "normal": 10,
-        "good": 8,
-        "fair": 6,
-        "poor": 4,
-        "very_poor": 0,
-    }
-    
     # 计算每个时间点的评分
     scores = []
-    for i, time in enumerate(["60", "120", "180"]):
-        glucose = predicted_glucose[i]
-        for range_name, (lower, upper) in glucose_ranges[time].items():
-            if lower <= glucose <= upper:
-                scores.append(score_rules[range_name])
-                break
+    for i, time in enumerate(GLUCOSE_TIMEPOINTS):
+        score = _match_glucose_range(predicted_glucose[i], time)
+        if score is not None:
+            scores.append(score)
     
     # 取三个时间点评分的平均值
     glucose_score = sum(scores) / len(scores)
     return glucose_score
 
+def _match_glucose_range(glucose, time):
+    """
+    按 GLUCOSE_RANGES 中的顺序返回第一个包含 glucose 的区间（闭区间）对应的评分，
+    落在所有区间之外（例如区间之间的空隙）时返回 None。
+    """
+    for range_name, (lower, upper) in GLUCOSE_RANGES[time].items():
+        if lower <= glucose <= upper:
+            return SCORE_RULES[range_name]
+    return None
+
 def calculate_nutrient_score(recipe_nutrition, nutrient_needs):
     """
     根据食谱营养成分和用户营养需求计算 nutrient_score。
@@ -84,3 +101,104 @@ def calculate_nutrient_score(recipe_nutrition, nutrient_needs):
             nutrient_score += score_each
     
     return nutrient_score
+
+
+def _build_glucose_bands(time):
+    """
+    将某个时间点的区间表展开为 np.searchsorted 可用的分段常数函数。
+
+    edges 是所有有限端点（升序去重），把数轴划分为 2 * len(edges) + 1 段：
+    (-inf, e0), {e0}, (e0, e1), {e1}, ..., {e_last}, (e_last, inf)。
+    每段的评分直接用 _match_glucose_range 在该段的代表点上求得，
+    因此区间重叠（先出现的区间优先）和空隙（无评分，记为 NaN）的处理与逐个计算完全相同。
+    """
+    edges = np.array(sorted({
+        bound
+        for bounds in GLUCOSE_RANGES[time].values()
+        for bound in bounds
+        if np.isfinite(bound)
+    }))
+
+    representatives = [edges[0] - 1.0]
+    for i, edge in enumerate(edges):
+        representatives.append(edge)
+        upper = edges[i + 1] if i + 1 < len(edges) else edge + 2.0
+        representatives.append((edge + upper) / 2)
+
+    values = np.array([
+        np.nan if score is None else float(score)
+        for score in (_match_glucose_range(point, time) for point in representatives)
+    ])
+    return edges, values
+
+
+_GLUCOSE_BANDS = {time: _build_glucose_bands(time) for time in GLUCOSE_TIMEPOINTS}
+
+
+def calculate_glucose_score_batch(predicted_glucose):
+    """
+    calculate_glucose_score 的向量化版本。
+
+    参数：
+    - predicted_glucose: 形状为 (N, 3) 的数组，每行为 60、120、180 分钟的预测血糖。
+
+    返回：
+    - 形状为 (N,) 的血糖评分。与逐个计算一样，只对落在某个区间内的时间点取平均；
+      三个时间点都没有落在任何区间时，逐个计算会抛出 ZeroDivisionError，这里返回 NaN。
+    """
+    glucose = np.asarray(predicted_glucose, dtype=float).reshape(-1, len(GLUCOSE_TIMEPOINTS))
+    scores = np.empty(glucose.shape)
+
+    for col, time in enumerate(GLUCOSE_TIMEPOINTS):
+        edges, values = _GLUCOSE_BANDS[time]
+        column = glucose[:, col]
+        position = np.searchsorted(edges, column, side="left")
+        on_edge = edges[np.minimum(position, len(edges) - 1)] == column
+        scores[:, col] = values[2 * position + on_edge]
+        # NaN 与任何区间比较都不成立
+        scores[np.isnan(column), col] = np.nan
+
+    matched = ~np.isnan(scores)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(matched, scores, 0.0).sum(axis=1) / matched.sum(axis=1)
+
+
+def calculate_nutrient_score_batch(recipe_nutrition, nutrient_needs):
+    """
+    calculate_nutrient_score 的向量化版本。
+
+    参数：
+    - recipe_nutrition: 形状为 (N, 5) 的数组，列顺序见 NUTRITION_FIELDS。
+    - nutrient_needs: 用户每餐的营养需求，包含碳水、蛋白质、脂肪。
+
+    返回：
+    - 形状为 (N,) 的营养评分。
+    """
+    nutrition = np.asarray(recipe_nutrition, dtype=float).reshape(-1, len(NUTRITION_FIELDS))
+    nutrient_score = np.zeros(len(nutrition))
+    # 按与字典相同的顺序累加，保证浮点结果一致
+    for col, nutrient in enumerate(NUTRITION_FIELDS):
+        if nutrient in nutrient_needs:
+            ratio = nutrition[:, col] / nutrient_needs[nutrient]
+            score_each = 2.5 * (1 - np.abs(ratio - 1))
+            nutrient_score += np.where(score_each > 0, score_each, 0.0)
+    return nutrient_score
+
+
+def calculate_health_score_batch(recipe_nutrition, predicted_glucose, nutrient_needs):
+    """
+    calculate_health_score 的向量化版本，一次为 N 个候选组合评分。
+
+    参数：
+    - recipe_nutrition: 形状为 (N, 5) 的数组，列顺序见 NUTRITION_FIELDS。
+    - predicted_glucose: 形状为 (N, 3) 的预测餐后血糖。
+    - nutrient_needs: 用户每餐的营养需求。
+
+    返回：
+    - 形状为 (N,) 的健康评分。血糖评分和营养评分与逐个计算逐位相同；
+      逐个计算会抛出异常的行（无血糖评分或营养评分为 0）返回 NaN 或 -inf。
+    """
+    glucose_score = calculate_glucose_score_batch(predicted_glucose)
+    nutrient_score = calculate_nutrient_score_batch(recipe_nutrition, nutrient_needs)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return glucose_score * np.log10(nutrient_score)
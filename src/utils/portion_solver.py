@@ -0,0 +1,214 @@
+import itertools
+
+import numpy as np
+
+# 每个食谱份量缩放比例的上下限
+RATIO_BOUNDS = (0.3, 3.0)
+
+# 参与拟合的营养素，依次对应 macros 最后一维的前三列
+TARGET_FIELDS = ("carb", "protein", "fat")
+
+# 每个比例在最优解处的状态：自由变量（落在上下限之间）、取下限、取上限
+_FREE, _AT_LOWER, _AT_UPPER = 0, 1, 2
+
+# 有效集：三个比例各取一种状态，共 3^3 = 27 种。有界最小二乘的最优解一定落在某个有效集上：
+# 取界的比例固定为界值，其余比例是把界值代入后无约束最小二乘（法方程）的解。逐个有效集求出
+# 自由变量，越界的有效集不可行，可行有效集中目标值最小者即为最优解。全部取界的 8 种总是可行。
+_PATTERNS = list(itertools.product((_FREE, _AT_LOWER, _AT_UPPER), repeat=len(TARGET_FIELDS)))
+_N_PATTERNS = len(_PATTERNS)
+
+# 判断自由变量是否越界时允许的数值误差
+_TOLERANCE = 1e-9
+
+# 自由变量的法方程行列式小于对角线乘积的此倍数时按奇异处理
+_SINGULAR = 1e-12
+
+# 越界或奇异（不可行）的有效集在目标值上加的惩罚，使其在按行取最小时不被选中。
+# 可行有效集的目标值不小于 -len(TARGET_FIELDS)，远小于此值；用有限值而不是 inf，
+# 惩罚可以直接乘以不可行掩码再相加（inf * 0 为 nan），比按掩码逐元素选择快数倍
+_INFEASIBLE = 1e300
+
+# 每次处理的组合数：每种有效集的中间数组放得进 CPU 缓存，逐元素运算不受内存带宽限制
+_CHUNK_ROWS = 8192
+
+# 每行的法方程 g r = b 展开为 9 个一维数组：对称矩阵 g 的上三角和 b
+_G_INDEX = {(0, 0): 0, (0, 1): 1, (0, 2): 2, (1, 1): 3, (1, 2): 4, (2, 2): 5}
+_B_INDEX = (6, 7, 8)
+
+
+def _g(coefficients, i, j):
+    return coefficients[_G_INDEX[(min(i, j), max(i, j))]]
+
+
+def _free_solution(coefficients, rhs, cache):
+    """
+    自由变量的法方程闭式解（1×1、2×2 或 3×3）。coefficients 为 9 个法方程系数数组，
+    rhs 为 {自由变量: 右侧}。返回 ({自由变量: 解}, 奇异的行)，奇异的行解为 0。
+    cache 保存同一组自由变量的逆，取界值不同的有效集共用。
+    """
+    free = tuple(sorted(rhs))
+    g = lambda i, j: _g(coefficients, i, j)  # noqa: E731
+    if free not in cache:
+        if len(free) == 1:
+            (i,) = free
+            singular = g(i, i) <= 0
+            cache[free] = singular, ~singular / (g(i, i) + singular)
+        elif len(free) == 2:
+            i, j = free
+            det = g(i, i) * g(j, j) - g(i, j) * g(i, j)
+            singular = det <= _SINGULAR * g(i, i) * g(j, j)
+            cache[free] = singular, ~singular / (det + singular)
+        else:
+            # 对称矩阵的伴随矩阵
+            adjugate = {
+                (0, 0): g(1, 1) * g(2, 2) - g(1, 2) * g(1, 2),
+                (0, 1): g(0, 2) * g(1, 2) - g(0, 1) * g(2, 2),
+                (0, 2): g(0, 1) * g(1, 2) - g(0, 2) * g(1, 1),
+                (1, 1): g(0, 0) * g(2, 2) - g(0, 2) * g(0, 2),
+                (1, 2): g(0, 1) * g(0, 2) - g(0, 0) * g(1, 2),
+                (2, 2): g(0, 0) * g(1, 1) - g(0, 1) * g(0, 1),
+            }
+            det = g(0, 0) * adjugate[(0, 0)] + g(0, 1) * adjugate[(0, 1)] + g(0, 2) * adjugate[(0, 2)]
+            singular = det <= _SINGULAR * g(0, 0) * g(1, 1) * g(2, 2)
+            inverse = ~singular / (det + singular)
+            cache[free] = singular, {key: value * inverse for key, value in adjugate.items()}
+    singular, inverse = cache[free]
+
+    if len(free) == 1:
+        (i,) = free
+        return {i: rhs[i] * inverse}, singular
+    if len(free) == 2:
+        i, j = free
+        return {
+            i: (g(j, j) * rhs[i] - g(i, j) * rhs[j]) * inverse,
+            j: (g(i, i) * rhs[j] - g(i, j) * rhs[i]) * inverse,
+        }, singular
+    return {
+        i: sum(inverse[(min(i, j), max(i, j))] * rhs[j] for j in range(3)) for i in range(3)
+    }, singular
+
+
+def _linear_terms(bounds):
+    """
+    每种有效集中只依赖取界值的量都是 9 个法方程系数的线性组合，返回 (权重矩阵, 行号)：
+    - 目标值 r·g·r - 2 b·r 的取界部分 v·g_vv·v - 2 b_v·v；
+    - 每个自由变量 i 的法方程右侧 b_i - Σ_j g_ij v_j（j 为取界变量）。
+    行号为 [(目标值行, {自由变量: 右侧行}), ...]，与 _PATTERNS 一一对应。
+    """
+    # 按状态取比例的值，自由变量不计入取界部分
+    values = {_FREE: 0.0, _AT_LOWER: bounds[0], _AT_UPPER: bounds[1]}
+    rows, index = [], []
+    for pattern in _PATTERNS:
+        fixed = [i for i in range(3) if pattern[i] != _FREE]
+        weights = np.zeros(9)
+        for i in fixed:
+            weights[_B_INDEX[i]] -= 2 * values[pattern[i]]
+            for j in fixed:
+                weights[_G_INDEX[(min(i, j), max(i, j))]] += values[pattern[i]] * values[pattern[j]]
+        objective_row = len(rows)
+        rows.append(weights)
+
+        rhs_rows = {}
+        for i in range(3):
+            if pattern[i] == _FREE:
+                weights = np.zeros(9)
+                weights[_B_INDEX[i]] = 1.0
+                for j in fixed:
+                    weights[_G_INDEX[(min(i, j), max(i, j))]] -= values[pattern[j]]
+                rhs_rows[i] = len(rows)
+                rows.append(weights)
+        index.append((objective_row, rhs_rows))
+    return np.array(rows), index
+
+
+def solve_portion_ratios(macros, nutrient_needs, bounds=RATIO_BOUNDS):
+    """
+    为 N 个三食谱组合批量求解份量比例的有界最小二乘问题：
+
+        min_r  Σ_n ((A r)_n / need_n - 1)^2,   lower <= r_i <= upper
+
+    A[n, i] 为第 i 个食谱（ratio=1）的营养素 n 含量，n 取碳水、蛋白质、脂肪；
+    与营养评分一样按相对需求的偏差计算，需求为 0 或缺失的营养素不参与拟合。
+
+    每个比例有"自由 / 取下限 / 取上限"三种状态，共 _N_PATTERNS = 27 种有效集（见 _PATTERNS）。
+    对每种有效集按法方程的闭式解求出自由变量，越界的有效集加 _INFEASIBLE 惩罚，在其余有效集中
+    取目标值最小者（同值时取先出现的有效集）。
+    问题是凸的，最优解所在的有效集一定被枚举到，结果为全局最优。自由变量的法方程奇异的有效集
+    直接跳过：包含最优解的维数最低的面上法方程一定非奇异，跳过不影响最优值；此时最优解不唯一
+    （例如某个营养素不参与拟合），返回其中之一。
+
+    计算全部是对每行法方程系数（一维数组）的逐元素运算，不做批量矩阵分解，按 _CHUNK_ROWS 行
+    分块进行（见 _solve_chunk）。
+
+    参数：
+    - macros: 形状为 (N, 3, 4) 的数组，依次为三个食谱的 carb/protein/fat/fiber。
+    - nutrient_needs: 每餐的营养需求。
+    - bounds: (下限, 上限)。
+
+    返回：
+    - 形状为 (N, 3) 的份量比例。
+    """
+    macros = np.asarray(macros, dtype=float).reshape(-1, 3, 4)
+    n_rows = len(macros)
+
+    needs = np.array([float(nutrient_needs.get(field) or 0) for field in TARGET_FIELDS])
+    # coef[i][n] = A[n, i] / need_n，目标为 1（不参与拟合的营养素不计入）
+    coef = [[macros[:, i, n] / needs[n] for n in range(3) if needs[n] > 0] for i in range(3)]
+    # 法方程 g r = b 的系数
+    coefficients = np.zeros((9, n_rows))
+    for (i, j), k in _G_INDEX.items():
+        for ci, cj in zip(coef[i], coef[j]):
+            coefficients[k] += ci * cj
+    for i, k in enumerate(_B_INDEX):
+        for ci in coef[i]:
+            coefficients[k] += ci
+
+    weights, index = _linear_terms(bounds)
+    ratios = np.empty((n_rows, 3))
+    for start in range(0, n_rows, _CHUNK_ROWS):
+        stop = min(start + _CHUNK_ROWS, n_rows)
+        ratios[start:stop] = _solve_chunk(coefficients[:, start:stop], weights, index, bounds)
+    return ratios
+
+
+def _solve_chunk(coefficients, weights, index, bounds):
+    """
+    一块组合的比例：各有效集中只依赖取界值的部分由一次矩阵乘法得到（见 _linear_terms），
+    按行取目标值最小的有效集后，只为选中的有效集计算比例。
+    """
+    n_rows = coefficients.shape[1]
+    lower, upper = bounds
+    middle, half_width = (lower + upper) / 2, (upper - lower) / 2 + _TOLERANCE
+    terms = weights @ coefficients
+
+    objectives = np.empty((_N_PATTERNS, n_rows))
+    cache = {}
+    for k, (objective_row, rhs_rows) in enumerate(index):
+        if not rhs_rows:
+            objectives[k] = terms[objective_row]
+            continue
+        rhs = {i: terms[row] for i, row in rhs_rows.items()}
+        x, infeasible = _free_solution(coefficients, rhs, cache)
+        objective = terms[objective_row]
+        for i in rhs:
+            # 自由变量满足法方程时，目标值为取界部分减去 x_free·rhs
+            objective = objective - x[i] * rhs[i]
+            infeasible = infeasible | (np.abs(x[i] - middle) > half_width)
+        objectives[k] = objective + infeasible * _INFEASIBLE
+    # 全部取界的有效集总是可行，每行都有有效的最小值；argmin 同值时取先出现的有效集
+    winner = np.argmin(objectives, axis=0)
+
+    # 只为每行选中的有效集重新求解
+    ratios = np.empty((n_rows, 3))
+    values = {_AT_LOWER: lower, _AT_UPPER: upper}
+    for k in np.unique(winner):
+        rows = np.flatnonzero(winner == k)
+        for i in range(3):
+            if _PATTERNS[k][i] != _FREE:
+                ratios[rows, i] = values[_PATTERNS[k][i]]
+        objective_row, rhs_rows = index[k]
+        if rhs_rows:
+            x, _ = _free_solution(coefficients[:, rows], {i: terms[row, rows] for i, row in rhs_rows.items()}, {})
+            for i, value in x.items():
+                ratios[rows, i] = value
+    return np.clip(ratios, lower, upper)
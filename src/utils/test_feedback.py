@@ -0,0 +1,78 @@
+import threading
+
+from feedback import FeedbackQueue
+from ranking import RecipeRanking
+
+
+class _Graph:
+    """只有内存排名的知识图谱：评分按平均计算，写库时返回 db_scores 中的评分"""
+
+    def __init__(self):
+        self.ranking = RecipeRanking()
+        self.ranking.add("staple", "米饭", 5.0)
+        self.ranking.add("staple", "面条", 4.0)
+        self.ranking.publish()
+        self.nutrition_index = {}
+        self.db_scores = {}
+
+    def apply_rating_locally(self, recipe_name, rating, notify=True):
+        new_score = (self.ranking.score(recipe_name) + rating) / 2
+        self.ranking.update(recipe_name, new_score, notify=notify)
+        return new_score
+
+    def update_prefs(self, batch):
+        return [(name, self.db_scores.get(name, self.ranking.score(name))) for name, _ in batch]
+
+
+def test_listeners_run_outside_lock_once_per_change():
+    kg = _Graph()
+    queue = FeedbackQueue(kg, flush_interval=60)
+    calls = []
+
+    def listener(name):
+        # 其他线程此时能获取队列的锁，说明回调没有在锁内调用（Condition 默认是可重入锁，须换线程检查）
+        acquired = []
+
+        def try_lock():
+            acquired.append(queue._cond.acquire(blocking=False))
+            if acquired[0]:
+                queue._cond.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        assert acquired == [True]
+        calls.append(name)
+
+    kg.ranking.subscribe(listener)
+    try:
+        assert queue.submit("米饭", 9.0) == 7.0
+        assert calls == ["米饭"]
+
+        # 数据库返回的评分与内存一致时不校正、不再通知
+        assert queue.flush() == 1
+        assert calls == ["米饭"]
+
+        # 不一致时以数据库为准，通知一次
+        kg.db_scores["面条"] = 5.5
+        queue.submit("面条", 8.0)
+        queue.close()
+        assert kg.ranking.score("面条") == 5.5
+        assert calls == ["米饭", "面条", "面条"]
+    finally:
+        queue.close()
+
+
+def test_update_skips_listeners_when_unchanged():
+    ranking = RecipeRanking()
+    ranking.add("staple", "米饭", 5.0)
+    ranking.publish()
+    calls = []
+    ranking.subscribe(calls.append)
+
+    version = ranking.version
+    assert ranking.update("米饭", 5.0)
+    assert calls == [] and ranking.version == version
+    assert ranking.update("米饭", 6.0)
+    assert calls == ["米饭"] and ranking.version == version + 1
+    assert not ranking.update("未知", 1.0)
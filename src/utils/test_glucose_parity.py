@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+import pytest
+
+# 对比需要原 Keras 模型和 scaler，未安装 TensorFlow / joblib 的环境跳过
+pytest.importorskip("tensorflow")
+joblib = pytest.importorskip("joblib")
+
+from predict_glucose import DEFAULT_MODEL_DIR, GlucosePredictor  # noqa: E402
+from utils.export_glucose_model import PARITY_ATOL, check_parity, export_weights  # noqa: E402
+
+MODEL_DIR = os.getenv("GLUCOSE_MODEL_DIR", DEFAULT_MODEL_DIR)
+MODEL_FILES = ("glucose_model_P1.h5", "scaler_X.pkl", "scaler_y.pkl")
+
+
+@pytest.mark.skipif(not all(os.path.exists(os.path.join(MODEL_DIR, name)) for name in MODEL_FILES),
+                    reason=f"{MODEL_DIR} 中缺少模型文件 {', '.join(MODEL_FILES)}")
+def test_glucose_parity():
+    """导出 NumPy 权重后，其预测结果应与原 Keras 模型在容差内一致"""
+    from tensorflow.keras.models import load_model
+
+    model = load_model(os.path.join(MODEL_DIR, "glucose_model_P1.h5"))
+    scaler_X = joblib.load(os.path.join(MODEL_DIR, "scaler_X.pkl"))
+    scaler_y = joblib.load(os.path.join(MODEL_DIR, "scaler_y.pkl"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        weights_path = os.path.join(tmp_dir, "glucose_model_P1.npz")
+        export_weights(model, scaler_X, scaler_y, weights_path)
+        max_error = check_parity(model, scaler_X, scaler_y, GlucosePredictor(weights_path))
+
+    print(f"最大绝对误差: {max_error:.2e} mmol/L")
+    assert max_error <= PARITY_ATOL
+
+
+if __name__ == "__main__":
+    test_glucose_parity()
+    print("NumPy 推理与 Keras 模型一致！")
@@ -0,0 +1,80 @@
+import numpy as np
+
+from utils.health_score import (
+    GLUCOSE_RANGES,
+    NUTRITION_FIELDS,
+    calculate_glucose_score,
+    calculate_glucose_score_batch,
+    calculate_health_score,
+    calculate_health_score_batch,
+    calculate_nutrient_score,
+    calculate_nutrient_score_batch,
+)
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+
+
+def _random_glucose(rng, n):
+    """随机血糖值，混入区间端点、端点两侧相邻的浮点数、空隙和 NaN，覆盖重叠和空隙的边界情况"""
+    edges = np.array(sorted({
+        bound for ranges in GLUCOSE_RANGES.values() for bounds in ranges.values() for bound in bounds
+    } - {float("inf")}))
+    special = np.concatenate([
+        edges, np.nextafter(edges, -np.inf), np.nextafter(edges, np.inf),
+        [9.95, 16.3, 11.05, 0.0, -1.0, np.inf, np.nan],
+    ])
+    values = rng.uniform(0, 25, (n, 3))
+    mask = rng.random((n, 3)) < 0.5
+    values[mask] = rng.choice(special, mask.sum())
+    return values
+
+
+def _scalar_or_nan(fn, *args):
+    """逐个计算版本抛出异常时记为 NaN，与批量版本的约定对照"""
+    try:
+        return fn(*args)
+    except (ValueError, ZeroDivisionError):
+        return np.nan
+
+
+def test_glucose_score_parity(n_cases=20000, seed=0):
+    """批量血糖评分应与逐个计算逐位一致"""
+    glucose = _random_glucose(np.random.default_rng(seed), n_cases)
+    expected = np.array([_scalar_or_nan(calculate_glucose_score, row) for row in glucose])
+    actual = calculate_glucose_score_batch(glucose)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_nutrient_score_parity(n_cases=20000, seed=1):
+    """批量营养评分应与逐个计算逐位一致"""
+    rng = np.random.default_rng(seed)
+    nutrition = rng.uniform(0, 200, (n_cases, len(NUTRITION_FIELDS)))
+    expected = np.array([
+        calculate_nutrient_score(dict(zip(NUTRITION_FIELDS, row)), NUTRIENT_NEEDS) for row in nutrition
+    ])
+    actual = calculate_nutrient_score_batch(nutrition, NUTRIENT_NEEDS)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_health_score_parity(n_cases=20000, seed=2):
+    """批量健康评分应与逐个计算一致；逐个计算抛出异常的行，批量版本不是有限值"""
+    rng = np.random.default_rng(seed)
+    glucose = _random_glucose(rng, n_cases)
+    nutrition = rng.uniform(0, 200, (n_cases, len(NUTRITION_FIELDS)))
+    expected = np.array([
+        _scalar_or_nan(calculate_health_score, dict(zip(NUTRITION_FIELDS, n)), g, NUTRIENT_NEEDS)
+        for n, g in zip(nutrition, glucose)
+    ])
+    actual = calculate_health_score_batch(nutrition, glucose, NUTRIENT_NEEDS)
+
+    failed = np.isnan(expected)
+    assert not np.isfinite(actual[failed]).any()
+    # np.log10 与 math.log10 最多相差 1 ulp
+    np.testing.assert_allclose(actual[~failed], expected[~failed], rtol=1e-14, atol=0)
+
+
+if __name__ == "__main__":
+    test_glucose_score_parity()
+    test_nutrient_score_parity()
+    test_health_score_parity()
+    print("批量健康评分与逐个计算一致！")
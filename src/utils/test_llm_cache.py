@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+
+from llm_cache import InstructionCache, MemoryBackend, SQLiteBackend, content_key, split_fragments
+
+ANSWER = """以下是为您准备的午餐烹饪说明：
+
+### 1. 米饭
+1. 大米 75g 淘洗干净……
+
+### 2. 清炒西兰花
+1. 西兰花 150g 切小朵……
+
+**3. 红烧鸡腿**
+1. 鸡腿 120g 焯水……
+"""
+
+
+def test_split_fragments():
+    parts = split_fragments(ANSWER, ["米饭", "清炒西兰花", "红烧鸡腿"])
+    assert [part.splitlines()[0] for part in parts] == ["### 1. 米饭", "### 2. 清炒西兰花", "**3. 红烧鸡腿**"]
+    # 标题顺序不符或缺少某个食谱时不切分
+    assert split_fragments(ANSWER, ["清炒西兰花", "米饭", "红烧鸡腿"]) is None
+    assert split_fragments(ANSWER, ["米饭", "番茄炒蛋", "红烧鸡腿"]) is None
+    assert split_fragments("  只有一个食谱  ", ["米饭"]) == ["只有一个食谱"]
+
+
+def _check_lru_and_ttl(backend):
+    cache = InstructionCache(backend, ttl=60)
+    keys = [content_key("deepseek-chat", i) for i in range(3)]
+    cache.put(keys[0], "a")
+    cache.put(keys[1], "b")
+    assert cache.get(keys[0]) == "a"  # keys[0] 变为最近访问
+    cache.put(keys[2], "c")            # 容量为 2，淘汰 keys[1]
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) == "c"
+
+    backend.put(keys[0], "a", time.time() - 120)
+    assert cache.get(keys[0]) is None
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["evictions"], metrics["expirations"]) == (2, 2, 1, 1)
+
+
+def test_memory_lru_and_ttl():
+    _check_lru_and_ttl(MemoryBackend(max_entries=2))
+
+
+def test_sqlite_persistence():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+        _check_lru_and_ttl(SQLiteBackend(path, max_entries=2))
+        backend = SQLiteBackend(path, max_entries=2)
+        InstructionCache(backend).put("key", "说明")
+        backend.close()
+        assert InstructionCache(SQLiteBackend(path, max_entries=2)).get("key") == "说明"
+
+
+if __name__ == "__main__":
+    test_split_fragments()
+    test_memory_lru_and_ttl()
+    test_sqlite_persistence()
+    print("烹饪说明缓存测试通过！")
@@ -0,0 +1,43 @@
+import numpy as np
+
+from KG import score_macros
+from parallel_scoring import ParallelScorer
+from predict_glucose import GlucosePredictor
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+PRE_MEAL_GLUCOSE = 6.0
+
+
+def _predictor(path, rng, hidden=16):
+    sizes = [4, hidden, 3]
+    weights = {"n_layers": len(sizes) - 1, "activations": np.array(["relu", "linear"])}
+    for i in range(len(sizes) - 1):
+        weights[f"W{i}"] = rng.normal(0, 0.3, (sizes[i], sizes[i + 1]))
+        weights[f"b{i}"] = rng.normal(0, 0.1, sizes[i + 1])
+    weights.update(x_mean=np.array([60.0, 15.0, 5.0, 7.0]), x_scale=np.array([30.0, 8.0, 3.0, 2.0]),
+                   y_mean=np.array([9.0, 8.0, 7.0]), y_scale=np.array([2.0, 2.0, 1.5]))
+    np.savez(path, **weights)
+    return GlucosePredictor(str(path))
+
+
+def test_parallel_matches_in_process(tmp_path, pool_size=12, top_n=20):
+    """并行评分的前 top_n 个组合应与当前进程评分按相同种子排序的结果一致，包括同分的组合"""
+    rng = np.random.default_rng(0)
+    predictor = _predictor(tmp_path / "weights.npz", rng)
+    # 每类只有 3 种不同的营养向量，制造大量同分组合
+    pool_macros = [rng.uniform(0, [80, 30, 20, 10], (3, 4))[rng.integers(0, 3, pool_size)] for _ in range(3)]
+
+    grids = np.meshgrid(*(np.arange(pool_size) for _ in range(3)), indexing="ij")
+    candidates = np.stack([grid.ravel() for grid in grids], axis=1)
+    macros = np.stack([pool_macros[c][candidates[:, c]] for c in range(3)], axis=1)
+    health_scores = score_macros(macros, predictor, PRE_MEAL_GLUCOSE, NUTRIENT_NEEDS)[3]
+
+    scorer = ParallelScorer(predictor, workers=2, chunk_size=100)
+    try:
+        for seed in (0, 1, 2):
+            tiebreak = np.random.default_rng(seed).random(len(candidates))
+            expected = candidates[np.lexsort((tiebreak, -health_scores))[:top_n]]
+            actual = scorer.top_candidates(pool_macros, NUTRIENT_NEEDS, PRE_MEAL_GLUCOSE, top_n, seed=seed)
+            np.testing.assert_array_equal(actual, expected)
+    finally:
+        scorer.close()
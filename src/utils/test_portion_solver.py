@@ -0,0 +1,60 @@
+import itertools
+
+import numpy as np
+
+from utils.portion_solver import RATIO_BOUNDS, TARGET_FIELDS, solve_portion_ratios
+
+NUTRIENT_NEEDS = {"carb": 90, "protein": 36, "fat": 24}
+
+
+def _objective(macros, ratios, nutrient_needs):
+    needs = np.array([nutrient_needs.get(field, 0) for field in TARGET_FIELDS], dtype=float)
+    active = needs > 0
+    totals = np.einsum("kin,ki->kn", macros[:, :, :3], ratios)
+    return np.sum((totals[:, active] / needs[active] - 1) ** 2, axis=1)
+
+
+def test_within_bounds_and_not_worse_than_grid(n_cases=500, seed=0, steps=28):
+    """求得的比例不越界，且目标值不高于网格穷举的最优值"""
+    rng = np.random.default_rng(seed)
+    macros = rng.uniform(0, 60, (n_cases, 3, 4))
+    macros[rng.random((n_cases, 3, 4)) < 0.1] = 0.0
+    lower, upper = RATIO_BOUNDS
+    ratios = solve_portion_ratios(macros, NUTRIENT_NEEDS)
+    assert ratios.shape == (n_cases, 3)
+    assert np.all((ratios >= lower) & (ratios <= upper))
+
+    grid = np.array(list(itertools.product(np.linspace(lower, upper, steps), repeat=3)))
+    solved = _objective(macros, ratios, NUTRIENT_NEEDS)
+    for k in range(n_cases):
+        brute = _objective(np.broadcast_to(macros[k], (len(grid), 3, 4)), grid, NUTRIENT_NEEDS).min()
+        assert solved[k] <= brute + 1e-9, (k, solved[k], brute)
+
+
+def test_degenerate_not_worse_than_grid(n_cases=300, seed=1, steps=28):
+    """整个食谱营养为 0、某个营养素不参与拟合（最优解不唯一）时，目标值仍不高于网格穷举的最优值"""
+    rng = np.random.default_rng(seed)
+    macros = rng.uniform(0, 60, (n_cases, 3, 4))
+    macros[rng.random((n_cases, 3)) < 0.2] = 0.0
+    grid = np.array(list(itertools.product(np.linspace(*RATIO_BOUNDS, steps), repeat=3)))
+    for needs in (NUTRIENT_NEEDS, {"carb": 90, "fat": 24}):
+        solved = _objective(macros, solve_portion_ratios(macros, needs), needs)
+        for k in range(n_cases):
+            brute = _objective(np.broadcast_to(macros[k], (len(grid), 3, 4)), grid, needs).min()
+            assert solved[k] <= brute + 1e-9, (needs, k, solved[k], brute)
+
+
+def test_exact_fit():
+    """需求可以被精确满足时，目标值为 0"""
+    macros = np.array([[[30, 2, 1, 1], [5, 3, 1, 2], [0, 10, 5, 0]]], dtype=float)
+    target = np.array([1.5, 1.0, 2.0])
+    needs = dict(zip(TARGET_FIELDS, np.einsum("in,i->n", macros[0, :, :3], target)))
+    ratios = solve_portion_ratios(macros, needs)
+    np.testing.assert_allclose(ratios[0], target, atol=1e-9)
+
+
+if __name__ == "__main__":
+    test_within_bounds_and_not_worse_than_grid()
+    test_degenerate_not_worse_than_grid()
+    test_exact_fit()
+    print("份量比例求解器测试通过！")
@@ -0,0 +1,41 @@
+import numpy as np
+
+from recommendation_cache import RecommendationCache
+
+USER_DATA = {"pre_meal_glucose": 6.1, "nutrient_needs": {"lunch": {"carb": 91, "protein": 36, "fat": 24}}}
+
+
+class _Graph:
+    """记录 recommend_recipes 收到的种子，按种子在同分组合中选一个"""
+
+    def __init__(self):
+        self.seeds = []
+
+    def candidate_pools(self):
+        return ["米饭", "面条"], ["青菜"], ["鸡蛋"]
+
+    def recommend_recipes(self, user_data, meal_type, search, seed=None):
+        self.seeds.append(seed)
+        staple = ["米饭", "面条"][np.random.default_rng(seed).integers(2)]
+        return [staple, "青菜", "鸡蛋"], [1.0, 1.0, 1.0], {}
+
+    def _score_candidates(self, candidates, pools, user_data, nutrient_needs):
+        return np.ones((1, 3)), np.zeros((1, 5)), np.zeros((1, 3)), np.zeros(1)
+
+    def _scores_dict(self, health_score, nutrition, predicted_glucose):
+        return {}
+
+
+def test_tiebreak_seed_follows_bucket():
+    """同一分桶重新计算时使用相同的种子（结果不随失效而变化），种子与进程无关"""
+    cache, kg = RecommendationCache(), _Graph()
+    first = cache.recommend(kg, USER_DATA, "lunch")
+    cache.clear()
+    # 同一分桶内的另一位用户
+    nearby = {"pre_meal_glucose": 5.9, "nutrient_needs": {"lunch": {"carb": 89, "protein": 35, "fat": 23}}}
+    assert cache.recommend(kg, nearby, "lunch")[0] == first[0]
+
+    assert len(kg.seeds) == 2 and kg.seeds[0] == kg.seeds[1] is not None
+    key, _ = cache.quantize(USER_DATA, "lunch")
+    assert kg.seeds[0] == RecommendationCache.seed_for(key)
+    assert RecommendationCache.seed_for(key) != RecommendationCache.seed_for(("dinner",) + key[1:])